@@ -0,0 +1,40 @@
+# conversion of geom Areas to and from plain python data
+# so they can be pickled, hashed, stored on disk or sent to another process
+
+import geom
+
+def CurveToData(curve):
+    # a curve becomes a list of vertices, each vertex is ( type, px, py, cx, cy )
+    vertices = []
+    for v in curve.GetVertices():
+        vertices.append((v.type, v.p.x, v.p.y, v.c.x, v.c.y))
+    return vertices
+
+def CurveFromData(data, dx = 0.0, dy = 0.0):
+    curve = geom.Curve()
+    for type, px, py, cx, cy in data:
+        curve.Append(geom.Vertex(type, geom.Point(px + dx, py + dy), geom.Point(cx + dx, cy + dy)))
+    return curve
+
+def AreaToData(area):
+    return [CurveToData(curve) for curve in area.GetCurves()]
+
+def AreaFromData(data, dx = 0.0, dy = 0.0):
+    # dx, dy translate the area, adding 0.0 leaves the coordinates exactly as they were
+    area = geom.Area()
+    for curve_data in data:
+        area.Append(CurveFromData(curve_data, dx, dy))
+    return area
+
+def DataSize(data):
+    # approximate number of bytes used by the area data
+    size = 0
+    for curve_data in data:
+        size += 64 + len(curve_data) * 120
+    return size
+
+def NumVertices(area):
+    count = 0
+    for curve in area.GetCurves():
+        count += len(curve.GetVertices())
+    return count
@@ -0,0 +1,24 @@
+# cooperative cancelling of a long job
+# the job checks the token where it can stop cleanly, such as between stages, and Check raises Cancelled
+# once Cancel has been called, which can be from another thread
+#
+# cancel = Cancel.CancelToken()
+# for cutter in cutters:
+#     cancel.Check()
+#     ...
+
+class Cancelled(Exception):
+    pass
+
+class CancelToken:
+    def __init__(self):
+        self.cancelled = False
+
+    def Cancel(self):
+        self.cancelled = True
+
+    def Check(self):
+        if self.cancelled:
+            raise Cancelled('cancelled')
+
+null_token = CancelToken() # for jobs which can't be cancelled
@@ -0,0 +1,290 @@
+# ordering of drill points to reduce the rapid travel between them
+# a nearest neighbour path is improved with 2-opt and Or-opt moves until no more improvement is found or the time runs out
+# the time covers making the nearest neighbour path too; if it runs out there, the rest of the points are left in their order
+# it doesn't cover the steps which go through the points once, putting them in the grid and measuring the path lengths,
+# which take about half a second for 200000 points
+# nothing is stored between calls, so it can be used from several threads or AutoPrograms at once
+# points can be anything with x and y, such as geom.Point
+
+import math
+import time
+
+NUM_NEIGHBOURS = 8 # number of near points tried for each point by the improvement moves
+
+class Grid:
+    # buckets of point indices, for finding near points quickly
+    def __init__(self, xs, ys, indices):
+        x0 = min(xs)
+        y0 = min(ys)
+        width = max(xs) - x0
+        height = max(ys) - y0
+        # about one point per cell, but not smaller than a row of the points would need, for points nearly in a line
+        self.cell = max(math.sqrt(width * height / len(indices)), max(width, height) / len(indices), 1e-6)
+        self.x0 = x0
+        self.y0 = y0
+        self.max_ring = int(max(width, height) / self.cell) + 2
+        self.xs = xs
+        self.ys = ys
+        self.cells = {}
+        for i in indices:
+            key = self.GetKey(xs[i], ys[i])
+            if key in self.cells:
+                self.cells[key].append(i)
+            else:
+                self.cells[key] = [i]
+
+    def GetKey(self, x, y):
+        return (int((x - self.x0) / self.cell), int((y - self.y0) / self.cell))
+
+    def Remove(self, i):
+        key = self.GetKey(self.xs[i], self.ys[i])
+        cell = self.cells[key]
+        cell.remove(i)
+        if len(cell) == 0:
+            del self.cells[key]
+
+    def GetRing(self, key, ring):
+        # yields the lists of indices in the cells at the given ring around key
+        kx, ky = key
+        if ring == 0:
+            if key in self.cells:
+                yield self.cells[key]
+            return
+        for dx in range(-ring, ring + 1):
+            for dy in (-ring, ring):
+                k = (kx + dx, ky + dy)
+                if k in self.cells:
+                    yield self.cells[k]
+        for dy in range(-ring + 1, ring):
+            for dx in (-ring, ring):
+                k = (kx + dx, ky + dy)
+                if k in self.cells:
+                    yield self.cells[k]
+
+    def Nearest(self, x, y, count = 1, exclude = None, deadline = None):
+        # returns up to count indices, nearest first
+        # if the deadline passes, the ones found so far are returned, which might not be the nearest, or might be none
+        key = self.GetKey(x, y)
+        found = []
+        for ring in range(0, self.max_ring + 1):
+            if deadline != None and ring > 0 and time.time() > deadline:
+                break
+            for cell in self.GetRing(key, ring):
+                for i in cell:
+                    if i != exclude:
+                        found.append((math.hypot(self.xs[i] - x, self.ys[i] - y), i))
+            if len(found) >= count:
+                # anything in further rings is at least this far away
+                found.sort()
+                if found[count - 1][0] <= ring * self.cell:
+                    break
+        found.sort()
+        return [i for d, i in found[:count]]
+
+def PathLength(xs, ys, order, start = None):
+    length = 0.0
+    if start != None and len(order) > 0:
+        length += math.hypot(xs[order[0]] - start[0], ys[order[0]] - start[1])
+    for k in range(1, len(order)):
+        length += math.hypot(xs[order[k]] - xs[order[k - 1]], ys[order[k]] - ys[order[k - 1]])
+    return length
+
+def RapidDistance(pts, start = None):
+    return PathLength([p.x for p in pts], [p.y for p in pts], list(range(0, len(pts))), start)
+
+def NearestNeighbourOrder(xs, ys, first, deadline = None):
+    grid = Grid(xs, ys, range(0, len(xs)))
+    grid.Remove(first)
+    order = [first]
+    current = first
+    for k in range(1, len(xs)):
+        nearest = [] if deadline != None and time.time() > deadline else grid.Nearest(xs[current], ys[current], deadline = deadline)
+        if len(nearest) == 0:
+            # out of time
+            visited = set(order)
+            order.extend([i for i in range(0, len(xs)) if not i in visited])
+            break
+        current = nearest[0]
+        grid.Remove(current)
+        order.append(current)
+    return order
+
+class PathImprover:
+    def __init__(self, xs, ys, order, start, deadline):
+        self.xs = xs
+        self.ys = ys
+        self.order = order
+        self.start = start # if there is a start point, the first point in the order can change, otherwise the path can be reversed
+        self.deadline = deadline
+        grid = Grid(xs, ys, range(0, len(xs)))
+        self.neighbours = []
+        for i in range(0, len(xs)):
+            neighbours = grid.Nearest(xs[i], ys[i], NUM_NEIGHBOURS + 1, exclude = i, deadline = deadline)
+            if time.time() > deadline:
+                self.neighbours = None # no time left for improving
+                break
+            self.neighbours.append(neighbours)
+        self.UpdatePositions()
+
+    def UpdatePositions(self):
+        self.pos = [0] * len(self.order)
+        for k in range(0, len(self.order)):
+            self.pos[self.order[k]] = k
+
+    def Dist(self, i, j):
+        return math.hypot(self.xs[i] - self.xs[j], self.ys[i] - self.ys[j])
+
+    def EdgeLength(self, k):
+        # length of the path edge arriving at position k
+        if k == 0:
+            if self.start == None:
+                return 0.0
+            i = self.order[0]
+            return math.hypot(self.xs[i] - self.start[0], self.ys[i] - self.start[1])
+        return self.Dist(self.order[k - 1], self.order[k])
+
+    def DistFromPrev(self, k, i):
+        # distance to point i from the point before position k
+        if k == 0:
+            if self.start == None:
+                return 0.0
+            return math.hypot(self.xs[i] - self.start[0], self.ys[i] - self.start[1])
+        return self.Dist(self.order[k - 1], i)
+
+    def Reverse(self, a, b):
+        # reverse the points from position a to position b inclusive
+        self.order[a:b + 1] = self.order[a:b + 1][::-1]
+        for k in range(a, b + 1):
+            self.pos[self.order[k]] = k
+
+    def TwoOpt(self):
+        # reverse a run of points if it shortens the path, returns True if anything changed
+        n = len(self.order)
+        improved = False
+        for k in range(0, n):
+            if time.time() > self.deadline:
+                break
+            for c in self.neighbours[self.order[k]]:
+                # try joining the point at k to its neighbour c, by reversing the points between them
+                j = self.pos[c]
+                if j > k + 1:
+                    a, b = k + 1, j
+                elif j + 1 < k:
+                    a, b = j + 1, k
+                else:
+                    continue
+                old = self.EdgeLength(a)
+                new = self.DistFromPrev(a, self.order[b])
+                if b + 1 < n:
+                    old += self.EdgeLength(b + 1)
+                    new += self.Dist(self.order[a], self.order[b + 1])
+                if new < old - 1e-9:
+                    self.Reverse(a, b)
+                    improved = True
+        return improved
+
+    def OrOpt(self):
+        # move a run of 1 to 3 points to a better place, returns True if anything changed
+        improved = False
+        for length in (1, 2, 3):
+            a = 0
+            while a + length <= len(self.order):
+                if time.time() > self.deadline:
+                    return improved
+                if self.MoveSegment(a, length):
+                    improved = True
+                a += 1
+        return improved
+
+    def MoveSegment(self, a, length):
+        # try moving the points from position a, next to a neighbour of the first or last of them
+        order = self.order
+        n = len(order)
+        b = a + length - 1
+        m = n - length # number of points left when the segment is taken out
+
+        def rest(j):
+            # the path without the segment
+            return order[j] if j < a else order[j + length]
+
+        def InsertCost(g, s0, s1):
+            # extra length from putting s0...s1 between rest(g - 1) and rest(g)
+            cost = 0.0
+            old = 0.0
+            if g > 0:
+                cost = self.Dist(rest(g - 1), s0)
+                if g < m:
+                    old = self.Dist(rest(g - 1), rest(g))
+            elif self.start != None:
+                cost = math.hypot(self.xs[s0] - self.start[0], self.ys[s0] - self.start[1])
+                if m > 0:
+                    old = math.hypot(self.xs[rest(0)] - self.start[0], self.ys[rest(0)] - self.start[1])
+            if g < m:
+                cost += self.Dist(s1, rest(g))
+            return cost - old
+
+        # length saved by taking out the segment
+        removed = self.EdgeLength(a)
+        if b + 1 < n:
+            removed += self.EdgeLength(b + 1) - self.DistFromPrev(a, order[b + 1])
+
+        best = None
+        for end in (order[a], order[b]):
+            for c in self.neighbours[end]:
+                k = self.pos[c]
+                if k >= a and k <= b:
+                    continue
+                if k > b:
+                    k -= length
+                for g in (k, k + 1):
+                    for s0, s1 in ((order[a], order[b]), (order[b], order[a])):
+                        gain = removed - InsertCost(g, s0, s1)
+                        if gain > 1e-9 and (best == None or gain > best[0]):
+                            best = (gain, g, s0 != order[a])
+        if best == None:
+            return False
+
+        gain, g, reverse = best
+        segment = order[a:b + 1]
+        if reverse:
+            segment.reverse()
+        new_order = order[:a] + order[b + 1:]
+        new_order[g:g] = segment
+        self.order = new_order
+        self.UpdatePositions()
+        return True
+
+    def Improve(self):
+        if self.neighbours == None:
+            return self.order
+        while time.time() < self.deadline:
+            improved = self.TwoOpt()
+            if self.OrOpt():
+                improved = True
+            if not improved:
+                break
+        return self.order
+
+def OptimizeOrder(pts, start = None, time_budget = 1.0):
+    # returns the points in a new order, the rapid distance before and the rapid distance after
+    # pts are visited from start, if given, otherwise from the first point
+    deadline = time.time() + time_budget
+    xs = [p.x for p in pts]
+    ys = [p.y for p in pts]
+    original = list(range(0, len(pts)))
+    before = PathLength(xs, ys, original, start)
+    if len(pts) < 3:
+        return list(pts), before, before
+
+    first = 0
+    if start != None:
+        first = min(original, key = lambda i: math.hypot(xs[i] - start[0], ys[i] - start[1]))
+    order = NearestNeighbourOrder(xs, ys, first, deadline)
+    if time.time() < deadline:
+        order = PathImprover(xs, ys, order, start, deadline).Improve()
+
+    after = PathLength(xs, ys, order, start)
+    if after >= before:
+        # keep the original order, if it was better
+        return list(pts), before, before
+    return [pts[i] for i in order], before, after
@@ -3,25 +3,39 @@
 # where latest updates can be downloaded
 # Please do not share this file with anyone
 
-import AutoProgramDlg
 from HeeksConfig import HeeksConfig
 import wx
 import cad
 import geom
 import math
 import step
-import Program
-import NcCode
-import Stock
-import Profile
-import Pocket
-import Drilling
-import ScriptOp
-import Tag
-import Tags
-import Tool
 import time
+import threading
+import queue
+import FourAxisCache
+import FourAxisRecord
+import DrillPath
+import RestMachining
+import AreaData
+import Trace
+import StageGraph
+import Cancel
+import ToolLibrary
 from consts import *
+from LazyModule import LazyModule
+
+# the dialog and operations modules are only imported when Auto Program first uses them
+AutoProgramDlg = LazyModule('AutoProgramDlg')
+Program = LazyModule('Program')
+NcCode = LazyModule('NcCode')
+Stock = LazyModule('Stock')
+Profile = LazyModule('Profile')
+Pocket = LazyModule('Pocket')
+Drilling = LazyModule('Drilling')
+ScriptOp = LazyModule('ScriptOp')
+Tag = LazyModule('Tag')
+Tags = LazyModule('Tags')
+Tool = LazyModule('Tool')
 
 MOVE_START_NOT = 0
 MOVE_START_TO_MIDDLE_LEFT = 1
@@ -42,6 +56,48 @@ FINISH_COLOR = cad.Color(128, 0, 255)
 
 BIG_CUTTER_DIAMETER = 6.0 # maximum cutter diameter allowed when big_rigid_part is not ticked, otherwise allow any size tool
 
+available_tools_path = None # the tool library file, defaults to available.tools next to this file
+
+# the stages of Run, with the settings each one reads; part is the key of the part solid, see FourAxisCache.TessellationCache
+# tool numbers and area_done are carried from one stage of operations to the next, so each of those uses the one before
+RUN_STAGES = StageGraph.StageGraph([
+    StageGraph.Stage('stock', ['part', 'material', 'use_part_thickness', 'precision', 'x_margin', 'y_margin']),
+    StageGraph.Stage('shadow', ['precision'], ['stock']),
+    StageGraph.Stage('area_operations', ['make_area_operations', 'big_rigid_part', 'geometry_visible'], ['shadow']),
+    StageGraph.Stage('shadow_inners', ['big_rigid_part', 'drill_order_time', 'geometry_visible'], ['area_operations']),
+    StageGraph.Stage('outside', ['big_rigid_part', 'geometry_visible'], ['shadow_inners']),
+    StageGraph.Stage('tags', ['tag_width', 'tag_height', 'tag_angle', 'tag_y_margin'], ['outside']),
+    StageGraph.Stage('gcode', ['create_gcode'], ['tags']),
+    ])
+INCREMENTAL_STAGES = ['tags', 'gcode'] # stages which can be done again on their own, keeping the operations from the last run
+
+class LastRun:
+    # what the next run needs to reuse the operations of a run
+    def __init__(self, keys, tagged_profiles, object_ids):
+        self.keys = keys # stage name to key
+        self.tagged_profiles = tagged_profiles
+        self.object_ids = object_ids # to check the program hasn't been changed since
+
+last_run = None # LastRun of the last run which finished without failing
+
+DEFAULT_STAGE_COST = 1.0 # seconds expected for a stage which hasn't been timed yet
+PROGRESS_INTERVAL = 0.1 # seconds between progress dialog updates, while waiting for geometry
+
+def ReadStageCosts(text):
+    # returns a dictionary of stage name to seconds, from StageCostsToString
+    costs = {}
+    for item in text.split(','):
+        if ':' in item:
+            name, seconds = item.rsplit(':', 1)
+            try:
+                costs[name] = float(seconds)
+            except ValueError:
+                pass
+    return costs
+
+def StageCostsToString(costs):
+    return ','.join(['%s:%0.3f' % (name, costs[name]) for name in sorted(costs)])
+
 class AutoProgram:
     def __init__(self):
         self.ReadFromConfig()
@@ -53,6 +109,7 @@ class AutoProgram:
         self.part = None
         self.failure = None
         self.warnings = []
+        self.drill_travel = [] # list of ( diameter, number of points, rapid distance before, rapid distance after ordering )
         self.stock_thicknesses = {
                  MATERIAL_NAME_ACETAL:[5.0, 6.0, 10.0, 20.0, 30.0, 40.0],
                  MATERIAL_NAME_POLYPROPYLENE:[5.0, 6.0, 9.0, 10.0, 20.0, 30.0, 40.0],
@@ -61,7 +118,14 @@ class AutoProgram:
                  }
         self.precision_faces = []
         self.want_progress_dlg = False
+        self.progress_dlg = None
+        self.cancel = Cancel.CancelToken()
+        self.geometry_worker = None # the thread doing the geometry, while the progress dialog is shown, see RunGeometry
         self.want_time_print = True
+        self.tracer = Trace.null_tracer
+        self.recorder = FourAxisRecord.null_recorder
+        self.tagged_profiles = [] # list of ( outside profile, curve its tags are found on ), for doing the tags again
+        self.headless = False # set this when running without the GUI, for batch processing
 
     def GetSlotCutters(self):
         return self.slot_cutters[self.material]
@@ -81,6 +145,19 @@ class AutoProgram:
         self.make_area_operations = config.ReadBool('MakeAreaOps', True)
         self.geometry_visible = config.ReadBool('GeomVisible', False)
         self.use_part_thickness = config.ReadBool('UsePartThickness', False)        
+        self.use_geometry_cache = config.ReadBool('UseGeometryCache', True) # reuse the tessellation, shadow and machining areas from previous runs
+        self.drill_order_time = config.ReadFloat('DrillOrderTime', 2.0) # seconds allowed for ordering all the drill points
+        self.parallel_rest_machining = config.ReadBool('ParallelRestMachining', False) # rest machine the machining area levels in worker processes
+        self.processes = config.ReadInt('Processes', 0) # number of worker processes, 0 for one per CPU
+        self.trace_file = config.Read('TraceFile', '') # if set, a Chrome trace of the stages is written to this file
+        self.profile_file = config.Read('ProfileFile', '') # if set, Run is profiled with cProfile and the stats written to this file
+        self.background_geometry = config.ReadBool('BackgroundGeometry', True) # do the geometry on another thread, so the progress dialog keeps working
+        self.stage_costs = ReadStageCosts(config.Read('StageCosts', '')) # seconds each stage took, for the progress; see SaveStageCosts
+        self.incremental = config.ReadBool('IncrementalRun', True) # only do the stages whose settings have changed since the last run
+        self.record_file = config.Read('RecordFile', '') # if set, the part, settings and areas of each stage are written to this file, for FourAxisReplay.py
+        self.debug_area_str = config.ReadBool('DebugAreaStr', False) # on Windows, str of an area or curve shows it in the viewer
+        if self.debug_area_str:
+            EnableDebugStr()
         
         
     def WriteToConfig(self):
@@ -98,37 +175,135 @@ class AutoProgram:
         config.WriteBool('MakeAreaOps', self.make_area_operations)
         config.WriteBool('GeomVisible', self.geometry_visible)
         config.WriteBool('UsePartThickness', self.use_part_thickness)
+        config.WriteBool('UseGeometryCache', self.use_geometry_cache)
+        config.WriteFloat('DrillOrderTime', self.drill_order_time)
+        config.WriteBool('ParallelRestMachining', self.parallel_rest_machining)
+        config.WriteInt('Processes', self.processes)
+        config.Write('TraceFile', self.trace_file)
+        config.Write('ProfileFile', self.profile_file)
+        config.WriteBool('BackgroundGeometry', self.background_geometry)
+        config.WriteBool('IncrementalRun', self.incremental)
+        config.Write('RecordFile', self.record_file)
+        config.WriteBool('DebugAreaStr', self.debug_area_str)
     
     def Edit(self):
         res = AutoProgramDlg.Do(self)
+        if res:
+            # it's being run from the dialog, so show the progress, with its cancel button
+            self.want_progress_dlg = True
         return res
     
     def progress_start(self):
-        if self.want_time_print:
-            self.start_time = time.time()
-            self.last_time = self.start_time
-            self.progress_text = 'Start'
+        self.tracer = Trace.Tracer()
+        if self.profile_file:
+            self.tracer.StartProfiling()
+        self.run_span = self.tracer.Span('Auto Program')
+        self.stage_span = None
+        if self.record_file:
+            self.recorder = FourAxisRecord.Recorder(self.record_file)
+            self.recorder.Put('settings', self.GetSettings())
+
+        self.cancel = Cancel.CancelToken()
+        self.document_changed = False # set when the run changes the document, so a cancelled run knows there's something to undo
+        self.SetProgressStages([])
+        self.progress_message = 'Creating operations automatically...'
 
         # show a progress dialog
-        if self.want_progress_dlg:
-            self.progress_percentage = 0
-            self.progress_dlg = wx.ProgressDialog('Auto Program', 'Creating operations automatically...', parent = wx.GetApp().frame, style = wx.PD_APP_MODAL | wx.PD_AUTO_HIDE | wx.PD_CAN_ABORT)
+        if self.want_progress_dlg and not self.headless:
+            self.progress_dlg = wx.ProgressDialog('Auto Program', self.progress_message, parent = wx.GetApp().frame, style = wx.PD_APP_MODAL | wx.PD_AUTO_HIDE | wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME)
+            if self.background_geometry:
+                self.geometry_worker = GeometryWorker()
+            
+    def SetProgressStages(self, names):
+        # the progress is the expected time of the stages done, out of the expected time of all these stages
+        self.progress_total = sum([self.GetStageCost(name) for name in names])
+        self.progress_done = 0.0
     
-    def progress_update(self, percentage_extra, txt):
-        if self.want_time_print:
-            new_time = time.time()
-            print(self.progress_text + ' time = %0.2f' % (new_time - self.last_time))
-            self.progress_text = txt
-            self.last_time = new_time
-        if self.want_progress_dlg:
-            self.progress_percentage += percentage_extra
-            self.progress_dlg.Update(self.progress_percentage, txt)
+    def GetStageCost(self, name):
+        return self.stage_costs.get(name, DEFAULT_STAGE_COST)
+    
+    def progress_update(self, txt):
+        # ends the current stage and starts the next one; the run stops here if cancel has been pressed
+        if self.stage_span != None:
+            self.progress_done += self.GetStageCost(self.stage_span.name)
+        self.progress_end_stage()
+        self.cancel.Check()
+        self.stage_span = self.tracer.Span(txt.rstrip('.'))
+        if self.progress_dlg != None:
+            self.progress_message = txt
+            self.progress_pulse()
+            
+    def progress_pulse(self):
+        # updates the progress dialog, moving on through the current stage by the time it's expected to take,
+        # and cancels the run if its cancel button has been pressed
+        if self.progress_dlg == None:
+            return
+        done = self.progress_done
+        if self.stage_span != None:
+            done += min(self.stage_span.GetDuration(), self.GetStageCost(self.stage_span.name) * 0.95)
+        percentage = int(100 * done / self.progress_total) if self.progress_total > 0.0 else 0
+        keep_going, skip = self.progress_dlg.Update(min(percentage, 99), self.progress_message)
+        if not keep_going:
+            self.cancel.Cancel()
+            
+    def RunGeometry(self, function, *args):
+        # returns function( *args ), which must only use geom, not wx or the document
+        # with the progress dialog, it's done by the geometry worker, so the main thread can keep updating the dialog and its
+        # cancel button works; the function should check self.cancel where it can stop, otherwise the run stops when it has finished
+        # the main thread only gets to update the dialog when it has the GIL; Python code, like RestMachining's, lets it have it
+        # every switch interval, but a long geom call, like Shadow, only does if geom releases the GIL during the call, otherwise
+        # the dialog stops until the call returns; the longest time between updates goes in the trace as longest_progress_wait
+        if self.geometry_worker == None:
+            return function(*args)
+        job = self.geometry_worker.Start(function, args)
+        longest_wait = 0.0
+        last_pulse = time.time()
+        while not job.done.wait(PROGRESS_INTERVAL):
+            now = time.time()
+            longest_wait = max(longest_wait, now - last_pulse)
+            last_pulse = now
+            self.progress_pulse()
+        self.tracer.Set(longest_progress_wait = max(longest_wait, time.time() - last_pulse))
+        if job.error != None:
+            raise job.error
+        self.cancel.Check()
+        return job.result
+        
+    def SaveStageCosts(self):
+        # keeps the times the stages took, averaged with the times kept before, for the progress of the next run
+        for name, seconds in self.tracer.GetStageTimes():
+            if name in self.stage_costs:
+                self.stage_costs[name] = (self.stage_costs[name] + seconds) * 0.5
+            else:
+                self.stage_costs[name] = seconds
+        if not self.headless:
+            HeeksConfig().Write('StageCosts', StageCostsToString(self.stage_costs))
+            
+    def progress_end_stage(self):
+        if self.stage_span != None:
+            self.tracer.End(self.stage_span)
+            if self.want_time_print:
+                print(self.stage_span.name + ' time = %0.2f' % self.stage_span.GetDuration())
+            self.stage_span = None
             
     def progress_end(self):
+        self.progress_end_stage()
+        self.tracer.EndAll()
         if self.want_time_print:
-            print('total_time = %0.2f' % (time.time() - self.start_time))
+            print('total_time = %0.2f' % self.run_span.GetDuration())
+        if self.trace_file:
+            self.tracer.WriteChromeTrace(self.trace_file)
+        if self.profile_file:
+            self.tracer.StopProfiling(self.profile_file)
+        self.recorder.Close()
+        self.recorder = FourAxisRecord.null_recorder
+        if self.geometry_worker != None:
+            self.geometry_worker.Stop()
+            self.geometry_worker = None
             
-        if self.want_progress_dlg: self.progress_dlg.Destroy()
+        if self.progress_dlg != None:
+            self.progress_dlg.Destroy()
+            self.progress_dlg = None
     
     def Run(self):
         cad.StartHistory('Create Operations')
@@ -147,92 +322,198 @@ class AutoProgram:
             return
         
         self.progress_start()
+        global last_run
+        cancelled = False
 
         try:
-            # get the cutters for the material
-            self.progress_update(1, 'Get Cutters...')
-            self.slot_cutters.ImportToolsForMaterial(self.material.lower())
-            
-            # get the drills for the material
-            self.progress_update(1, 'Get Drills...')
-            self.drills.ImportToolsForMaterial(self.material.lower())
-            
-            # automatically create stocks, tools, operations, g-code
-            self.progress_update(3, 'Get Part...')
-            self.GetPart()
-            
-            # clear existing program
-            self.ClearProgram()
-            
-            # add a cube and stock referencing it
-            self.AddStock()
-            
-            # move the part, so stock is at origin
-            self.progress_update(5, 'Move Part...')
-            self.MovePart()
-            
-            self.progress_update(5, 'Make Shadow...')
-            self.MakeShadow()
-            self.stored_ops = []
-
-            do_finish_operations = True
-            
-            if self.make_area_operations:
-                self.progress_update(5, 'Make Area Operations...')
-                self.MakePatchOperations(do_finish_operations)
-                
-            self.progress_update(5, 'Cut Shadow Inners...')
-            self.CutShadowInners(do_finish_operations)
-            for op in self.stored_ops:
-                cad.AddUndoably(op, wx.GetApp().program.operations)
-            self.stored_ops = []
-            self.progress_update(5, 'Cut Outside...')
-            self.CutOutside(do_finish_operations)
-            
-            self.progress_update(5, 'Add Tools At End...')
-            self.AddToolsAtEnd()
+            changed = self.GetChangedStages()
+            self.SetProgressStages(self.GetProgressStages(changed))
+            if changed == None:
+                last_run = None
+                self.CreateOperations()
+            else:
+                self.UpdateOperations(changed)
             
             if self.failure:
-                wx.MessageBox(self.failure, "ERROR!")
+                self.MessageBox(self.failure, "ERROR!")
             else:
                 if len(self.warnings) > 0:
-                    s = ''
-                    for warning in self.warnings:
-                        if s:
-                            s.append('\n')
-                        s.append(warning)
-                    wx.MessageBox(s, 'warnings only:')
-        
-                if self.create_gcode:
-                    self.progress_update(5, 'Make G Code...')
+                    self.MessageBox('\n'.join(self.warnings), 'warnings only:')
+        
+                if self.create_gcode and (changed == None or 'gcode' in changed):
+                    self.progress_update('Make G Code...')
                     wx.GetApp().program.MakeGCode()
-                    self.progress_update(5, 'Read G Code for Toolpath View...')
-                    wx.GetApp().program.BackPlot()
+                    if not self.headless:
+                        self.progress_update('Read G Code for Toolpath View...')
+                        wx.GetApp().program.BackPlot()
                     
             self.progress_end()
+            if self.failure == None:
+                last_run = LastRun(self.GetStageKeys(), self.tagged_profiles, GetProgramObjectIDs())
+                self.SaveStageCosts()
+
+        except Cancel.Cancelled:
+            # everything the run did is undone below
+            last_run = None
+            self.progress_end()
+            self.failure = 'Auto Program cancelled'
+            cancelled = True
 
         except Exception as e:
+            last_run = None
             self.progress_end()
             import traceback
             print(traceback.format_exc())
-            wx.MessageBox('error during Auto Program: ' + str(e))
+            self.failure = 'error during Auto Program: ' + str(e)
+            self.MessageBox(self.failure)
             
         cad.EndHistory()
+        if cancelled and self.document_changed:
+            # undo the run, as the Undo button does; everything it did is in the one Create Operations step
+            # if the run hadn't changed the document, there's no step for it, and undoing would undo what was done before
+            wx.GetApp().OnUndo(None)
+        
+        if not self.headless:
+            wx.GetApp().frame.graphics_canvas.viewport.OnMagExtents(True, 6)
+            wx.GetApp().frame.graphics_canvas.Refresh()
             
-        wx.GetApp().frame.graphics_canvas.viewport.OnMagExtents(True, 6)
-        wx.GetApp().frame.graphics_canvas.Refresh()
+    def GetProgressStages(self, changed):
+        # returns the names of the stages Run will do, changed being from GetChangedStages
+        if changed == None:
+            names = ['Get Cutters', 'Get Drills', 'Get Part', 'Move Part', 'Make Shadow']
+            if self.make_area_operations:
+                names.append('Make Area Operations')
+            names += ['Cut Shadow Inners', 'Cut Outside', 'Add Tools At End']
+        else:
+            names = ['Update Tags'] if 'tags' in changed else []
+        if self.create_gcode and (changed == None or 'gcode' in changed):
+            names.append('Make G Code')
+            if not self.headless:
+                names.append('Read G Code for Toolpath View')
+        return names
+        
+    def GetStageKeys(self):
+        settings = self.GetSettings()
+        settings['part'] = FourAxisCache.tessellations.GetObjectKey(self.part)
+        return RUN_STAGES.GetKeys(settings)
+        
+    def GetChangedStages(self):
+        # returns the names of the stages changed since the last run, if they are all INCREMENTAL_STAGES, otherwise None, for a full run
+        # the program mustn't have been changed since, and the part mustn't have been moved or edited
+        if not self.incremental or last_run == None:
+            return None
+        self.GetPart()
+        if self.part == None or GetProgramObjectIDs() != last_run.object_ids:
+            self.part = None
+            self.failure = None
+            return None
+        changed = RUN_STAGES.GetChanged(last_run.keys, self.GetStageKeys())
+        for name in changed:
+            if not name in INCREMENTAL_STAGES:
+                return None
+        return changed
+        
+    def UpdateOperations(self, changed):
+        # does the changed stages, keeping the rest of the operations from the last run
+        self.offset_cache = RestMachining.OffsetCache()
+        self.tagged_profiles = last_run.tagged_profiles
+        if self.want_time_print:
+            print('reusing the operations from the last run, changed stages: ' + (', '.join(changed) if len(changed) > 0 else 'none'))
+        if 'tags' in changed:
+            self.progress_update('Update Tags...')
+            self.UpdateTags()
+        
+    def UpdateTags(self):
+        # replaces the tags of the outside profiles, for the new tag settings
+        self.document_changed = True
+        cad.StartHistory('Update Tags')
+        for profile, offset_curve in self.tagged_profiles:
+            if profile.tags != None:
+                cad.DeleteUndoably(profile.tags)
+                profile.tags = None
+            tags = self.MakeTags(offset_curve)
+            if tags != None:
+                cad.AddUndoably(tags, profile)
+                profile.tags = tags
+        cad.EndHistory()
+        
+    def CreateOperations(self):
+        self.offset_cache = RestMachining.OffsetCache()
+        self.tagged_profiles = []
+        
+        # get the cutters for the material
+        self.progress_update('Get Cutters...')
+        self.slot_cutters.ImportToolsForMaterial(self.material.lower())
+        
+        # get the drills for the material
+        self.progress_update('Get Drills...')
+        self.drills.ImportToolsForMaterial(self.material.lower())
+        
+        # automatically create stocks, tools, operations, g-code
+        self.progress_update('Get Part...')
+        self.GetPart()
+        
+        # clear existing program
+        self.ClearProgram()
+        
+        # add a cube and stock referencing it
+        self.AddStock()
+        
+        # move the part, so stock is at origin
+        self.progress_update('Move Part...')
+        self.MovePart()
+        
+        self.progress_update('Make Shadow...')
+        self.MakeShadow()
+        self.stored_ops = []
+
+        do_finish_operations = True
+        
+        if self.make_area_operations:
+            self.progress_update('Make Area Operations...')
+            self.MakePatchOperations(do_finish_operations)
+            
+        self.progress_update('Cut Shadow Inners...')
+        self.CutShadowInners(do_finish_operations)
+        for op in self.stored_ops:
+            self.AddUndoably(op, wx.GetApp().program.operations)
+        self.stored_ops = []
+        self.progress_update('Cut Outside...')
+        self.CutOutside(do_finish_operations)
+        
+        self.progress_update('Add Tools At End...')
+        self.AddToolsAtEnd()
+        
+        if self.want_time_print:
+            print(self.offset_cache.GetReport())
+            print(FourAxisCache.tessellations.GetReport())
+        
+    def GetSettings(self):
+        # returns a dictionary of the settings, all the attributes which are numbers, strings or bools
+        settings = {}
+        for name, value in vars(self).items():
+            if type(value) in [bool, int, float, str]:
+                settings[name] = value
+        return settings
+        
+    def MessageBox(self, message, caption = 'Message'):
+        if self.headless:
+            # no modal dialogs when running without a GUI, failure and warnings are kept on self for the caller
+            print(caption + ' ' + message)
+        else:
+            wx.MessageBox(message, caption)
         
     def AddToolsAtEnd(self):
         if self.failure: return
         for tool_id in self.tools_to_add_at_end:
-            cad.AddUndoably(self.tools_to_add_at_end[tool_id], wx.GetApp().program.tools)
+            self.AddUndoably(self.tools_to_add_at_end[tool_id], wx.GetApp().program.tools)
             
     def CutShadowInners(self, do_finish_pass = True):
         # shadow inners are all the holes which go all the way through the part
         if self.failure: return
         curves_to_profile = []
         holes_to_profile = []
-        holes_to_drill = []
+        hole_index = HoleIndex(self.precision)
         
         shadow_curves = self.shadow.GetCurves()
         for curve in shadow_curves:
@@ -241,17 +522,19 @@ class AutoProgram:
                 if circle == None:
                     curves_to_profile.append(curve)
                 else:
-                    hole = Hole(circle, 0.0, -self.thickness)
                     # add to existing holes
-                    for h in holes_to_drill:
-                        if h.AddHole(hole, self.precision):
-                            hole = None
-                            break
-                    if hole != None:
-                        holes_to_drill.append(hole)
+                    hole_index.Add(Hole(circle, 0.0, -self.thickness))
                         
-        for hole in holes_to_drill:
-            hole.SortPoints()
+        total_points = 0
+        for hole in hole_index.holes:
+            total_points += len(hole.pts)
+            
+        self.drill_travel = []
+        for hole in hole_index.holes:
+            before, after = hole.OptimizePoints(self.drill_order_time * len(hole.pts) / total_points)
+            self.drill_travel.append((hole.diameter, len(hole.pts), before, after))
+            if self.want_time_print:
+                print('drill %g mm, %i points, rapid distance %0.1f reduced to %0.1f' % (hole.diameter, len(hole.pts), before, after))
             cut_depth = hole.top_z - hole.bottom_z
             tool_index = self.drills.GetToolOfDiameter(hole.diameter, cut_depth, self.precision)
             if tool_index == None:
@@ -264,7 +547,7 @@ class AutoProgram:
             for p in hole.pts:
                 new_point = cad.NewPoint(geom.Point3D(p.x, p.y, 0.0))
                 new_point.SetVisible(self.geometry_visible)
-                cad.AddUndoably(new_point)
+                self.AddUndoably(new_point)
                 drilling.points.append(new_point.GetID())
             drilling.start_depth = hole.top_z
             drilling.final_depth = hole.bottom_z
@@ -273,7 +556,7 @@ class AutoProgram:
             drilling.spindle_speed = default_tool.spin
             drilling.step_down = default_tool.rough_step_down
             cad.PyIncref(drilling)
-            cad.AddUndoably(drilling, wx.GetApp().program.operations)
+            self.AddUndoably(drilling, wx.GetApp().program.operations)
             
         for hole in holes_to_profile:
             self.ProfileHole(hole, do_finish_pass = do_finish_pass)
@@ -284,28 +567,35 @@ class AutoProgram:
     def MakePatchOperations(self, do_finish_pass = True):
         if self.failure: return
         
-        self.progress_update(1, 'Stl.GetMachiningAreas()')
-        machining_areas = self.part_stl.GetMachiningAreas()
+        with self.tracer.Span('GetMachiningAreas') as span:
+            machining_areas = self.RunGeometry(self.GetMachiningAreas)
+            span.Set(machining_areas = len(machining_areas))
+        if self.recorder.recording:
+            self.recorder.Put('machining_areas', [(AreaData.AreaToData(ma.area), ma.top) for ma in machining_areas])
         
         debug_Union_count = 0
         
-        self.progress_update(1, 'join areas of the same top level')
-        # join areas of the same top level
-        combined_machining_areas = []
-        current_ma = None
-        for ma in machining_areas:
-            if current_ma == None or math.fabs(ma.top - current_ma.top) > self.precision:
-                current_ma = ma
-                combined_machining_areas.append(current_ma)
-            else:
-                debug_Union_count += 1
-                current_ma.area.Union(ma.area)
+        with self.tracer.Span('Join Areas Of The Same Top Level') as span:
+            # join areas of the same top level
+            combined_machining_areas = []
+            current_ma = None
+            for ma in machining_areas:
+                if current_ma == None or math.fabs(ma.top - current_ma.top) > self.precision:
+                    current_ma = ma
+                    combined_machining_areas.append(current_ma)
+                else:
+                    debug_Union_count += 1
+                    current_ma.area.Union(ma.area)
+            span.Set(levels = len(combined_machining_areas), unions = debug_Union_count)
                 
-        self.progress_update(1, 'RestMachine')
+        if self.parallel_rest_machining:
+            self.RestMachineLevelsInParallel(combined_machining_areas, do_finish_pass)
+            return
         
         level = 1 # for naming the operations
         
         for ma in combined_machining_areas:
+            self.cancel.Check()
 #            sketch = cad.NewSketchFromArea(ma.area)
 #            mat = geom.Matrix()
 #            mat.Translate(geom.Point3D(0,0,ma.top))
@@ -323,27 +613,112 @@ class AutoProgram:
                 cut_depth = math.fabs(ma.top)
                 patch_cutters = self.GetSortedCutters(cut_depth, rest_machining = True)
                 
-                self.RestMachine(ma.area, patch_cutters, 0.0, ma.top, bottom_style=BOTTOM_POCKET, do_finish_pass = do_finish_pass, store_ops = True, name = 'Level %i' % level)
+                with self.tracer.Span('RestMachine Level %i' % level, top = ma.top, curves = ma.area.NumCurves(), vertices = AreaData.NumVertices(ma.area), cutters = len(patch_cutters)):
+                    self.RestMachine(ma.area, patch_cutters, 0.0, ma.top, bottom_style=BOTTOM_POCKET, do_finish_pass = do_finish_pass, store_ops = True, name = 'Level %i' % level)
                 
                 level += 1
             
             self.area_done.Union(ma.area)
+            self.area_done_version += 1
+            
+    def RestMachineLevelsInParallel(self, combined_machining_areas, do_finish_pass):
+        # area_done is the only thing carried from one level to the next, so find it for every level first,
+        # then plan the rest machining of all the levels at once in worker processes
+        # the operations are added in level order, so they are the same as doing one level after another
+        levels = [] # list of ( machining area, level number )
+        jobs = []
+        level = 1 # for naming the operations
+        for ma in combined_machining_areas:
+            ma.area.Subtract(self.area_done)
+            if ma.top < -0.001:
+                patch_cutters = self.GetSortedCutters(math.fabs(ma.top), rest_machining = True)
+                if len(patch_cutters) > 0:
+                    cutter_infos = self.GetCutterInfos(patch_cutters)
+                    record_prefix = self.recorder.NewGroup('rest_machine')
+                    self.RecordRestMachineInput(record_prefix, ma.area, cutter_infos, do_finish_pass)
+                    levels.append((ma, level, record_prefix))
+                    jobs.append((AreaData.AreaToData(ma.area), AreaData.AreaToData(self.area_done), cutter_infos, do_finish_pass, self.recorder.recording))
+                level += 1
+            self.area_done.Union(ma.area)
+            self.area_done_version += 1
+            
+        if len(jobs) == 0:
+            return
+            
+        import multiprocessing
+        with self.tracer.Span('Plan Levels In Parallel', levels = len(jobs)):
+            pool = multiprocessing.Pool(self.processes if self.processes > 0 else None)
+            try:
+                async_results = pool.map_async(RestMachining.PlanRestMachineJob, jobs)
+                while not async_results.ready():
+                    async_results.wait(PROGRESS_INTERVAL)
+                    self.progress_pulse()
+                    self.cancel.Check()
+                results = async_results.get()
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            pool.join()
+        
+        for (ma, level, record_prefix), (actions_data, hits, misses, events, record_entries) in zip(levels, results):
+            self.offset_cache.hits += hits
+            self.offset_cache.misses += misses
+            self.tracer.AddEvents(events)
+            self.recorder.AddEntries(record_entries, record_prefix)
+            with self.tracer.Span('Add Level %i Operations' % level):
+                self.AddRestMachiningOps(RestMachining.ActionsFromData(actions_data), 0.0, ma.top, BOTTOM_POCKET, do_finish_pass, store_ops = True, name = 'Level %i' % level)
+        
+    def GetPartTris(self):
+        if self.use_geometry_cache:
+            self.part_stl, self.mesh_key, self.mesh_origin = FourAxisCache.cache.GetTris(self.part, self.precision)
+        else:
+            self.part_stl = FourAxisCache.tessellations.GetTris(self.part, self.precision).stl
+            self.mesh_key = None
+            
+    def GetShadow(self):
+        if self.mesh_key != None:
+            shadow = FourAxisCache.cache.GetShadow(self.mesh_key, self.mesh_origin)
+            if shadow != None:
+                self.tracer.Set(cached = True)
+                return shadow
+        mat = geom.Matrix()
+        shadow = self.part_stl.Shadow(mat, False)
+        if self.mesh_key != None:
+            FourAxisCache.cache.PutShadow(self.mesh_key, self.mesh_origin, shadow)
+        return shadow
+        
+    def GetMachiningAreas(self):
+        if self.mesh_key != None:
+            machining_areas = FourAxisCache.cache.GetMachiningAreas(self.mesh_key, self.mesh_origin)
+            if machining_areas != None:
+                self.tracer.Set(cached = True)
+                return machining_areas
+        machining_areas = self.part_stl.GetMachiningAreas()
+        if self.mesh_key != None:
+            FourAxisCache.cache.PutMachiningAreas(self.mesh_key, self.mesh_origin, machining_areas)
+        return machining_areas
         
     def MakeShadow(self):
         if self.failure: return
-        self.part_stl = self.part.GetTris(self.precision)
+        with self.tracer.Span('GetTris', precision = self.precision):
+            self.GetPartTris() # on this thread, as the part is in the document
         self.part_box = self.part_stl.GetBox()
         self.clearance_height = self.part_box.MaxZ() + 5.0
-        mat = geom.Matrix()
         geom.set_fitarcs(False) # make sure FitArcs only happens when making the g-code
-        self.part_stl.WriteStl('c:/tmp/shadow.stl')
-        self.shadow = self.part_stl.Shadow(mat, False)
+        if self.recorder.recording:
+            self.recorder.PutBytes('part.stl', FourAxisCache.tessellations.GetTris(self.part, self.precision).data)
+        with self.tracer.Span('Shadow') as span:
+            self.shadow = self.RunGeometry(self.GetShadow)
+            span.Set(curves = self.shadow.NumCurves(), vertices = AreaData.NumVertices(self.shadow))
+        self.recorder.PutArea('shadow', self.shadow)
         sketch = cad.NewSketchFromArea(self.shadow)
         sketch.SetVisible(self.geometry_visible)
-        cad.AddUndoably(sketch)
+        self.AddUndoably(sketch)
         self.shadow.Reorder()
         self.stock_area = self.MakeStockArea(self.shadow, self.x_margin, self.y_margin, self.x_margin, self.y_margin)
         self.area_done = geom.Area() # area_done starts empty, then is the area at the top ( top face ), then gets added to by each descending area until it should end up the same as the shadow of the part
+        self.area_done_version = 0 # add one to this whenever area_done changes, it's the key for offsets of area_done in the offset cache
         self.solid_area = None
         self.current_top_height = None
         
@@ -362,94 +737,106 @@ class AutoProgram:
             curve.Append(geom.Vertex(-1, geom.Point(p.x - radius, p.y), geom.Point(p.x, p.y)))
             self.ProfileCurve(curve, z_top = hole.top_z, z_bottom = hole.bottom_z, do_finish_pass = do_finish_pass, inside = True, name = 'Hole')
         
-    def ProfileCurveWithCutter(self, curve, cutter_index, z_top = 0.0, z_bottom = None, move_start_type = MOVE_START_NOT, bottom_style = BOTTOM_THROUGH, material_allowance = 0.0, rough = True, add_tags = False, side = Profile.PROFILE_LEFT_OR_OUTSIDE, store_ops = False, name = None):
-        tool_id, default_tool = self.slot_cutters.AddIfNotAdded(cutter_index)
-        if self.failure:
-            return
-
-        #check that cutter can get unto the curve
-        radius = default_tool.diam * 0.5
-        if (side == Profile.PROFILE_RIGHT_OR_INSIDE) and curve.IsClosed():
-            offset_area = geom.Area()
-            c = geom.Curve(curve)
-            if c.IsClockwise():
-                c.Reverse()
-            offset_area.Append(c)
-            offset_area.Offset(radius + 0.1)
-            if offset_area.NumCurves() == 0:
+    def ProfileCurveWithCutter(self, curve, cutter_index, z_top = 0.0, z_bottom = None, move_start_type = MOVE_START_NOT, bottom_style = BOTTOM_THROUGH, material_allowance = 0.0, rough = True, add_tags = False, side = None, store_ops = False, name = None):
+        # side defaults to Profile.PROFILE_LEFT_OR_OUTSIDE
+        if side == None:
+            side = Profile.PROFILE_LEFT_OR_OUTSIDE
+        with self.tracer.Span('ProfileCurveWithCutter', vertices = len(curve.GetVertices()), rough = rough):
+            tool_id, default_tool = self.slot_cutters.AddIfNotAdded(cutter_index)
+            if self.failure:
                 return
+
+            #check that cutter can get unto the curve
+            radius = default_tool.diam * 0.5
+            if (side == Profile.PROFILE_RIGHT_OR_INSIDE) and curve.IsClosed():
+                offset_area = geom.Area()
+                c = geom.Curve(curve)
+                if c.IsClockwise():
+                    c.Reverse()
+                offset_area.Append(c)
+                offset_area.Offset(radius + 0.1)
+                if offset_area.NumCurves() == 0:
+                    return
         
-        # create a sketch for the curve
-        sketch = cad.NewSketchFromCurve(curve)
-        sketch.SetVisible(self.geometry_visible)
-        cad.AddUndoably(sketch)
-        
-        profile = Profile.Profile(sketch.GetID())
-        profile.tool_number = tool_id
-        profile.start_depth = z_top
-        profile.pattern = 0
-        profile.surface = 0
-        if z_bottom == None:
-            profile.final_depth = -self.thickness
-        else:
-            profile.final_depth = z_bottom
-            
-        profile.tool_on_side = side
-
-        if move_start_type == MOVE_START_TO_MIDDLE_LEFT:
-            profile.start_given = True
-            box = curve.GetBox()
-            profile.start = geom.Point3D(box.MinX(), (box.MinY() + box.MaxY())*0.5, 0.0)
-            
-        self.SetDepthOpBottomFromStyle(profile, bottom_style)
-
-        # set operation from chosen tool info
-        profile.horizontal_feed_rate = default_tool.hfeed
-        profile.vertical_feed_rate = default_tool.vfeed
-        profile.spindle_speed = default_tool.spin
-        profile.step_down = default_tool.rough_step_down if rough else default_tool.finish_step_down
-        profile.auto_roll_radius = 0.1
-        profile.offset_extra = material_allowance if rough else 0.0
-        profile.cut_mode = Profile.PROFILE_CLIMB if rough else Profile.PROFILE_CONVENTIONAL
-        if name != None:
-            profile.title = name
-            profile.title_made_from_id = False
-            
-        if add_tags:
-            offset_curve = geom.Curve(curve)
-            offset_curve.Offset(-radius)
-            box = offset_curve.GetBox()
-            left = box.MinX() - 1.0
-            right = box.MaxX() + 1.0
-            if box.Height() < (2 * self.tag_y_margin + self.tag_width):
-                # 2 tags in the middle
-                y_mid = (box.MinY() + box.MaxY()) * 0.5
-                lines = [ [ [left, y_mid], [right, y_mid] ], [[right, y_mid], [left, y_mid]] ]
+            # create a sketch for the curve
+            sketch = cad.NewSketchFromCurve(curve)
+            sketch.SetVisible(self.geometry_visible)
+            self.AddUndoably(sketch)
+        
+            profile = Profile.Profile(sketch.GetID())
+            profile.tool_number = tool_id
+            profile.start_depth = z_top
+            profile.pattern = 0
+            profile.surface = 0
+            if z_bottom == None:
+                profile.final_depth = -self.thickness
             else:
-                # 4 tags
-                y_upper = box.MaxY() - self.tag_y_margin
-                y_lower = box.MinY() + self.tag_y_margin
-                lines = [ [ [left, y_upper], [right, y_upper] ], [[right, y_upper], [left, y_upper]], [ [left, y_lower], [right, y_lower] ], [[right, y_lower], [left, y_lower]] ]
-            for line in lines:
-                p = FindTagPoint(offset_curve, line)
-                if p != None:
-                    tag = Tag.Tag()
-                    tag.width = self.tag_width
-                    tag.height = self.tag_height
-                    tag.angle = self.tag_angle
-                    tag.pos = p
-                    cad.PyIncref(tag)
-                    if profile.tags == None:
-                        tags = Tags.Tags()
-                        cad.PyIncref(tags)
-                        profile.Add(tags)
-                        profile.tags = tags
-                    profile.tags.Add(tag)
-
-        if store_ops:
-            self.stored_ops.append(profile)
+                profile.final_depth = z_bottom
+            
+            profile.tool_on_side = side
+
+            if move_start_type == MOVE_START_TO_MIDDLE_LEFT:
+                profile.start_given = True
+                box = curve.GetBox()
+                profile.start = geom.Point3D(box.MinX(), (box.MinY() + box.MaxY())*0.5, 0.0)
+            
+            self.SetDepthOpBottomFromStyle(profile, bottom_style)
+
+            # set operation from chosen tool info
+            profile.horizontal_feed_rate = default_tool.hfeed
+            profile.vertical_feed_rate = default_tool.vfeed
+            profile.spindle_speed = default_tool.spin
+            profile.step_down = default_tool.rough_step_down if rough else default_tool.finish_step_down
+            profile.auto_roll_radius = 0.1
+            profile.offset_extra = material_allowance if rough else 0.0
+            profile.cut_mode = Profile.PROFILE_CLIMB if rough else Profile.PROFILE_CONVENTIONAL
+            if name != None:
+                profile.title = name
+                profile.title_made_from_id = False
+            
+            if add_tags:
+                offset_curve = geom.Curve(curve)
+                offset_curve.Offset(-radius)
+                tags = self.MakeTags(offset_curve)
+                if tags != None:
+                    profile.Add(tags)
+                    profile.tags = tags
+                self.tagged_profiles.append((profile, offset_curve))
+
+            if store_ops:
+                self.stored_ops.append(profile)
+            else:
+                self.AddUndoably(profile, wx.GetApp().program.operations)
+
+    def MakeTags(self, offset_curve):
+        # returns a Tags with the tags for a profile, on its curve offset by the cutter radius, or None if there aren't any
+        box = offset_curve.GetBox()
+        left = box.MinX() - 1.0
+        right = box.MaxX() + 1.0
+        if box.Height() < (2 * self.tag_y_margin + self.tag_width):
+            # 2 tags in the middle
+            y_mid = (box.MinY() + box.MaxY()) * 0.5
+            lines = [ [ [left, y_mid], [right, y_mid] ], [[right, y_mid], [left, y_mid]] ]
         else:
-            cad.AddUndoably(profile, wx.GetApp().program.operations)
+            # 4 tags
+            y_upper = box.MaxY() - self.tag_y_margin
+            y_lower = box.MinY() + self.tag_y_margin
+            lines = [ [ [left, y_upper], [right, y_upper] ], [[right, y_upper], [left, y_upper]], [ [left, y_lower], [right, y_lower] ], [[right, y_lower], [left, y_lower]] ]
+        tags = None
+        for line in lines:
+            p = FindTagPoint(offset_curve, line)
+            if p != None:
+                tag = Tag.Tag()
+                tag.width = self.tag_width
+                tag.height = self.tag_height
+                tag.angle = self.tag_angle
+                tag.pos = p
+                cad.PyIncref(tag)
+                if tags == None:
+                    tags = Tags.Tags()
+                    cad.PyIncref(tags)
+                tags.Add(tag)
+        return tags
 
     def ProfileCurve(self, curve, z_top = 0.0, z_bottom = None, move_start_type = MOVE_START_NOT, bottom_style = BOTTOM_THROUGH, add_tags = False, inside = False, do_finish_pass = False, store_ops = False, name = None):
             if z_bottom == None:
@@ -499,113 +886,74 @@ class AutoProgram:
         if len(cutters) == 0:
             return
 
-        # store area remaining to be cut, starting with the machining area's area
-        area_remaining = geom.Area(area)
+        cutter_infos = self.GetCutterInfos(cutters)
+        record_prefix = self.recorder.NewGroup('rest_machine')
+        self.RecordRestMachineInput(record_prefix, area, cutter_infos, do_finish_pass)
+        actions = self.RunGeometry(RestMachining.PlanRestMachine, area, self.area_done, cutter_infos, do_finish_pass, self.offset_cache, ('area_done', self.area_done_version), self.tracer, self.recorder, record_prefix, self.cancel)
+        self.AddRestMachiningOps(actions, z_top, z_bottom, bottom_style, do_finish_pass, store_ops, name)
+        
+    def RecordRestMachineInput(self, record_prefix, area, cutter_infos, do_finish_pass):
+        if self.recorder.recording:
+            cutters = [(cutter.index, cutter.diam, cutter.rest_machining) for cutter in cutter_infos]
+            self.recorder.Put(record_prefix + 'input', (AreaData.AreaToData(area), AreaData.AreaToData(self.area_done), cutters, do_finish_pass))
         
+    def GetCutterInfos(self, cutters):
+        infos = []
         for cutter_index in cutters:
-            if area_remaining.NumCurves() == 0:
-                # nothing left to cut
-                break            
-                    
-            # ignore cutters not marked for rest_machining
-            if not self.slot_cutters.tools[cutter_index].rest_machining:
-                continue
-            
-            # start with the remaining area
-            a = geom.Area(area_remaining)
-            
-            cutter_radius = self.slot_cutters.tools[cutter_index].diam * 0.5
-
-            a.Thicken(0.1) # make sausages
-            a.FitArcs()
-            a.UnFitArcs()
-            a.Intersect(self.area_done) # just keep the bits that are in the material
-            a.Offset(-cutter_radius * 2 - 1) # offset sausage by tool diameter
-            a.FitArcs()
-            a.UnFitArcs()
-            a2 = geom.Area(area_remaining) # take the original
-            a2.Offset(-cutter_radius - 1) # offset it by overlap ( must be at least cutter radius, or peninsulas don't get machined )
-            a.FitArcs()
-            a.UnFitArcs()
-            a.Union(a2) # join with sausage
-            
-            # subtract area already done ( areas above this one )
-            a.Subtract(self.area_done)
-            a_pointy = geom.Area(a) # remember pointy
-            
-            # offset it inwards and outwards to remove pointless small bits
-            a.Offset(cutter_radius)
-            a.Offset(-cutter_radius)   
-            a.FitArcs()
-            a.UnFitArcs()
-            
-            # calculate finishing pass; it's the sections of the pocket curves which touch the area done
-            if do_finish_pass:
-                finish_pass_area = geom.Area(a)
-                finish_pass_area.Offset(cutter_radius)
-                offset_area_done = geom.Area(self.area_done)
-                offset_area_done.Offset(-cutter_radius - 0.2)
-                finish_passes = []
-                for curve in finish_pass_area.GetCurves():
-                    curve.Reverse()
-                    finish_passes += offset_area_done.InsideCurves(curve)
-            
-            sub_areas = a.Split()         
-
-            for sub_a in sub_areas:
-                if self.PocketCanBeDoneWithProfileOp(sub_a, cutter_index):
-                    self.ProfileCurveWithCutter(sub_a.GetCurves()[0], cutter_index = cutter_index, z_top = z_top, z_bottom = z_bottom, bottom_style=bottom_style, material_allowance = 0.1 if do_finish_pass else 0.0, rough = True, side = Profile.PROFILE_RIGHT_OR_INSIDE, store_ops = store_ops, name = name)
-                else:
-                    self.PocketArea(sub_a, cutter_index, z_top = z_top, z_bottom = z_bottom, bottom_style=bottom_style, material_allowance = 0.1 if do_finish_pass else 0.0, store_ops = store_ops, name = name)
-                    
-            if do_finish_pass:
-                for curve in finish_passes:
-                    self.ProfileCurveWithCutter(curve, cutter_index = cutter_index, z_top = z_top, z_bottom = z_bottom, bottom_style=bottom_style, material_allowance = 0.1 if do_finish_pass else 0.0, rough = False, side = Profile.PROFILE_ON, store_ops = store_ops, name = None if (name == None) else (name + ' Finish Pass'))
-                                    
-            # calculate the remaining area
-            a.Offset(-0.1) # imagine we cut more than we did, to cope with the arc vectors
-            area_remaining.Subtract(a)        
+            tool = self.slot_cutters.tools[cutter_index]
+            infos.append(RestMachining.CutterInfo(cutter_index, tool.diam, tool.rest_machining))
+        return infos
+        
+    def AddRestMachiningOps(self, actions, z_top, z_bottom, bottom_style, do_finish_pass, store_ops = False, name = None):
+        for action, geometry, cutter_index in actions:
+            if action == RestMachining.ACTION_PROFILE:
+                self.ProfileCurveWithCutter(geometry, cutter_index = cutter_index, z_top = z_top, z_bottom = z_bottom, bottom_style=bottom_style, material_allowance = 0.1 if do_finish_pass else 0.0, rough = True, side = Profile.PROFILE_RIGHT_OR_INSIDE, store_ops = store_ops, name = name)
+            elif action == RestMachining.ACTION_POCKET:
+                self.PocketArea(geometry, cutter_index, z_top = z_top, z_bottom = z_bottom, bottom_style=bottom_style, material_allowance = 0.1 if do_finish_pass else 0.0, store_ops = store_ops, name = name)
+            elif action == RestMachining.ACTION_FINISH:
+                self.ProfileCurveWithCutter(geometry, cutter_index = cutter_index, z_top = z_top, z_bottom = z_bottom, bottom_style=bottom_style, material_allowance = 0.1 if do_finish_pass else 0.0, rough = False, side = Profile.PROFILE_ON, store_ops = store_ops, name = None if (name == None) else (name + ' Finish Pass'))
         
     def PocketArea(self, a, cutter_index, z_top = 0.0, z_bottom = None, bottom_style = BOTTOM_NORMAL, material_allowance = 0.1, store_ops = False, name = None):
-        tool_radius = self.slot_cutters.tools[cutter_index].diam * 0.5
+        with self.tracer.Span('PocketArea', curves = a.NumCurves(), vertices = AreaData.NumVertices(a)):
+            tool_radius = self.slot_cutters.tools[cutter_index].diam * 0.5
 
-        # test to see if area would disappear when offset inwards
-        check_area = geom.Area(a)
-        check_area.Offset(tool_radius)
-        if check_area.NumCurves() == 0:
-            # there is no point pocketing this area as there would be no toolpath
-            return
+            # test to see if area would disappear when offset inwards
+            check_area = geom.Area(a)
+            check_area.Offset(tool_radius)
+            if check_area.NumCurves() == 0:
+                # there is no point pocketing this area as there would be no toolpath
+                return
          
-        # add the sketch to pocket or profile
-        sketch = cad.NewSketchFromArea(a)
-        sketch.SetVisible(self.geometry_visible)
-        cad.AddUndoably(sketch)
-        
-        # add the tool
-        tool_id, default_tool = self.slot_cutters.AddIfNotAdded(cutter_index)
-        
-        pocket = Pocket.Pocket(sketch.GetID())
-        pocket.tool_number = tool_id
-        pocket.step_over = tool_radius
-        pocket.start_depth = z_top
-        pocket.final_depth = z_bottom
-        pocket.material_allowance = material_allowance
-        pocket.horizontal_feed_rate = default_tool.hfeed
-        pocket.vertical_feed_rate = default_tool.vfeed
-        pocket.spindle_speed = default_tool.spin
-        pocket.step_down = default_tool.rough_step_down
-        pocket.pattern = 0
-        pocket.surface = 0
-        if name != None:
-            pocket.title = name + ' Area Clear'
-            pocket.title_made_from_id = False
-        
-        self.SetDepthOpBottomFromStyle(pocket, bottom_style)
-
-        if store_ops:
-            self.stored_ops.append(pocket)
-        else:
-            cad.AddUndoably(pocket, wx.GetApp().program.operations)
+            # add the sketch to pocket or profile
+            sketch = cad.NewSketchFromArea(a)
+            sketch.SetVisible(self.geometry_visible)
+            self.AddUndoably(sketch)
+        
+            # add the tool
+            tool_id, default_tool = self.slot_cutters.AddIfNotAdded(cutter_index)
+        
+            pocket = Pocket.Pocket(sketch.GetID())
+            pocket.tool_number = tool_id
+            pocket.step_over = tool_radius
+            pocket.start_depth = z_top
+            pocket.final_depth = z_bottom
+            pocket.material_allowance = material_allowance
+            pocket.horizontal_feed_rate = default_tool.hfeed
+            pocket.vertical_feed_rate = default_tool.vfeed
+            pocket.spindle_speed = default_tool.spin
+            pocket.step_down = default_tool.rough_step_down
+            pocket.pattern = 0
+            pocket.surface = 0
+            if name != None:
+                pocket.title = name + ' Area Clear'
+                pocket.title_made_from_id = False
+        
+            self.SetDepthOpBottomFromStyle(pocket, bottom_style)
+
+            if store_ops:
+                self.stored_ops.append(pocket)
+            else:
+                self.AddUndoably(pocket, wx.GetApp().program.operations)
 
     def SetDepthOpBottomFromStyle(self, depthop, bottom_style):
         if bottom_style == BOTTOM_THROUGH:
@@ -613,15 +961,24 @@ class AutoProgram:
         elif bottom_style == BOTTOM_POCKET:
             depthop.z_finish_depth = 0.1
 
+    def AddUndoably(self, object, owner = None):
+        # adds the object to the document, in the run's history
+        self.document_changed = True
+        if owner == None:
+            cad.AddUndoably(object)
+        else:
+            cad.AddUndoably(object, owner)
+        
     def ClearProgram(self):
         if self.failure:
             return
         
         # check if there are any exisiting operations in the program
-        if wx.GetApp().program.operations.GetNumChildren() > 0:
+        if wx.GetApp().program.operations.GetNumChildren() > 0 and not self.headless:
             if wx.MessageBox('The program already has operations. Do you want to continue and overwrite them?', style = wx.YES_NO) != wx.YES:
                 return
         
+        self.document_changed = True
         for object in wx.GetApp().program.tools.GetChildren():
             cad.DeleteUndoably(object)
         for object in wx.GetApp().program.patterns.GetChildren():
@@ -645,10 +1002,10 @@ class AutoProgram:
         mat.Translate(geom.Point3D(0,0,-thickness))
         cuboid.Transform(mat)
         cuboid.SetVisible(False)
-        cad.AddUndoably(cuboid)
+        self.AddUndoably(cuboid)
         new_stock = Stock.Stock()
         new_stock.solids.append(cuboid.GetID())
-        cad.AddUndoably(new_stock, wx.GetApp().program.stocks)
+        self.AddUndoably(new_stock, wx.GetApp().program.stocks)
         self.thickness = thickness
         self.stock = cuboid
         
@@ -682,7 +1039,9 @@ class AutoProgram:
         mat = geom.Matrix()
         # move down with bottom left corner at x_margin, y_margin and z top at z0
         mat.Translate(geom.Point3D(self.x_margin - part_box.MinX(), self.y_margin - part_box.MinY(), -part_box.MinZ() - self.thickness))
+        self.document_changed = True
         cad.TransformUndoably(self.part, mat)
+        FourAxisCache.tessellations.Modified(self.part)
             
     def GetPart(self):
         for object in cad.GetObjects():
@@ -731,14 +1090,7 @@ class AutoProgram:
         return max_diam
     
     def PocketCanBeDoneWithProfileOp(self, a, cutter_index):
-        # if the area is a simple single curve and disappears when offset inwards by the cutter diameter, then it's fine to just profile the area
-        if a.NumCurves() == 1:
-            a_copy = geom.Area(a)
-            a_copy.Offset(self.slot_cutters.tools[cutter_index].diam * 0.95)
-            if a_copy.NumCurves() == 0:
-                return True
-        
-        return False
+        return RestMachining.PocketCanBeDoneWithProfileOp(a, self.slot_cutters.tools[cutter_index].diam)
         
     def GetSortedCutters(self, cut_depth, rest_machining = False):
         return self.slot_cutters.GetSortedCutters(cut_depth, max_cutter_diameter = None if self.big_rigid_part else BIG_CUTTER_DIAMETER, rest_machining = rest_machining)
@@ -778,67 +1130,25 @@ class AvailableTools:
         self.auto_program = auto_program
         self.name = name
         self.tools = []
+        self.category = ToolLibrary.ToolCategory([])
         self.tool_numbers = tool_numbers
         self.next_index = 0
         
     def ImportToolsForMaterial(self, material):
-        self.tools = []
-        import xml.etree.ElementTree as ET
-        import os
-        this_dir = os.path.dirname(os.path.realpath(__file__))
-        path = this_dir + '/available.tools'
-        tree = ET.parse(path)
-        root = tree.getroot()
-        for child in root:
-            if (child.tag == 'material') and (child.attrib['name'].lower() == material): 
-                for child in child:
-                    name = child.tag
-                    name = name.replace('_', ' ')
-                    if name == self.name:
-                        for child in child:
-                            if child.tag == 'tool':
-                                diam = 0.0
-                                type = TOOL_TYPE_UNDEFINED
-                                rest_machining = False
-                                cutting_length = 0.0
-                                hfeed = 0.0
-                                finish_hfeed = 0.0
-                                spin = 0.0
-                                vfeed = 0.0
-                                rough_step_down = 0.0
-                                finish_step_down = 0.0
-                                active = True
-                                if 'active' in child.attrib:
-                                    active = eval(child.attrib['active'])
-                                if active:
-                                    if 'diam' in child.attrib:
-                                        diam = float(child.attrib['diam'])
-                                    if 'type' in child.attrib:
-                                        type = eval(child.attrib['type'])
-                                    if 'rest_machining' in child.attrib:
-                                        rest_machining = eval(child.attrib['rest_machining'])
-                                    if 'cutting_length' in child.attrib:
-                                        cutting_length = float(child.attrib['cutting_length'])
-                                    if 'hfeed' in child.attrib:
-                                        hfeed = float(child.attrib['hfeed'])
-                                    if 'finish_hfeed' in child.attrib:
-                                        finish_hfeed = float(child.attrib['finish_hfeed'])
-                                    if 'spin' in child.attrib:
-                                        spin = float(child.attrib['spin'])
-                                    if 'vfeed' in child.attrib:
-                                        vfeed = float(child.attrib['vfeed'])
-                                    if 'rough_step_down' in child.attrib:
-                                        rough_step_down = float(child.attrib['rough_step_down'])
-                                    if 'finish_step_down' in child.attrib:
-                                        finish_step_down = float(child.attrib['finish_step_down'])
-                                    self.tools.append(AvailableTool(diam, type, rest_machining, cutting_length, hfeed, finish_hfeed, spin, vfeed, rough_step_down, finish_step_down))
+        path = available_tools_path
+        if path == None:
+            import os
+            this_dir = os.path.dirname(os.path.realpath(__file__))
+            path = this_dir + '/available.tools'
+        self.category = ToolLibrary.GetLibrary(path).GetCategory(material, self.name)
+        self.tools = [AvailableTool(*args) for args in self.category.tools]
         
     def AddIfNotAdded(self, tool_index):
         tool = self.tools[tool_index]
         if tool.added_tool_id != None:
             return tool.added_tool_id, tool
         if self.next_index >= len(self.tool_numbers):
-            self.failure = 'no more ' + self.name + ' available!\ntrying to add: ' + self.tools[tool_index].GetName()
+            self.auto_program.failure = 'no more ' + self.name + ' available!\ntrying to add: ' + self.tools[tool_index].GetName()
             tool_id = 0
         else:
             tool_id = self.tool_numbers[self.next_index]
@@ -847,50 +1157,15 @@ class AvailableTools:
         return tool_id, tool
     
     def GetToolOfDiameter(self, d, cut_depth, precision):
-        for index in range(0, len(self.tools)):
-            if self.tools[index].cutting_length < cut_depth:
-                continue
-            tool_diameter = self.tools[index].diam
-            if math.fabs(tool_diameter - d) < precision:
-                return index
-        return None
+        return self.category.GetToolOfDiameter(d, cut_depth, precision)
     
     def GetDiamMapShortest(self, cut_depth, max_cutter_diameter, rest_machining):
         # map of diameter to found index for checking smallest cutter length
-        index = 0
-        diam_map = {} # map of diameter to found index for checking smallest cutter length
-        for tool in self.tools:
-            if max_cutter_diameter == None or max_cutter_diameter >= tool.diam:
-                if (tool.cutting_length >= cut_depth) and ((rest_machining == False) or (tool.rest_machining == True)):
-                    if tool.diam in diam_map:
-                        # tool diameter already in map
-                        existing_tool = self.tools[diam_map[tool.diam]]
-                        if tool.cutting_length < existing_tool.cutting_length:
-                            # replace map enty with shorter tool
-                            diam_map[tool_diam] = index
-                    else:
-                        diam_map[tool.diam] = index
-            index += 1
-        return diam_map
+        return self.category.GetDiamMapShortest(cut_depth, max_cutter_diameter, rest_machining)
             
     def GetSortedCutters(self, cut_depth, max_cutter_diameter, rest_machining):
-        diam_map = self.GetDiamMapShortest(cut_depth, max_cutter_diameter, rest_machining)
-            
-        # make the list from the map
-        cutters = []
-        for d in sorted(diam_map.keys(), reverse = True):
-            cutters.append(diam_map[d])
-        return cutters
-
-hash_axis = None
-hash_axis2 = None
- 
-def xyhash(p):
-    global hash_axis
-    global hash_axis2
-    dx = p * hash_axis
-    dy = p * hash_axis2
-    return dx + dy*1000.0
+        # list of tool indices, biggest diameter first
+        return self.category.GetSortedCutters(cut_depth, max_cutter_diameter, rest_machining)
 
 class Hole:
     # used to group found features
@@ -900,25 +1175,26 @@ class Hole:
         self.bottom_z = bottom_z
         self.pts = [circle.c]
         
-    def AddHole(self, hole, precision):
-        # returns True if it added the hole's position to this hole
+    def IsSameAs(self, hole, precision):
         if math.fabs(self.diameter - hole.diameter) > precision:
             return False
         if math.fabs(self.top_z - hole.top_z) > precision:
             return False
         if math.fabs(self.bottom_z - hole.bottom_z) > precision:
             return False
+        return True
+        
+    def AddHole(self, hole, precision):
+        # returns True if it added the hole's position to this hole
+        if not self.IsSameAs(hole, precision):
+            return False
         self.pts += hole.pts
         return True
     
     
     def SortPoints2(self, axis):
-        global hash_axis
-        global hash_axis2
-        hash_axis = axis
-        hash_axis2 = ~axis
-        
-        self.pts.sort(key = xyhash)
+        axis2 = ~axis
+        self.pts.sort(key = lambda p: p * axis + (p * axis2) * 1000.0)
     
     def SortPoints(self):
         box = geom.Box()
@@ -929,10 +1205,116 @@ class Hole:
             self.SortPoints2(geom.Point(1,0))
         else:
             self.SortPoints2(geom.Point(0,1))
+            
+    def OptimizePoints(self, time_budget):
+        # sort the points to give a starting order, then reduce the rapid distance between them
+        # returns the rapid distance before and after
+        self.SortPoints()
+        self.pts, before, after = DrillPath.OptimizeOrder(self.pts, time_budget = time_budget)
+        return before, after
     
     def __str__(self):
         return 'Hole - diameter = ' + str(self.diameter) + ' at pts: ' + str(self.pts)
 
+class HoleIndex:
+    # groups holes the same way as calling Hole.AddHole on each existing hole in turn, but without comparing with every group
+    # groups are kept in cells keyed by diameter, top_z and bottom_z divided by precision,
+    # so a matching group can only be in the same cell or one of its neighbours
+    def __init__(self, precision):
+        self.precision = precision
+        self.cell_size = precision * 1.000001 if precision > 0.0 else None # a little bigger, so rounding can't move a match two cells away
+        self.holes = []
+        self.cells = {} # cell key to list of indices into self.holes
+        self.candidates = {} # cell key to sorted list of indices into self.holes, for the cell and its neighbours
+        
+    def GetCellKey(self, hole):
+        if self.cell_size == None:
+            return (hole.diameter, hole.top_z, hole.bottom_z)
+        return (int(math.floor(hole.diameter / self.cell_size)), int(math.floor(hole.top_z / self.cell_size)), int(math.floor(hole.bottom_z / self.cell_size)))
+    
+    def GetNeighbourKeys(self, key):
+        if self.cell_size == None:
+            return [key]
+        keys = []
+        for d0 in (-1, 0, 1):
+            for d1 in (-1, 0, 1):
+                for d2 in (-1, 0, 1):
+                    keys.append((key[0] + d0, key[1] + d1, key[2] + d2))
+        return keys
+    
+    def GetCandidates(self, key):
+        if not key in self.candidates:
+            indices = []
+            for neighbour_key in self.GetNeighbourKeys(key):
+                if neighbour_key in self.cells:
+                    indices += self.cells[neighbour_key]
+            indices.sort()
+            self.candidates[key] = indices
+        return self.candidates[key]
+        
+    def Add(self, hole):
+        # adds the hole's positions to the first group which matches it, or starts a new group
+        key = self.GetCellKey(hole)
+        for index in self.GetCandidates(key):
+            if self.holes[index].IsSameAs(hole, self.precision):
+                self.holes[index].pts += hole.pts
+                return
+            
+        index = len(self.holes)
+        self.holes.append(hole)
+        if not key in self.cells:
+            self.cells[key] = []
+        self.cells[key].append(index)
+        for neighbour_key in self.GetNeighbourKeys(key):
+            if neighbour_key in self.candidates:
+                self.candidates[neighbour_key].append(index) # the new index is the biggest, so the list stays sorted
+
+class GeometryJob:
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def Run(self):
+        try:
+            self.result = self.function(*self.args)
+        except BaseException as e:
+            self.error = e
+        self.done.set()
+
+class GeometryWorker:
+    # one thread doing the geometry jobs of a run, one after another, so geom is only used from one thread at a time,
+    # and a thread isn't started for each job
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target = self.Work)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def Work(self):
+        while True:
+            job = self.jobs.get()
+            if job == None:
+                return
+            job.Run()
+
+    def Start(self, function, args):
+        # returns a GeometryJob, whose done event is set when it has finished
+        job = GeometryJob(function, args)
+        self.jobs.put(job)
+        return job
+
+    def Stop(self):
+        # the thread finishes after the job it's doing, if any
+        self.jobs.put(None)
+
+def GetProgramObjectIDs():
+    # returns the ids of the program's tools, stocks and operations
+    program = wx.GetApp().program
+    return [[object.GetID() for object in objects.GetChildren()] for objects in [program.tools, program.stocks, program.operations]]
+
 def FindTagPoint(curve, line):
     # line defined by two lists of two coordinates
     c2 = geom.Curve()
@@ -968,10 +1350,12 @@ def curve_str(self):
     area.Append(self)
     return str(area)
     
-import platform
-if platform.system() == 'Windows':
-    geom.Area.__str__ = area_str
-    geom.Curve.__str__ = curve_str
+def EnableDebugStr():
+    # makes str of an area or curve show it in the viewer, for debugging; only on Windows, as the paths are
+    import platform
+    if platform.system() == 'Windows':
+        geom.Area.__str__ = area_str
+        geom.Curve.__str__ = curve_str
 
 def AddSketch(a):
     sketch = cad.NewSketchFromArea(self.shadow)
@@ -6,15 +6,10 @@ sim_dir = os.path.realpath(this_dir + '/../dsim')
 sys.path.append(sim_dir)
 
 import wx
-from   wx.adv import SplashScreen as SplashScreen
 from SimApp import SimApp
-from Ribbon import RB
 from Ribbon import Ribbon
-import step
-import geom
 import cad
 import time
-import math
     
 class HeeksExpertApp(SimApp):
     def __init__(self):
@@ -33,7 +28,8 @@ class HeeksExpertApp(SimApp):
         Ribbon.AddToolBarTool(toolbar, 'Split Test', 'split', 'Split to Smaller Triangles', self.SplitTest)
         self.bitmap_path = save_bitmap_path
         
-    def MakeUnwrappedSolid(self, e):
+    def GetSolids(self, pick_message):
+        # returns the selected stl solids, or asks for some to be picked
         solids = []
         for object in cad.GetSelectedObjects():
             if object.GetIDGroupType() == cad.OBJECT_TYPE_STL_SOLID:
@@ -46,54 +42,107 @@ class HeeksExpertApp(SimApp):
             if wx.GetApp().IsSolidApp():
                 import step
                 filter.AddType(step.GetSolidType())
-            wx.GetApp().PickObjects('Pick solids to unwrap', filter, False)
+            wx.GetApp().PickObjects(pick_message, filter, False)
         
             for object in cad.GetSelectedObjects():
                 if object.GetIDGroupType() == cad.OBJECT_TYPE_STL_SOLID:
                     solids.append(object)
                     
-        if len(solids) > 0:
-            cad.StartHistory('Unwrap Solids')
+        return solids
+        
+    def RunSolidJobs(self, title, solids, job_function, job_args):
+        # runs job_function for each solid in worker processes, with a progress dialog which can cancel them
+        # each job is given the solid's triangles as stl file contents, followed by job_args, and returns the path of a new stl file
+        # the new solids are added in one undo step, once all the jobs have finished
+        import multiprocessing
+        import StlData
+        import Unwrap
+        import FourAxisCache
+        
+        jobs = []
+        for object in solids:
+            data = FourAxisCache.tessellations.GetTris(object, Unwrap.TRIS_TOLERANCE).data
+            jobs.append((data,) + job_args)
             
-            for object in solids:
-                stl = object.GetTris(0.01)
-                smaller_tris_stl = stl.SplitToSmallerTriangles(0.5)
-                unwrapped_stl = smaller_tris_stl.Unwrap(10.0)
-                new_object = cad.NewStlSolidFromStl(unwrapped_stl)
-                cad.AddUndoably(new_object)
-                
-            cad.EndHistory()
+        pool = multiprocessing.Pool(min(len(jobs), multiprocessing.cpu_count()))
+        results = [pool.apply_async(job_function, (job,)) for job in jobs]
+        pool.close()
+        
+        progress_dlg = wx.ProgressDialog(title, title + '...', maximum = len(jobs), parent = self.frame, style = wx.PD_APP_MODAL | wx.PD_AUTO_HIDE | wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME)
+        cancelled = False
+        try:
+            while True:
+                done = len([result for result in results if result.ready()])
+                if done == len(results):
+                    break
+                keep_going, skip = progress_dlg.Update(done, '%i of %i solids done' % (done, len(results)))
+                if not keep_going:
+                    cancelled = True
+                    break
+                time.sleep(0.1)
+        finally:
+            progress_dlg.Destroy()
             
-    def SplitTest(self, e):
-        solids = []
-        for object in cad.GetSelectedObjects():
-            if object.GetIDGroupType() == cad.OBJECT_TYPE_STL_SOLID:
-                solids.append(object)
-                
-        if len(solids) == 0:
-            cad.ClearSelection(True)
-            filter = cad.Filter()
-            filter.AddType(cad.OBJECT_TYPE_STL_SOLID)
-            if wx.GetApp().IsSolidApp():
-                import step
-                filter.AddType(step.GetSolidType())
-            wx.GetApp().PickObjects('Pick solids to split', filter, False)
+        failure = None
+        if not cancelled:
+            try:
+                paths = [result.get() for result in results]
+            except Exception as e:
+                failure = str(e)
+        if cancelled or failure != None:
+            pool.terminate()
+            pool.join()
+            # remove the files of the jobs which finished
+            for result in results:
+                if result.ready() and result.successful():
+                    os.remove(result.get())
+            if failure != None:
+                wx.MessageBox(title + ' failed: ' + failure)
+            return
+        pool.join()
         
-            for object in cad.GetSelectedObjects():
-                if object.GetIDGroupType() == cad.OBJECT_TYPE_STL_SOLID:
-                    solids.append(object)
-                    
+        # load the files one at a time, so only one new mesh is held outside the document
+        cad.StartHistory(title)
+        for path in paths:
+            try:
+                new_object = cad.NewStlSolidFromStl(StlData.StlFromFile(path))
+            finally:
+                os.remove(path)
+            cad.AddUndoably(new_object)
+        cad.EndHistory()
+        
+    def MakeUnwrappedSolid(self, e):
+        import Unwrap
+        from HeeksConfig import HeeksConfig
+        config = HeeksConfig()
+        adaptive = config.ReadBool('UnwrapAdaptive', False) # only split triangles as much as needed for the unwrap tolerance
+        tolerance = config.ReadFloat('UnwrapTolerance', Unwrap.UNWRAP_TOLERANCE) if adaptive else None
+        solids = self.GetSolids('Pick solids to unwrap')
         if len(solids) > 0:
-            cad.StartHistory('Split Solids')
+            self.RunSolidJobs('Unwrap Solids', solids, Unwrap.UnwrapJob, (Unwrap.SPLIT_LENGTH, Unwrap.UNWRAP_VALUE, tolerance))
             
-            for object in solids:
-                stl = object.GetTris(0.01)
-                smaller_tris_stl = stl.SplitToSmallerTriangles(0.5)
-                new_object = cad.NewStlSolidFromStl(smaller_tris_stl)
-                cad.AddUndoably(new_object)
-                
-            cad.EndHistory()
+    def SplitTest(self, e):
+        import Unwrap
+        solids = self.GetSolids('Pick solids to split')
+        if len(solids) > 0:
+            self.RunSolidJobs('Split Solids', solids, Unwrap.SplitJob, (Unwrap.SPLIT_LENGTH,))
             
-app = HeeksExpertApp()
-app.MainLoop()
+def BecomeHeeksExpertApp(app):
+    # for Run.py, which shows the splash from a plain wx.App while this module, and SimApp, cad and geom, are imported
+    # makes app a HeeksExpertApp and makes its main frame, so there's still only the one wx.App
+    # SimApp.__init__ sets up the app's members, then calls wx.App.__init__, which app has already done, so that's skipped
+    app.__class__ = HeeksExpertApp
+    wx_app_init = wx.App.__init__
+    wx.App.__init__ = lambda *args, **kwargs: None
+    try:
+        HeeksExpertApp.__init__(app)
+    finally:
+        wx.App.__init__ = wx_app_init
+    if not app.OnInit():
+        raise RuntimeError('Heeks 4 Axis failed to start')
+
+if __name__ == '__main__':
+    # worker processes import this file again, so only start the app when it's run
+    app = HeeksExpertApp()
+    app.MainLoop()
 
@@ -0,0 +1,189 @@
+# Headless batch runner for AutoProgram
+# Runs the whole Auto Program pipeline on a list of STL files, one part per worker process
+# and writes a G-Code file and a JSON summary for each part.
+#
+# usage: python FourAxisBatch.py [--settings settings.json] [--output folder] [--processes N] part.stl folder ...
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+for folder in ['PyCAD', 'PyCAM', 'dsim']:
+    path = os.path.realpath(this_dir + '/../' + folder)
+    if not path in sys.path:
+        sys.path.append(path)
+
+# the AutoProgram fields which can be given in the settings file, and their types
+SETTINGS = {
+    'material':str,
+    'x_margin':float,
+    'y_margin':float,
+    'tag_width':float,
+    'tag_height':float,
+    'tag_angle':float,
+    'tag_y_margin':float,
+    'precision':float,
+    'big_rigid_part':bool,
+    'make_area_operations':bool,
+    'use_part_thickness':bool,
+    'create_gcode':bool,
+    }
+
+def ReadSettings(path):
+    # read a json file of AutoProgram settings, for example { "material":"Acetal", "x_margin":10.0 }
+    f = open(path, 'r')
+    settings = json.load(f)
+    f.close()
+    for name in settings:
+        if not name in SETTINGS:
+            raise ValueError('unknown setting: ' + name)
+        settings[name] = SETTINGS[name](settings[name])
+    return settings
+
+def FindStlFiles(paths):
+    # expand any folders into the stl files they contain
+    stl_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if filename.lower().endswith('.stl'):
+                    stl_files.append(os.path.join(path, filename))
+        else:
+            stl_files.append(path)
+    return stl_files
+
+def MakeBatchApp():
+    # the operations expect wx.GetApp().program, and AutoProgram uses the app's CopyUndoably and OnUndo, so each worker has
+    # the app Heeks 4 Axis runs, but whose OnInit only makes a new program, instead of the main frame
+    import cad
+    import Program
+    import FourAxisApp
+
+    class App(FourAxisApp.HeeksExpertApp):
+        def OnInit(self):
+            self.program = Program.Program()
+            self.program.add_initial_children()
+            cad.PyIncref(self.program)
+            cad.AddUndoably(self.program)
+            return True
+
+    return App()
+
+def ProcessPart(job):
+    # runs in a worker process, returns the summary dictionary for the part
+    stl_path, settings, output_folder, suffix, trace, record = job
+
+    name = os.path.splitext(os.path.basename(stl_path))[0]
+    summary = {
+        'part':name,
+        'stl':stl_path,
+        'gcode':None,
+        'failure':None,
+        'warnings':[],
+        }
+    start_time = time.time()
+
+    try:
+        app = MakeBatchApp()
+
+        import cad
+        import FourAxis
+
+        cad.Import(stl_path)
+
+        gcode_path = os.path.join(output_folder, name + suffix)
+        app.program.output_file_name_follows_data_file = False
+        app.program.output_file = gcode_path
+
+        auto_program = FourAxis.AutoProgram()
+        auto_program.headless = True
+        auto_program.want_time_print = False
+        auto_program.parallel_rest_machining = False # the batch workers can't start processes of their own
+        for setting in settings:
+            setattr(auto_program, setting, settings[setting])
+        if trace:
+            auto_program.trace_file = os.path.join(output_folder, name + '.trace.json')
+        if record:
+            auto_program.record_file = os.path.join(output_folder, name + '.record.zip')
+
+        auto_program.Run()
+
+        summary['failure'] = auto_program.failure
+        summary['warnings'] = auto_program.warnings
+        summary['stage_times'] = auto_program.tracer.GetStageTimes()
+        if auto_program.part != None and auto_program.failure == None:
+            summary['thickness'] = auto_program.thickness
+            summary['operations'] = app.program.operations.GetNumChildren()
+            summary['drill_travel'] = auto_program.drill_travel
+            summary['offset_cache'] = {'hits':auto_program.offset_cache.hits, 'misses':auto_program.offset_cache.misses}
+            summary['tools'] = [tool.GetName() for tool in auto_program.slot_cutters.tools + auto_program.drills.tools if tool.added_tool_id != None]
+            if auto_program.create_gcode:
+                summary['gcode'] = gcode_path
+    except Exception as e:
+        import traceback
+        summary['failure'] = 'error during Auto Program: ' + str(e) + '\n' + traceback.format_exc()
+
+    summary['time'] = time.time() - start_time
+
+    f = open(os.path.join(output_folder, name + '.json'), 'w')
+    json.dump(summary, f, indent = 2)
+    f.close()
+
+    return summary
+
+def RunBatch(stl_files, settings, output_folder, processes = None, suffix = '.tap', trace = False, record = False):
+    # returns a list of summaries, in the order the parts finished
+    if not os.path.isdir(output_folder):
+        os.makedirs(output_folder)
+
+    jobs = [(stl_path, settings, output_folder, suffix, trace, record) for stl_path in stl_files]
+
+    # each part gets a fresh process, so nothing is left over in the cad document from the previous part
+    pool = multiprocessing.Pool(processes, maxtasksperchild = 1)
+    summaries = []
+    try:
+        for summary in pool.imap_unordered(ProcessPart, jobs):
+            if summary['failure']:
+                print(summary['part'] + ' FAILED: ' + summary['failure'])
+            else:
+                print(summary['part'] + ' done in %0.2f seconds' % summary['time'] + (', %i warnings' % len(summary['warnings']) if summary['warnings'] else ''))
+            summaries.append(summary)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    pool.join()
+    return summaries
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Create Auto Program G-Code for STL files without the GUI')
+    parser.add_argument('paths', nargs = '+', help = 'STL files or folders of STL files')
+    parser.add_argument('--settings', help = 'json file of AutoProgram settings')
+    parser.add_argument('--output', default = 'output', help = 'folder for the G-Code and summary files')
+    parser.add_argument('--suffix', default = '.tap', help = 'file suffix for the G-Code files')
+    parser.add_argument('--trace', action = 'store_true', help = 'write a Chrome trace file of the stages for each part')
+    parser.add_argument('--record', action = 'store_true', help = 'write a file of the part, settings and areas for each part, for FourAxisReplay.py')
+    parser.add_argument('--processes', type = int, default = None, help = 'number of worker processes, defaults to the number of CPUs')
+    args = parser.parse_args()
+
+    settings = {}
+    if args.settings:
+        settings = ReadSettings(args.settings)
+
+    stl_files = FindStlFiles(args.paths)
+    if len(stl_files) == 0:
+        print('no STL files found')
+        return 1
+
+    summaries = RunBatch(stl_files, settings, args.output, args.processes, args.suffix, args.trace, args.record)
+
+    failures = [summary for summary in summaries if summary['failure']]
+    print('%i parts, %i failed' % (len(summaries), len(failures)))
+    return 1 if len(failures) > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
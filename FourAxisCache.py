@@ -0,0 +1,226 @@
+# cache of the slow geometry stages of AutoProgram; tessellation, shadow and machining areas
+# the tessellation cache is used by the Unwrap Solid and Split Test commands too
+# the shadow and machining areas are keyed by a content hash of the part mesh plus precision, so they are found
+# again when only the tags, margins or other settings have changed, even if the part has been moved.
+# there is an in-memory tier, with least recently used entries removed when it gets too big,
+# and a tier on disk, so the geometry is still there next time the program is started.
+
+import os
+import zlib
+import pickle
+from collections import OrderedDict
+import AreaData
+import StlData
+
+MEMORY_LIMIT = 256 * 1024 * 1024 # bytes
+DISK_LIMIT = 1024 * 1024 * 1024 # bytes
+DISK_FOLDER = os.path.join(os.path.expanduser('~'), '.Heeks4Axis', 'cache')
+
+class MachiningArea:
+    # stands in for the machining areas returned by Stl.GetMachiningAreas
+    def __init__(self, area, top):
+        self.area = area
+        self.top = top
+
+class LruCache:
+    def __init__(self, limit):
+        self.limit = limit
+        self.size = 0
+        self.entries = OrderedDict() # key to ( value, size )
+
+    def Get(self, key):
+        if not key in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+
+    def Put(self, key, value, size):
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        if size > self.limit:
+            return
+        self.entries[key] = (value, size)
+        self.size += size
+        while self.size > self.limit:
+            old_key, (old_value, old_size) = self.entries.popitem(last = False)
+            self.size -= old_size
+
+    def Clear(self):
+        self.entries.clear()
+        self.size = 0
+
+class DiskCache:
+    def __init__(self, folder, limit, extension = '.geom'):
+        self.folder = folder
+        self.limit = limit
+        self.extension = extension
+
+    def GetPath(self, key):
+        return os.path.join(self.folder, key + self.extension)
+
+    def Get(self, key):
+        path = self.GetPath(key)
+        try:
+            f = open(path, 'rb')
+            data = f.read()
+            f.close()
+            os.utime(path, None) # most recently used
+            return pickle.loads(zlib.decompress(data))
+        except Exception:
+            return None
+
+    def Put(self, key, value):
+        try:
+            if not os.path.isdir(self.folder):
+                os.makedirs(self.folder)
+            path = self.GetPath(key)
+            f = open(path + '.tmp', 'wb')
+            f.write(zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+            f.close()
+            os.replace(path + '.tmp', path)
+            self.RemoveOldest()
+        except Exception as e:
+            print('failed to write to geometry cache: ' + str(e))
+
+    def RemoveOldest(self):
+        files = []
+        total = 0
+        for filename in os.listdir(self.folder):
+            if filename.endswith(self.extension):
+                path = os.path.join(self.folder, filename)
+                size = os.path.getsize(path)
+                files.append((os.path.getmtime(path), size, path))
+                total += size
+        files.sort()
+        for mtime, size, path in files:
+            if total <= self.limit:
+                break
+            os.remove(path)
+            total -= size
+
+class Tessellation:
+    # the triangles of a solid, as a geom.Stl and as binary stl file contents
+    def __init__(self, stl, data, tolerance):
+        self.stl = stl
+        self.data = data
+        self.tolerance = tolerance
+        self.mesh_keys = {} # precision to ( mesh_key, origin )
+
+    def GetMeshKey(self, precision):
+        if not precision in self.mesh_keys:
+            self.mesh_keys[precision] = StlData.MeshKey(self.data, precision)
+        return self.mesh_keys[precision]
+
+class TessellationCache:
+    # the triangles from object.GetTris, kept so the same solid isn't tessellated again by Unwrap Solid, Split Test or AutoProgram
+    # an entry is for an object ID, the number of times the object has been modified, its box and the tolerance
+    # Modified should be called after transforming or editing a solid, and the box catches changes made elsewhere
+    # an entry made with a finer tolerance is used when a coarser one is asked for
+    def __init__(self, memory_limit = MEMORY_LIMIT):
+        self.memory = LruCache(memory_limit)
+        self.modifications = {} # object ID to number of times modified
+        self.hits = 0
+        self.misses = 0
+
+    def GetObjectKey(self, object):
+        box = object.GetBox()
+        return (object.GetID(), self.modifications.get(object.GetID(), 0), (box.MinX(), box.MinY(), box.MinZ(), box.MaxX(), box.MaxY(), box.MaxZ()))
+
+    def GetTris(self, object, tolerance):
+        # returns a Tessellation of the object, within tolerance
+        object_key = self.GetObjectKey(object)
+        best = None
+        for key in self.memory.entries:
+            if key[0] == object_key and key[1] <= tolerance and (best == None or key[1] > best[1]):
+                best = key
+        if best != None:
+            self.hits += 1
+            return self.memory.Get(best)
+
+        self.misses += 1
+        stl = object.GetTris(tolerance)
+        tessellation = Tessellation(stl, StlData.CompactStlBytes(StlData.StlToBytes(stl)), tolerance)
+        self.memory.Put((object_key, tolerance), tessellation, len(tessellation.data) * 2) # about as much again for the geom.Stl
+        return tessellation
+
+    def Modified(self, object):
+        # stops the object's old triangles being used
+        self.modifications[object.GetID()] = self.modifications.get(object.GetID(), 0) + 1
+        for key in list(self.memory.entries.keys()):
+            if key[0][0] == object.GetID():
+                self.memory.size -= self.memory.entries.pop(key)[1]
+
+    def GetReport(self):
+        return 'tessellation cache: %i hits, %i misses' % (self.hits, self.misses)
+
+    def Clear(self):
+        self.memory.Clear()
+
+class GeometryCache:
+    def __init__(self, folder = DISK_FOLDER, memory_limit = MEMORY_LIMIT, disk_limit = DISK_LIMIT):
+        self.memory = LruCache(memory_limit)
+        self.disk = DiskCache(folder, disk_limit)
+
+    def GetTris(self, object, precision):
+        # returns stl, mesh_key, origin
+        tessellation = tessellations.GetTris(object, precision)
+        mesh_key, origin = tessellation.GetMeshKey(precision)
+        return tessellation.stl, mesh_key, origin
+
+    def GetEntry(self, mesh_key):
+        entry = self.memory.Get(mesh_key)
+        if entry == None:
+            entry = self.disk.Get(mesh_key)
+            if entry != None:
+                self.memory.Put(mesh_key, entry, EntrySize(entry))
+        return entry
+
+    def PutEntryItem(self, mesh_key, name, value):
+        entry = self.GetEntry(mesh_key)
+        if entry == None:
+            entry = {}
+        else:
+            entry = dict(entry)
+        entry[name] = value
+        self.memory.Put(mesh_key, entry, EntrySize(entry))
+        self.disk.Put(mesh_key, entry)
+
+    def GetShadow(self, mesh_key, origin):
+        entry = self.GetEntry(mesh_key)
+        if entry == None or not 'shadow' in entry:
+            return None
+        stored_origin, data = entry['shadow']
+        return AreaData.AreaFromData(data, origin[0] - stored_origin[0], origin[1] - stored_origin[1])
+
+    def PutShadow(self, mesh_key, origin, area):
+        self.PutEntryItem(mesh_key, 'shadow', (origin, AreaData.AreaToData(area)))
+
+    def GetMachiningAreas(self, mesh_key, origin):
+        entry = self.GetEntry(mesh_key)
+        if entry == None or not 'machining_areas' in entry:
+            return None
+        stored_origin, items = entry['machining_areas']
+        dx = origin[0] - stored_origin[0]
+        dy = origin[1] - stored_origin[1]
+        dz = origin[2] - stored_origin[2]
+        return [MachiningArea(AreaData.AreaFromData(data, dx, dy), top + dz) for top, data in items]
+
+    def PutMachiningAreas(self, mesh_key, origin, machining_areas):
+        items = [(ma.top, AreaData.AreaToData(ma.area)) for ma in machining_areas]
+        self.PutEntryItem(mesh_key, 'machining_areas', (origin, items))
+
+    def Clear(self):
+        self.memory.Clear()
+
+def EntrySize(entry):
+    size = 0
+    if 'shadow' in entry:
+        size += AreaData.DataSize(entry['shadow'][1])
+    if 'machining_areas' in entry:
+        for top, data in entry['machining_areas'][1]:
+            size += AreaData.DataSize(data)
+    return size
+
+# one cache of each, shared by every AutoProgram run and the Unwrap Solid and Split Test commands
+tessellations = TessellationCache()
+cache = GeometryCache()
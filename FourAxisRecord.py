@@ -0,0 +1,109 @@
+# recording of the inputs and intermediate areas of an Auto Program run, for replaying the slow stages without the GUI
+# it's only done when AutoProgram.record_file is set, RecordFile in the config, then everything goes in one zip file:
+#   settings                     the AutoProgram settings
+#   part.stl                     the part mesh, after Move Part, as binary stl
+#   shadow                       the shadow area
+#   machining_areas              list of ( area, top ), as returned by GetMachiningAreas
+#   rest_machine/001/input       ( area, area_done, cutters, do_finish_pass ) given to RestMachining.PlanRestMachine
+#   rest_machine/001/cutter 1/a  the area cut by the first cutter, and cutter 1/area_remaining what's left after it
+# areas are stored as AreaData, everything but the mesh is pickled; FourAxisReplay.py runs the stages again from the file
+#
+# recorder = FourAxisRecord.Recorder('part.zip')
+# recorder.PutArea('shadow', shadow)
+# recorder.Close()
+
+import pickle
+import zipfile
+import AreaData
+
+class Recorder:
+    # writes to the zip file at path as it goes, or without a path keeps the entries, for sending back from a worker process
+    def __init__(self, path = None):
+        self.recording = True
+        self.zip_file = None if path == None else zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        self.entries = [] # ( name, bytes ), when there's no zip file
+        self.groups = {} # group name to number of groups made
+
+    def PutBytes(self, name, data):
+        if self.zip_file == None:
+            self.entries.append((name, data))
+        else:
+            self.zip_file.writestr(name, data)
+
+    def Put(self, name, value):
+        self.PutBytes(name, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def PutArea(self, name, area):
+        self.Put(name, AreaData.AreaToData(area))
+
+    def NewGroup(self, name):
+        # returns a new folder name in the file, like rest_machine/001/
+        self.groups[name] = self.groups.get(name, 0) + 1
+        return '%s/%03i/' % (name, self.groups[name])
+
+    def AddEntries(self, entries, prefix = ''):
+        # adds the entries of a Recorder which had no path
+        for name, data in entries:
+            self.PutBytes(prefix + name, data)
+
+    def Close(self):
+        if self.zip_file != None:
+            self.zip_file.close()
+            self.zip_file = None
+
+class NullRecorder:
+    # does nothing, used when not recording
+    def __init__(self):
+        self.recording = False
+
+    def PutBytes(self, name, data):
+        pass
+
+    def Put(self, name, value):
+        pass
+
+    def PutArea(self, name, area):
+        pass
+
+    def NewGroup(self, name):
+        return ''
+
+    def AddEntries(self, entries, prefix = ''):
+        pass
+
+    def Close(self):
+        pass
+
+null_recorder = NullRecorder()
+
+class Recording:
+    # reads a file written by Recorder
+    def __init__(self, path):
+        self.zip_file = zipfile.ZipFile(path, 'r')
+
+    def GetNames(self):
+        return self.zip_file.namelist()
+
+    def Has(self, name):
+        return name in self.zip_file.namelist()
+
+    def GetBytes(self, name):
+        return self.zip_file.read(name)
+
+    def Get(self, name):
+        return pickle.loads(self.zip_file.read(name))
+
+    def GetArea(self, name):
+        return AreaData.AreaFromData(self.Get(name))
+
+    def GetGroups(self, name):
+        # returns the folder names of the groups made with Recorder.NewGroup( name ), in order
+        groups = set()
+        for entry_name in self.zip_file.namelist():
+            words = entry_name.split('/')
+            if len(words) > 2 and words[0] == name:
+                groups.add(words[1])
+        return [name + '/' + group + '/' for group in sorted(groups, key = int)]
+
+    def Close(self):
+        self.zip_file.close()
@@ -0,0 +1,135 @@
+# runs the slow stages of an Auto Program run again, from a file written with RecordFile set, without the GUI
+# for profiling or debugging a part offline; the results are compared with the recorded ones, see FourAxisRecord.py
+#
+# usage: python FourAxisReplay.py record.zip [--list] [--stage shadow|machining_areas|rest_machine|all] [--group N]
+#                                            [--profile file] [--trace file]
+
+import os
+import sys
+import pickle
+import argparse
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+for folder in ['PyCAD', 'PyCAM', 'dsim']:
+    path = os.path.realpath(this_dir + '/../' + folder)
+    if not path in sys.path:
+        sys.path.append(path)
+
+import geom
+import AreaData
+import StlData
+import Trace
+import RestMachining
+import FourAxisRecord
+
+STAGES = ['shadow', 'machining_areas', 'rest_machine']
+
+def CompareAreas(name, recorded_data, area):
+    # prints the curves and vertices of the replayed area against the recorded one, returns True if they are the same
+    recorded_curves = len(recorded_data)
+    recorded_vertices = sum([len(curve_data) for curve_data in recorded_data])
+    curves = area.NumCurves()
+    vertices = AreaData.NumVertices(area)
+    same = (curves == recorded_curves) and (vertices == recorded_vertices)
+    print('  %-40s %5i curves %7i vertices%s' % (name, curves, vertices, '' if same else ', recorded %i curves %i vertices' % (recorded_curves, recorded_vertices)))
+    return same
+
+class Replay:
+    def __init__(self, recording, tracer):
+        self.recording = recording
+        self.tracer = tracer
+        self.part_stl = None
+        self.differences = 0
+
+    def GetPartStl(self):
+        if self.part_stl == None:
+            with self.tracer.Span('Read Mesh'):
+                self.part_stl = StlData.StlFromBytes(self.recording.GetBytes('part.stl'))
+        return self.part_stl
+
+    def Shadow(self):
+        part_stl = self.GetPartStl()
+        with self.tracer.Span('Shadow') as span:
+            shadow = part_stl.Shadow(geom.Matrix(), False)
+        print('shadow %0.3f s' % span.GetDuration())
+        if not CompareAreas('shadow', self.recording.Get('shadow'), shadow):
+            self.differences += 1
+
+    def MachiningAreas(self):
+        part_stl = self.GetPartStl()
+        with self.tracer.Span('GetMachiningAreas') as span:
+            machining_areas = part_stl.GetMachiningAreas()
+        print('machining areas %0.3f s' % span.GetDuration())
+        recorded = self.recording.Get('machining_areas')
+        if len(recorded) != len(machining_areas):
+            print('  %i machining areas, recorded %i' % (len(machining_areas), len(recorded)))
+            self.differences += 1
+        for i, (ma, (recorded_data, recorded_top)) in enumerate(zip(machining_areas, recorded)):
+            if not CompareAreas('machining area %i top %g' % (i + 1, ma.top), recorded_data, ma.area):
+                self.differences += 1
+
+    def RestMachine(self, group):
+        area_data, area_done_data, cutters, do_finish_pass = self.recording.Get(group + 'input')
+        cutter_infos = [RestMachining.CutterInfo(index, diam, rest_machining) for index, diam, rest_machining in cutters]
+        recorder = FourAxisRecord.Recorder() # keeps the areas, to compare with the recorded ones
+        with self.tracer.Span('RestMachine ' + group.rstrip('/')) as span:
+            actions = RestMachining.PlanRestMachine(AreaData.AreaFromData(area_data), AreaData.AreaFromData(area_done_data), cutter_infos, do_finish_pass, tracer = self.tracer, recorder = recorder)
+        print('%s %0.3f s, %i cutters, %i actions' % (group.rstrip('/'), span.GetDuration(), len(cutters), len(actions)))
+        replayed = {}
+        for name, data in recorder.entries:
+            replayed[name] = AreaData.AreaFromData(pickle.loads(data))
+        for name in sorted(replayed):
+            if self.recording.Has(group + name):
+                if not CompareAreas(name, self.recording.Get(group + name), replayed[name]):
+                    self.differences += 1
+            else:
+                print('  %-40s not recorded' % name)
+                self.differences += 1
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Run Auto Program stages again from a recorded file')
+    parser.add_argument('path', help = 'file written by Auto Program with RecordFile set')
+    parser.add_argument('--list', action = 'store_true', help = 'list what is in the file')
+    parser.add_argument('--stage', default = 'all', choices = STAGES + ['all'], help = 'stage to run')
+    parser.add_argument('--group', type = int, default = None, help = 'for rest_machine, only run this one, counting from 1')
+    parser.add_argument('--profile', help = 'write a cProfile stats file')
+    parser.add_argument('--trace', help = 'write a Chrome trace file')
+    args = parser.parse_args()
+
+    recording = FourAxisRecord.Recording(args.path)
+    if args.list:
+        for name in recording.GetNames():
+            print('%-50s %10i bytes' % (name, recording.zip_file.getinfo(name).file_size))
+        return 0
+
+    settings = recording.Get('settings')
+    print('part recorded with precision %g, material %s' % (settings.get('precision', 0.0), settings.get('material', '')))
+    geom.set_fitarcs(False) # as Auto Program does before making the shadow
+
+    tracer = Trace.Tracer()
+    if args.profile:
+        tracer.StartProfiling()
+    replay = Replay(recording, tracer)
+    stages = STAGES if args.stage == 'all' else [args.stage]
+    if 'shadow' in stages and recording.Has('shadow'):
+        replay.Shadow()
+    if 'machining_areas' in stages and recording.Has('machining_areas'):
+        replay.MachiningAreas()
+    if 'rest_machine' in stages:
+        groups = recording.GetGroups('rest_machine')
+        if args.group != None:
+            groups = groups[args.group - 1:args.group]
+        for group in groups:
+            replay.RestMachine(group)
+    tracer.EndAll()
+    if args.profile:
+        tracer.StopProfiling(args.profile)
+    if args.trace:
+        tracer.WriteChromeTrace(args.trace)
+    recording.Close()
+
+    print('%i differences from the recording' % replay.differences)
+    return 1 if replay.differences > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
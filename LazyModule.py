@@ -0,0 +1,26 @@
+# stands in for a module until one of its attributes is first used, then imports it
+# so a module can name the modules it uses at the top, without loading them until they are needed
+#
+# Profile = LazyModule('Profile')
+# profile = Profile.Profile() # Profile is imported here
+
+import importlib
+
+class LazyModule:
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def GetModule(self):
+        if self.__dict__['_module'] == None:
+            self.__dict__['_module'] = importlib.import_module(self.__dict__['_name'])
+        return self.__dict__['_module']
+
+    def __getattr__(self, name):
+        return getattr(self.GetModule(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.GetModule(), name, value)
+
+    def __repr__(self):
+        return "<lazy module '%s'%s>" % (self.__dict__['_name'], '' if self.__dict__['_module'] == None else ', imported')
@@ -0,0 +1,174 @@
+# the geometry part of AutoProgram.RestMachine
+# it only uses geom, so it can run in a worker process, without wx or the cad document
+# the result is a list of actions, which AutoProgram turns into sketches and operations
+
+import geom
+import AreaData
+import Trace
+import FourAxisRecord
+import Cancel
+from collections import OrderedDict
+
+ACTION_PROFILE = 0 # profile inside the curve, roughing
+ACTION_POCKET = 1 # pocket the area
+ACTION_FINISH = 2 # profile on the curve, finishing
+
+class CutterInfo:
+    # the bits of AvailableTool needed for planning
+    def __init__(self, index, diam, rest_machining):
+        self.index = index
+        self.diam = diam
+        self.rest_machining = rest_machining
+
+class OffsetCache:
+    # remembers the results of geom.Area.Offset, for an area which gets offset by the same radius again and again, like area_done
+    # an area is looked up by the key given for it, such as a version number, which must change whenever the area changes
+    def __init__(self, max_entries = 256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict() # ( area key, radius ) to offset area
+        self.hits = 0
+        self.misses = 0
+
+    def Offset(self, area, radius, key):
+        # returns a new area, which is area offset by radius; area isn't changed
+        entry_key = (key, radius)
+        if entry_key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(entry_key)
+            return geom.Area(self.entries[entry_key])
+
+        self.misses += 1
+        offset_area = geom.Area(area)
+        offset_area.Offset(radius)
+        self.entries[entry_key] = geom.Area(offset_area)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last = False)
+        return offset_area
+
+    def GetReport(self):
+        return 'offset cache: %i hits, %i misses' % (self.hits, self.misses)
+
+def PocketCanBeDoneWithProfileOp(a, diam):
+    # if the area is a simple single curve and disappears when offset inwards by the cutter diameter, then it's fine to just profile the area
+    if a.NumCurves() == 1:
+        a_copy = geom.Area(a)
+        a_copy.Offset(diam * 0.95)
+        if a_copy.NumCurves() == 0:
+            return True
+
+    return False
+
+def PlanRestMachine(area, area_done, cutters, do_finish_pass, offset_cache = None, area_done_key = None, tracer = Trace.null_tracer, recorder = FourAxisRecord.null_recorder, record_prefix = '', cancel = Cancel.null_token):
+    # returns a list of ( action, curve or area, cutter index )
+    # area_done_key should change whenever area_done changes, so offsets of it can be found in offset_cache
+    # the area cut by each cutter and the area remaining after it are given to recorder, named starting with record_prefix
+    # cancel is checked before each cutter
+    if offset_cache == None or area_done_key == None:
+        # area_done doesn't change during the call, so without a key for it its offsets are only kept for the call
+        offset_cache = OffsetCache()
+        area_done_key = 'area_done'
+    actions = []
+
+    # store area remaining to be cut, starting with the machining area's area
+    area_remaining = geom.Area(area)
+    cutter_number = 0
+
+    for cutter in cutters:
+        cancel.Check()
+        if area_remaining.NumCurves() == 0:
+            # nothing left to cut
+            break
+
+        # ignore cutters not marked for rest_machining
+        if not cutter.rest_machining:
+            continue
+
+        with tracer.Span('Cutter %g mm' % cutter.diam, curves = area_remaining.NumCurves()) as span:
+            # start with the remaining area
+            a = geom.Area(area_remaining)
+
+            cutter_radius = cutter.diam * 0.5
+
+            a.Thicken(0.1) # make sausages
+            a.FitArcs()
+            a.UnFitArcs()
+            a.Intersect(area_done) # just keep the bits that are in the material
+            a.Offset(-cutter_radius * 2 - 1) # offset sausage by tool diameter
+            a.FitArcs()
+            a.UnFitArcs()
+            a2 = geom.Area(area_remaining) # take the original
+            a2.Offset(-cutter_radius - 1) # offset it by overlap ( must be at least cutter radius, or peninsulas don't get machined )
+            a.FitArcs()
+            a.UnFitArcs()
+            a.Union(a2) # join with sausage
+
+            # subtract area already done ( areas above this one )
+            a.Subtract(area_done)
+
+            # offset it inwards and outwards to remove pointless small bits
+            a.Offset(cutter_radius)
+            a.Offset(-cutter_radius)
+            a.FitArcs()
+            a.UnFitArcs()
+
+            # calculate finishing pass; it's the sections of the pocket curves which touch the area done
+            if do_finish_pass:
+                finish_pass_area = geom.Area(a)
+                finish_pass_area.Offset(cutter_radius)
+                offset_area_done = offset_cache.Offset(area_done, -cutter_radius - 0.2, area_done_key)
+                finish_passes = []
+                for curve in finish_pass_area.GetCurves():
+                    curve.Reverse()
+                    finish_passes += offset_area_done.InsideCurves(curve)
+
+            sub_areas = a.Split()
+
+            for sub_a in sub_areas:
+                if PocketCanBeDoneWithProfileOp(sub_a, cutter.diam):
+                    actions.append((ACTION_PROFILE, sub_a.GetCurves()[0], cutter.index))
+                else:
+                    actions.append((ACTION_POCKET, sub_a, cutter.index))
+
+            if do_finish_pass:
+                for curve in finish_passes:
+                    actions.append((ACTION_FINISH, curve, cutter.index))
+
+            span.Set(sub_areas = len(sub_areas), finish_passes = len(finish_passes) if do_finish_pass else 0)
+            cutter_number += 1
+            recorder.PutArea(record_prefix + 'cutter %i/a' % cutter_number, a)
+
+            # calculate the remaining area
+            a.Offset(-0.1) # imagine we cut more than we did, to cope with the arc vectors
+            area_remaining.Subtract(a)
+            recorder.PutArea(record_prefix + 'cutter %i/area_remaining' % cutter_number, area_remaining)
+
+    return actions
+
+def ActionsToData(actions):
+    data = []
+    for action, geometry, cutter_index in actions:
+        if action == ACTION_POCKET:
+            data.append((action, AreaData.AreaToData(geometry), cutter_index))
+        else:
+            data.append((action, AreaData.CurveToData(geometry), cutter_index))
+    return data
+
+def ActionsFromData(data):
+    actions = []
+    for action, geometry_data, cutter_index in data:
+        if action == ACTION_POCKET:
+            actions.append((action, AreaData.AreaFromData(geometry_data), cutter_index))
+        else:
+            actions.append((action, AreaData.CurveFromData(geometry_data), cutter_index))
+    return actions
+
+def PlanRestMachineJob(job):
+    # runs in a worker process; the areas and results are passed as plain data
+    # if record is set, the recorded areas are sent back too, as a list of ( name, bytes )
+    area_data, area_done_data, cutters, do_finish_pass, record = job
+    offset_cache = OffsetCache()
+    tracer = Trace.Tracer()
+    recorder = FourAxisRecord.Recorder() if record else FourAxisRecord.null_recorder
+    with tracer.Span('Plan Rest Machining', cutters = len(cutters)):
+        actions = PlanRestMachine(AreaData.AreaFromData(area_data), AreaData.AreaFromData(area_done_data), cutters, do_finish_pass, offset_cache, 'area_done', tracer, recorder)
+    return ActionsToData(actions), offset_cache.hits, offset_cache.misses, tracer.GetEvents(), recorder.entries if record else []
@@ -1,13 +1,112 @@
-import subprocess
+# starts Heeks 4 Axis in one process, with one wx.App
+# the app starts as a plain wx.App, which only needs wx, and shows the splash; then geom, cad, SimApp and FourAxisApp are
+# imported, and step on another thread, as it doesn't make any windows; then the app becomes a HeeksExpertApp and makes
+# its main frame, and the splash is closed once the main frame has been made
+# the time to import each module is printed and added to startup.log, in the same folder as the geometry cache
 
-# Start the splash screen in a separate process, but don't wait before starting the app
-splash_process = subprocess.Popen(['python', 'Splash.py'])
+import os
+import sys
+import time
+import threading
 
-# Start the main application
-main_process = subprocess.Popen(['python', 'FourAxisApp.py'])
+start_time = time.time()
+this_dir = os.path.dirname(os.path.realpath(__file__))
+LOG_PATH = os.path.join(os.path.expanduser('~'), '.Heeks4Axis', 'startup.log')
+APP_MODULES = ['geom', 'cad', 'SimApp', 'Ribbon', 'FourAxisApp'] # needed to make the app, imported while the splash is shown
+BACKGROUND_MODULES = ['step'] # imported on another thread, while the splash is shown
 
-# Optionally, wait for the main application to exit before closing the splash screen
-main_process.wait()
+class ImportTimes:
+    def __init__(self):
+        self.times = [] # ( module name, seconds )
 
-# Once the main app is done, terminate the splash screen
-splash_process.terminate()
+    def Import(self, names, only_try = False):
+        for name in names:
+            t = time.time()
+            try:
+                __import__(name)
+            except ImportError:
+                if not only_try:
+                    raise
+                continue
+            self.times.append((name, time.time() - t))
+
+    def ImportInBackground(self, names, done):
+        # imports the modules, then calls done on the main thread
+        # any which can't be found are left to be imported when they are first used
+        import wx
+        def Run():
+            try:
+                self.Import(names, only_try = True)
+            finally:
+                wx.CallAfter(done)
+        thread = threading.Thread(target = Run)
+        thread.daemon = True
+        thread.start()
+
+    def Write(self, total):
+        lines = ['%-12s %6.3f s' % (name, seconds) for name, seconds in self.times]
+        lines.append('%-12s %6.3f s' % ('total', total))
+        print('startup times\n' + '\n'.join(lines))
+        try:
+            if not os.path.isdir(os.path.dirname(LOG_PATH)):
+                os.makedirs(os.path.dirname(LOG_PATH))
+            f = open(LOG_PATH, 'a')
+            f.write(time.strftime('%Y/%m/%d %H:%M:%S') + ' ' + ', '.join('%s %0.3f' % (name, seconds) for name, seconds in self.times) + ', total %0.3f\n' % total)
+            f.close()
+        except Exception as e:
+            print('failed to write startup log: ' + str(e))
+
+def main():
+    import_times = ImportTimes()
+    import_times.Import(['wx'])
+    import wx
+    sys.path.append(this_dir)
+    sys.path.append(os.path.realpath(this_dir + '/../dsim')) # as FourAxisApp does, for SimApp
+    import Splash
+
+    splash = []
+
+    def Failed():
+        splash[0].Destroy()
+        wx.GetApp().ExitMainLoop()
+
+    def ImportAppModules():
+        try:
+            # geom and cad might only be found once SimApp has added their folders to the path, then SimApp's time includes them
+            import_times.Import(APP_MODULES[0:2], only_try = True)
+            import_times.Import(APP_MODULES[2:])
+        except:
+            Failed()
+            raise
+        import_times.ImportInBackground(BACKGROUND_MODULES, Imported)
+
+    def Imported():
+        import FourAxisApp
+        try:
+            FourAxisApp.BecomeHeeksExpertApp(wx.GetApp())
+        except:
+            Failed()
+            raise
+        wx.CallAfter(FrameReady) # after the frame has had its first events
+
+    def FrameReady():
+        splash[0].Destroy()
+        import_times.Write(time.time() - start_time)
+
+    class Launcher(wx.App):
+        # the one wx.App; it shows the splash, then once the modules are imported FourAxisApp.BecomeHeeksExpertApp makes it
+        # the real app, so the functions called after that aren't methods of Launcher
+        def OnInit(self):
+            splash.append(Splash.MySplashScreen(duration = 0))
+            splash[0].CenterOnScreen(wx.BOTH)
+            splash[0].Show(True)
+            splash[0].Update()
+            wx.CallAfter(ImportAppModules)
+            return True
+
+    app = Launcher()
+    app.MainLoop()
+
+if __name__ == '__main__':
+    # worker processes import this file again, so only start the app when it's run
+    main()
@@ -1,19 +1,26 @@
+import os
 import wx
-from   wx.adv import SplashScreen as SplashScreen
+import wx.adv
 
-class MySplashScreen(SplashScreen):
+this_dir = os.path.dirname(os.path.realpath(__file__))
+
+class MySplashScreen(wx.adv.SplashScreen):
     """
     Create a splash screen widget.
     """
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, duration=3000):
 
         #------------
 
         # This is a recipe to a the screen.
         # Modify the following variables as necessary.
-        bitmap = wx.Bitmap(name="Splash.png", type=wx.BITMAP_TYPE_PNG)
-        splash = wx.adv.SPLASH_CENTRE_ON_SCREEN | wx.adv.SPLASH_TIMEOUT
-        duration = 3000 # milliseconds
+        # duration is in milliseconds; 0 to keep it until it is closed, as Run.py does once the main frame is ready
+        bitmap = wx.Bitmap(name=os.path.join(this_dir, "Splash.png"), type=wx.BITMAP_TYPE_PNG)
+        splash = wx.adv.SPLASH_CENTRE_ON_SCREEN
+        if duration > 0:
+            splash |= wx.adv.SPLASH_TIMEOUT
+        else:
+            splash |= wx.adv.SPLASH_NO_TIMEOUT
 
         # Call the constructor with the above arguments
         # in exactly the following order.
@@ -40,8 +47,9 @@ class MySplashScreen(SplashScreen):
         event.Skip()  # Make sure the default handler runs too...
         self.Hide()
 
-app = wx.App()
-MySplash = MySplashScreen()
-MySplash.CenterOnScreen(wx.BOTH)
-MySplash.Show(True)
-app.MainLoop()
+if __name__ == '__main__':
+    app = wx.App()
+    MySplash = MySplashScreen()
+    MySplash.CenterOnScreen(wx.BOTH)
+    MySplash.Show(True)
+    app.MainLoop()
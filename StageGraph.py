@@ -0,0 +1,36 @@
+# the stages of a run, with the settings each one reads and the stages whose results it uses
+# a stage's key is made from the values of its settings and the keys of the stages it uses, so when a setting changes,
+# the key of the stage reading it changes, and so do the keys of all the stages using that one, and so on
+# comparing the keys with the last run's gives the stages which need doing again
+#
+# graph = StageGraph.StageGraph([StageGraph.Stage('shadow', ['precision']), StageGraph.Stage('tags', ['tag_width'], ['shadow'])])
+# keys = graph.GetKeys(settings) # settings is a dictionary of setting name to value
+# changed = graph.GetChanged(last_keys, keys) # [ 'tags' ] if only tag_width has changed
+
+class Stage:
+    def __init__(self, name, settings, inputs = []):
+        self.name = name
+        self.settings = settings # names of the settings the stage reads
+        self.inputs = inputs # names of the stages whose results it uses
+
+class StageGraph:
+    def __init__(self, stages):
+        # each stage must come after the stages it uses
+        self.stages = stages
+        names = set()
+        for stage in stages:
+            for input in stage.inputs:
+                if not input in names:
+                    raise ValueError('stage ' + stage.name + ' uses ' + input + ', which is not before it')
+            names.add(stage.name)
+
+    def GetKeys(self, settings):
+        # returns a dictionary of stage name to key
+        keys = {}
+        for stage in self.stages:
+            keys[stage.name] = (tuple([settings[name] for name in stage.settings]), tuple([keys[input] for input in stage.inputs]))
+        return keys
+
+    def GetChanged(self, last_keys, keys):
+        # returns the names of the stages whose keys are different from the last ones, in order
+        return [stage.name for stage in self.stages if last_keys.get(stage.name) != keys[stage.name]]
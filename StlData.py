@@ -0,0 +1,123 @@
+# helpers for getting at the triangles of a geom.Stl
+
+import os
+import struct
+import hashlib
+import tempfile
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None # the triangles are read and written one at a time instead
+
+if numpy != None:
+    # a binary stl triangle record, 50 bytes
+    STL_RECORD = numpy.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+
+def StlToBytes(stl):
+    # returns the contents of the stl file which geom.Stl writes
+    # WriteStl is the only way geom.Stl gives its triangles, so they go through a file once; everything after that is in memory
+    fd, path = tempfile.mkstemp(suffix = '.stl')
+    os.close(fd)
+    try:
+        stl.WriteStl(path)
+        f = open(path, 'rb')
+        data = f.read()
+        f.close()
+    finally:
+        os.remove(path)
+    return data
+
+def StlFromFile(path):
+    import geom
+    return geom.Stl(path)
+
+def StlFromBytes(data):
+    # returns a geom.Stl from the contents of an stl file
+    fd, path = tempfile.mkstemp(suffix = '.stl')
+    os.close(fd)
+    try:
+        f = open(path, 'wb')
+        f.write(data)
+        f.close()
+        return StlFromFile(path)
+    finally:
+        os.remove(path)
+
+def BinaryStlBytes(coords):
+    # returns a binary stl file from 9 coordinates per triangle, the normals are left for the reader to calculate
+    count = len(coords) // 9
+    if numpy != None:
+        records = numpy.zeros(count, dtype = STL_RECORD)
+        records['vertices'] = numpy.asarray(coords, dtype = numpy.float64)[:count * 9].reshape(-1, 3, 3)
+        return b'\0' * 80 + struct.pack('<I', count) + records.tobytes()
+    parts = [b'\0' * 80, struct.pack('<I', count)]
+    for i in range(0, count):
+        parts.append(struct.pack('<12fH', 0.0, 0.0, 0.0, *coords[i * 9:i * 9 + 9], 0))
+    return b''.join(parts)
+
+def CompactStlBytes(data):
+    # returns the stl file as binary, which is smaller than ascii, for sending to and from worker processes
+    if IsBinaryStl(data):
+        return data
+    return BinaryStlBytes(ReadTriangleCoords(data))
+
+def WriteBinaryStl(path, coords):
+    f = open(path, 'wb')
+    f.write(BinaryStlBytes(coords))
+    f.close()
+
+def IsBinaryStl(data):
+    # ascii stl files start with "solid", but so do some binary ones, so check the size too
+    if len(data) < 84:
+        return False
+    count = struct.unpack_from('<I', data, 80)[0]
+    return len(data) == 84 + count * 50
+
+def ReadTriangleCoords(data):
+    # returns an array of 9 floats per triangle; x0, y0, z0, x1, y1, z1, x2, y2, z2
+    coords = array('d')
+    if IsBinaryStl(data):
+        count = struct.unpack_from('<I', data, 80)[0]
+        for values in struct.iter_unpack('<12fH', data[84:84 + count * 50]):
+            coords.extend(values[3:12])
+    else:
+        for line in data.splitlines():
+            words = line.split()
+            if len(words) == 4 and words[0] == b'vertex':
+                coords.extend((float(words[1]), float(words[2]), float(words[3])))
+    return coords
+
+def ReadTriangleArray(data):
+    # returns a numpy array of 9 floats per triangle, as ReadTriangleCoords does, without going through binary ones in Python
+    if IsBinaryStl(data):
+        count = struct.unpack_from('<I', data, 80)[0]
+        return numpy.frombuffer(data, dtype = STL_RECORD, count = count, offset = 84)['vertices'].astype(numpy.float64).reshape(-1)
+    return numpy.frombuffer(ReadTriangleCoords(data), dtype = numpy.float64) # reading the ascii numbers is most of the time anyway
+
+def MeshKey(data, precision):
+    # returns a content hash of the mesh, which doesn't change when the mesh is moved, and the mesh's minimum corner
+    if numpy != None:
+        return MeshKeyFromArray(ReadTriangleArray(data), precision)
+    coords = ReadTriangleCoords(data)
+    if len(coords) == 0:
+        return hashlib.sha1(repr(precision).encode()).hexdigest(), (0.0, 0.0, 0.0)
+    origin = (min(coords[0::3]), min(coords[1::3]), min(coords[2::3]))
+    relative = array('d')
+    for i in range(0, len(coords)):
+        relative.append(round(coords[i] - origin[i % 3], 6))
+    h = hashlib.sha1(relative.tobytes())
+    h.update(repr(precision).encode())
+    return h.hexdigest(), origin
+
+def MeshKeyFromArray(coords, precision):
+    # MeshKey with numpy; the rounding is numpy's, so the key can differ from MeshKey's without numpy, which only misses the cache
+    if len(coords) == 0:
+        return hashlib.sha1(repr(precision).encode()).hexdigest(), (0.0, 0.0, 0.0)
+    coords = coords.reshape(-1, 3)
+    minimum = coords.min(axis = 0)
+    relative = numpy.round(coords - minimum, 6) + 0.0 # adding 0.0 makes -0.0 into 0.0
+    h = hashlib.sha1(relative.astype('<f8').tobytes())
+    h.update(repr(precision).encode())
+    return h.hexdigest(), (float(minimum[0]), float(minimum[1]), float(minimum[2]))
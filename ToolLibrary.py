@@ -0,0 +1,125 @@
+# the available.tools file, compiled once and kept until the file changes
+# for each material and category ( 'slot cutters' or 'drills' ) the tools are kept in file order, as indices into them are used
+# for the added tools, and also sorted by diameter, then cutting length, then index, so cutters can be found with a binary search
+# results of the searches are remembered, as the same ones are asked for many times in a run
+
+import os
+import ast
+import bisect
+import consts
+
+# attribute name to default value, in the order of the AvailableTool constructor arguments
+TOOL_ATTRIBUTES = [
+    ('diam', 0.0),
+    ('type', consts.TOOL_TYPE_UNDEFINED),
+    ('rest_machining', False),
+    ('cutting_length', 0.0),
+    ('hfeed', 0.0),
+    ('finish_hfeed', 0.0),
+    ('spin', 0.0),
+    ('vfeed', 0.0),
+    ('rough_step_down', 0.0),
+    ('finish_step_down', 0.0),
+    ]
+
+FLOAT_ATTRIBUTES = ['diam', 'cutting_length', 'hfeed', 'finish_hfeed', 'spin', 'vfeed', 'rough_step_down', 'finish_step_down']
+
+def ParseValue(text):
+    # values such as "True" or "TOOL_TYPE_SLOTCUTTER", which used to be given to eval
+    text = text.strip()
+    if hasattr(consts, text):
+        return getattr(consts, text)
+    return ast.literal_eval(text)
+
+class ToolCategory:
+    def __init__(self, tools):
+        self.tools = tools # list of AvailableTool constructor arguments, in file order
+        self.entries = sorted((args[0], args[3], index) for index, args in enumerate(tools)) # ( diam, cutting_length, index )
+        self.diams = [entry[0] for entry in self.entries]
+        self.tool_of_diameter = {}
+        self.diam_maps = {}
+        self.sorted_cutters = {}
+
+    def GetToolOfDiameter(self, d, cut_depth, precision):
+        # returns the index of the first tool in the file within precision of diameter d, which is long enough, or None
+        key = (d, cut_depth, precision)
+        if not key in self.tool_of_diameter:
+            found = None
+            # the range is a little wider than precision, so rounding can't lose a tool, each one is checked the same way as before
+            for k in range(bisect.bisect_left(self.diams, d - precision - 1e-9), bisect.bisect_right(self.diams, d + precision + 1e-9)):
+                diam, cutting_length, index = self.entries[k]
+                if abs(diam - d) < precision and cutting_length >= cut_depth and (found == None or index < found):
+                    found = index
+            self.tool_of_diameter[key] = found
+        return self.tool_of_diameter[key]
+
+    def GetDiamMapShortest(self, cut_depth, max_cutter_diameter, rest_machining):
+        # returns a map of diameter to the index of the shortest tool of that diameter which is long enough
+        key = (cut_depth, max_cutter_diameter, rest_machining)
+        if not key in self.diam_maps:
+            end = len(self.entries) if max_cutter_diameter == None else bisect.bisect_right(self.diams, max_cutter_diameter)
+            diam_map = {}
+            for diam, cutting_length, index in self.entries[:end]:
+                if diam in diam_map or cutting_length < cut_depth:
+                    continue
+                if rest_machining and not self.tools[index][2]:
+                    continue
+                diam_map[diam] = index # the first one found is the shortest, as they are sorted by length
+            self.diam_maps[key] = diam_map
+        return dict(self.diam_maps[key])
+
+    def GetSortedCutters(self, cut_depth, max_cutter_diameter, rest_machining):
+        # returns a new list of tool indices, biggest diameter first
+        key = (cut_depth, max_cutter_diameter, rest_machining)
+        if not key in self.sorted_cutters:
+            diam_map = self.GetDiamMapShortest(cut_depth, max_cutter_diameter, rest_machining)
+            self.sorted_cutters[key] = [diam_map[d] for d in sorted(diam_map.keys(), reverse = True)]
+        return list(self.sorted_cutters[key])
+
+class ToolLibrary:
+    def __init__(self, path):
+        import xml.etree.ElementTree as ET
+        self.categories = {} # ( material name in lower case, category name ) to ToolCategory
+        tools = {}
+        root = ET.parse(path).getroot()
+        for material in root:
+            if material.tag != 'material':
+                continue
+            material_name = material.attrib['name'].lower()
+            for category in material:
+                key = (material_name, category.tag.replace('_', ' '))
+                if not key in tools:
+                    tools[key] = []
+                for tool in category:
+                    if tool.tag != 'tool':
+                        continue
+                    if 'active' in tool.attrib and not ParseValue(tool.attrib['active']):
+                        continue
+                    args = []
+                    for name, default in TOOL_ATTRIBUTES:
+                        if name in tool.attrib:
+                            args.append(float(tool.attrib[name]) if name in FLOAT_ATTRIBUTES else ParseValue(tool.attrib[name]))
+                        else:
+                            args.append(default)
+                    tools[key].append(args)
+        for key in tools:
+            self.categories[key] = ToolCategory(tools[key])
+
+    def GetCategory(self, material, name):
+        key = (material.lower(), name)
+        if not key in self.categories:
+            self.categories[key] = ToolCategory([])
+        return self.categories[key]
+
+libraries = {} # path to ( modification time, size, ToolLibrary )
+
+def GetLibrary(path):
+    # returns the compiled library, only reading the file again if it has changed
+    stat = os.stat(path)
+    if path in libraries:
+        mtime, size, library = libraries[path]
+        if mtime == stat.st_mtime and size == stat.st_size:
+            return library
+    library = ToolLibrary(path)
+    libraries[path] = (stat.st_mtime, stat.st_size, library)
+    return library
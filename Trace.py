@@ -0,0 +1,156 @@
+# timing of nested stages, with attributes, which can be written as a Chrome trace file
+# open the file in chrome://tracing or https://ui.perfetto.dev to see where the time goes
+#
+# tracer = Trace.Tracer()
+# with tracer.Span('Shadow') as span:
+#     ...
+#     span.Set(curves = 10)
+# tracer.WriteChromeTrace('trace.json')
+#
+# a Tracer can be used from more than one thread, like AutoProgram's geometry worker; a span started by another thread goes
+# inside the innermost open span, and is shown in the trace on its own thread
+
+import os
+import json
+import time
+import threading
+
+class Span:
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.end = None
+        self.depth = 0
+        self.thread = threading.get_ident()
+
+    def Set(self, **attributes):
+        with self.tracer.lock:
+            self.attributes.update(attributes)
+
+    def GetDuration(self):
+        if self.end == None:
+            return time.time() - self.start
+        return self.end - self.start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type != None:
+            self.attributes['error'] = str(value)
+        self.tracer.End(self)
+        return False
+
+class Tracer:
+    def __init__(self):
+        self.spans = [] # finished spans, in the order they finished
+        self.stack = [] # open spans, innermost last
+        self.extra_events = [] # chrome trace events from other processes
+        self.profiler = None
+        self.lock = threading.RLock() # for the spans, stack and extra events, and the spans' attributes
+
+    def Span(self, name, **attributes):
+        # starts a span, use it in a with statement, or call End
+        span = Span(self, name, attributes)
+        with self.lock:
+            span.depth = len(self.stack)
+            self.stack.append(span)
+        return span
+
+    def End(self, span = None):
+        # ends the given span, or the innermost one, and any spans left open inside it
+        with self.lock:
+            if len(self.stack) == 0:
+                return None
+            if span == None:
+                span = self.stack[-1]
+            if not span in self.stack:
+                return span
+            while len(self.stack) > 0:
+                s = self.stack.pop()
+                s.end = time.time()
+                self.spans.append(s)
+                if s is span:
+                    break
+            return span
+
+    def EndAll(self):
+        with self.lock:
+            while len(self.stack) > 0:
+                self.End()
+
+    def Set(self, **attributes):
+        # sets attributes on the innermost open span
+        with self.lock:
+            if len(self.stack) > 0:
+                self.stack[-1].Set(**attributes)
+
+    def GetEvents(self):
+        # returns the finished spans as Chrome trace "complete" events
+        pid = os.getpid()
+        events = []
+        with self.lock:
+            for span in self.spans:
+                events.append({
+                    'name':span.name,
+                    'ph':'X',
+                    'ts':span.start * 1000000.0,
+                    'dur':(span.end - span.start) * 1000000.0,
+                    'pid':pid,
+                    'tid':span.thread,
+                    'args':dict(span.attributes),
+                    })
+        return events
+
+    def AddEvents(self, events):
+        # add events from a tracer in a worker process
+        with self.lock:
+            self.extra_events += events
+
+    def WriteChromeTrace(self, path):
+        with self.lock:
+            events = self.GetEvents() + self.extra_events
+        events.sort(key = lambda event: event['ts'])
+        f = open(path, 'w')
+        json.dump({'traceEvents':events, 'displayTimeUnit':'ms'}, f, default = str)
+        f.close()
+
+    def GetStageTimes(self, depth = 1):
+        # returns a list of ( name, seconds ) for the spans at the given depth
+        with self.lock:
+            return [(span.name, span.end - span.start) for span in sorted(self.spans, key = lambda span: span.start) if span.depth == depth]
+
+    def StartProfiling(self):
+        import cProfile
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def StopProfiling(self, path):
+        # writes the profile for pstats or snakeviz
+        if self.profiler == None:
+            return
+        self.profiler.disable()
+        self.profiler.dump_stats(path)
+        self.profiler = None
+
+class NullSpan:
+    def Set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return False
+
+class NullTracer:
+    # does nothing, for when nobody is tracing
+    def Span(self, name, **attributes):
+        return NullSpan()
+
+    def Set(self, **attributes):
+        pass
+
+null_tracer = NullTracer()
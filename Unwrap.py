@@ -0,0 +1,254 @@
+# the geometry part of the Unwrap Solid and Split Test commands
+# it only uses geom, so it can run in a worker process, one job per solid
+# meshes are given to the workers as binary stl file contents, and the workers write their results to stl files,
+# so the, maybe very big, results don't get copied through a pipe
+#
+# splitting is done with numpy if it is available; each triangle is cut into n x n smaller ones, n being enough to make
+# its longest edge shorter than the split length, and a chunk of triangles is done at a time, writing the new triangles
+# into a float32 array made at the start, or straight into a memory mapped binary stl file
+#
+# in adaptive mode n is instead just enough to keep the unwrap error under a tolerance; the solid is unwrapped about the X axis,
+# so a straight edge of the unwrapped triangle is a curve on the solid, which is off the original triangle by about
+# the sagitta of its angle about the axis, r * ( 1 - cos( angle / 2 ) ), which sets n to start with; the radius not changing
+# linearly along the edge adds to that, on faces across the axis, so the error is then measured at points on the smaller triangles
+
+import os
+import math
+import tempfile
+import StlData
+
+try:
+    import numpy
+except ImportError:
+    numpy = None # geom.Stl.SplitToSmallerTriangles is used instead
+
+TRIS_TOLERANCE = 0.01 # tolerance for getting the triangles of a solid
+SPLIT_LENGTH = 0.5 # longest triangle edge after splitting
+UNWRAP_VALUE = 10.0 # given to geom.Stl.Unwrap
+UNWRAP_TOLERANCE = 0.01 # for adaptive splitting, the distance the unwrapped triangles are allowed to be from the solid
+SPLIT_CHUNK_TRIANGLES = 65536 # about how many new triangles are made at a time
+ADAPTIVE_CHECKS = 8 # most times triangles are split again to check them, in adaptive splitting, before giving up on the tolerance
+ERROR_SAMPLES = 4 # each triangle's edges are split into this many parts, for the points its unwrap error is measured at
+
+if numpy != None:
+    STL_RECORD = StlData.STL_RECORD
+
+def TrianglesFromBytes(data):
+    # returns a numpy array of triangles, shape ( number of triangles, 3, 3 ), from the contents of an stl file
+    # a binary file's triangle count is read from its header, which IsBinaryStl has checked against the length of the data
+    return StlData.ReadTriangleArray(data).reshape(-1, 3, 3)
+
+def GetSplitCounts(tris, split_length):
+    # returns the number of parts each triangle's edges are split into
+    edges = tris[:, [1, 2, 0], :] - tris
+    longest = numpy.sqrt((edges * edges).sum(axis = 2)).max(axis = 1)
+    return numpy.maximum(numpy.ceil(longest / split_length), 1).astype(numpy.int64)
+
+def GetArcAngles(tris, corner_radii):
+    # returns the angles of the triangles' corners about the X axis, all on the smallest arc containing them, shape ( triangles, 3 )
+    # corners on the axis have no angle, so they are given the angle of the triangle's corner furthest from it
+    angles = numpy.arctan2(tris[:, :, 2], tris[:, :, 1])
+    furthest_angles = angles[numpy.arange(len(tris)), corner_radii.argmax(axis = 1)]
+    angles = numpy.where(corner_radii < 1e-9, furthest_angles[:, numpy.newaxis], angles)
+    # the arc starts after the biggest gap between the angles
+    ordered = numpy.sort(angles, axis = 1)
+    gaps = numpy.empty(ordered.shape)
+    gaps[:, 0:2] = ordered[:, 1:3] - ordered[:, 0:2]
+    gaps[:, 2] = ordered[:, 0] + 2 * math.pi - ordered[:, 2]
+    starts = ordered[numpy.arange(len(tris)), (gaps.argmax(axis = 1) + 1) % 3]
+    return starts[:, numpy.newaxis] + numpy.mod(angles - starts[:, numpy.newaxis], 2 * math.pi)
+
+def GetAngularSpans(tris):
+    # returns the angle, about the X axis, of the smallest arc containing each triangle's corners, and its biggest radius
+    corner_radii = numpy.sqrt(tris[:, :, 1] * tris[:, :, 1] + tris[:, :, 2] * tris[:, :, 2])
+    angles = GetArcAngles(tris, corner_radii)
+    return angles.max(axis = 1) - angles.min(axis = 1), corner_radii.max(axis = 1)
+
+def GetSampleWeights(n):
+    # returns the barycentric weights of the points the unwrap error is measured at, with each edge in n parts, shape ( points, 3 )
+    weights = []
+    for i in range(0, n + 1):
+        for j in range(0, n + 1 - i):
+            weights.append((float(n - i - j) / n, float(i) / n, float(j) / n))
+    return numpy.array(weights)
+
+def GetUnwrapErrors(tris, samples = ERROR_SAMPLES):
+    # returns about the furthest each triangle is from where the unwrapping puts it
+    # an unwrapped triangle is flat in x, angle about the X axis and radius, so a point on it has those interpolated from the
+    # corners'; wrapping it back round gives the point on the solid, which is compared with the point on the triangle,
+    # at points with the edges split into samples parts; both the sagitta of the angle and the radius not changing
+    # linearly along a straight line make the error
+    weights = GetSampleWeights(samples)
+    errors = numpy.empty(len(tris))
+    for begin in range(0, len(tris), SPLIT_CHUNK_TRIANGLES):
+        chunk = numpy.asarray(tris[begin:begin + SPLIT_CHUNK_TRIANGLES], dtype = numpy.float64)
+        radii = numpy.sqrt(chunk[:, :, 1] * chunk[:, :, 1] + chunk[:, :, 2] * chunk[:, :, 2])
+        angles = GetArcAngles(chunk, radii)
+        flat = numpy.matmul(weights, chunk) # ( triangles, points, 3 )
+        r = numpy.matmul(radii, weights.T)
+        a = numpy.matmul(angles, weights.T)
+        dy = r * numpy.cos(a) - flat[:, :, 1]
+        dz = r * numpy.sin(a) - flat[:, :, 2]
+        errors[begin:begin + len(chunk)] = numpy.sqrt(dy * dy + dz * dz).max(axis = 1)
+    return errors
+
+split_weights = {} # n to array of barycentric weights, shape ( n * n, 3, 3 )
+
+def GetSplitWeights(n):
+    # returns the weights of the corners of the original triangle, for each corner of its n * n smaller triangles
+    # the smaller triangles are wound the same way as the original one
+    if not n in split_weights:
+        # a triangle pointing the same way as the original one at each ( i, j ) with i + j < n, and one pointing the other way
+        # after it, when i + j < n - 1
+        i, j = numpy.nonzero(numpy.add.outer(numpy.arange(n), numpy.arange(n)) < n)
+        down = i + j < n - 1
+        ci = numpy.concatenate([numpy.stack([i, i + 1, i], axis = 1), numpy.stack([i + 1, i + 1, i], axis = 1)[down]])
+        cj = numpy.concatenate([numpy.stack([j, j, j + 1], axis = 1), numpy.stack([j, j + 1, j + 1], axis = 1)[down]])
+        kinds = numpy.concatenate([numpy.zeros(len(i), dtype = numpy.int64), numpy.ones(int(down.sum()), dtype = numpy.int64)])
+        order = numpy.lexsort((kinds, numpy.concatenate([j, j[down]]), numpy.concatenate([i, i[down]])))
+        ci = ci[order]
+        cj = cj[order]
+        weights = numpy.stack([n - ci - cj, ci, cj], axis = 2) / float(n)
+        split_weights[n] = weights
+    return split_weights[n]
+
+def SplitChunks(tris, counts):
+    # yields ( indices of triangles, array of their smaller triangles with shape ( triangles, n * n, 3, 3 ) ), for triangles
+    # all split into n * n, making about SPLIT_CHUNK_TRIANGLES new triangles at a time; all the triangles come once, in order of chunks
+    ends = numpy.cumsum(counts * counts)
+    starts = ends - counts * counts
+    begin = 0
+    while begin < len(tris):
+        # take enough triangles to make about SPLIT_CHUNK_TRIANGLES new ones, but at least one
+        end = max(int(numpy.searchsorted(ends, starts[begin] + SPLIT_CHUNK_TRIANGLES, side = 'right')), begin + 1)
+        chunk_counts = counts[begin:end]
+        for n in numpy.unique(chunk_counts).tolist():
+            indices = numpy.nonzero(chunk_counts == n)[0] + begin
+            weights = GetSplitWeights(n)
+            yield indices, numpy.matmul(weights[numpy.newaxis], tris[indices][:, numpy.newaxis])
+        begin = end
+
+def GetAdaptiveSplitCounts(tris, tolerance):
+    # returns ( the number of parts each triangle's edges are split into, for the unwrap error of the parts to be under tolerance,
+    # and None, or if the error was still over tolerance after ADAPTIVE_CHECKS checks, the biggest error of the last check )
+    # the axis goes through triangles going more than half way round it, so they are first split into parts going at most
+    # a quarter of the way round, the parts away from the axis then being under half way round, and the sagitta is used for those
+    spans, radii = GetAngularSpans(tris)
+    cos_half_angle = 1 - tolerance / numpy.maximum(radii, 1e-12)
+    max_angles = 2 * numpy.arccos(numpy.clip(cos_half_angle, -1, 1))
+    counts = numpy.ceil(spans / numpy.maximum(numpy.minimum(max_angles, math.pi * 0.5), 1e-12))
+    counts = numpy.where((cos_half_angle <= -1) & (spans <= math.pi), 1, counts) # the radius is so small that no angle is too big
+    counts = numpy.maximum(counts, 1).astype(numpy.int64)
+
+    # that is about right for the whole triangle, but the smaller triangles nearer the axis go further round it, and the
+    # radius changes too, so they are checked by splitting the triangles and measuring the error, and the ones with too big
+    # an error are split more, until they are good enough; the parts the axis goes through keep going more than half way
+    # round, but get smaller, and with them their error
+    # the error goes as the square of the angle the parts go round, so the count is multiplied by the square root of how many
+    # times too big the error is
+    check = numpy.arange(len(tris))
+    for iteration in range(0, ADAPTIVE_CHECKS):
+        errors = numpy.zeros(len(check))
+        for indices, small in SplitChunks(tris[check], counts[check]):
+            errors[indices] = GetUnwrapErrors(small.reshape(-1, 3, 3)).reshape(len(indices), -1).max(axis = 1)
+        too_big = errors > tolerance
+        if not too_big.any():
+            return counts, None
+        if iteration == ADAPTIVE_CHECKS - 1:
+            # the counts of the last check are kept, rather than more which haven't been checked
+            return counts, float(errors.max())
+        check = check[too_big]
+        more = numpy.ceil(counts[check] * numpy.sqrt(errors[too_big] / tolerance)).astype(numpy.int64)
+        counts[check] = numpy.maximum(more, counts[check] + 1)
+
+def SplitTriangles(tris, counts, path = None):
+    # returns an array of the smaller triangles, in the same order as the triangles they came from, shape ( number, 3, 3 )
+    # each triangle is split into counts[i] * counts[i] triangles, see GetSplitCounts and GetAdaptiveSplitCounts
+    # if path is given, the triangles are written straight into a binary stl file there, and the returned array is mapped onto it
+    sizes = counts * counts
+    ends = numpy.cumsum(sizes)
+    total = int(ends[-1]) if len(ends) > 0 else 0
+    starts = ends - sizes
+
+    if path == None:
+        new_tris = numpy.empty((total, 3, 3), dtype = numpy.float32)
+    else:
+        f = open(path, 'wb')
+        f.write(b'\0' * 80)
+        f.write(numpy.array([total], dtype = '<u4').tobytes())
+        f.truncate(84 + total * 50) # the normals and attributes are left as zeros
+        f.close()
+        if total == 0:
+            return numpy.empty((0, 3, 3), dtype = numpy.float32)
+        new_tris = numpy.memmap(path, dtype = STL_RECORD, mode = 'r+', offset = 84, shape = (total,))['vertices']
+
+    for indices, small in SplitChunks(tris, counts):
+        n = counts[indices[0]]
+        positions = starts[indices][:, numpy.newaxis] + numpy.arange(n * n)
+        new_tris[positions.ravel()] = small.reshape(-1, 3, 3)
+
+    if path != None:
+        new_tris.base.flush()
+    return new_tris
+
+def NewStlPath():
+    fd, path = tempfile.mkstemp(suffix = '.stl')
+    os.close(fd)
+    return path
+
+def SplitToFile(data, split_length, tolerance = None):
+    # splits the mesh into smaller triangles, and returns the path of a new stl file of them
+    # if tolerance is given, the splitting is adaptive, which needs numpy; without it, the splitting is always to split_length
+    path = NewStlPath()
+    if numpy == None:
+        stl = StlData.StlFromBytes(data)
+        stl.SplitToSmallerTriangles(split_length).WriteStl(path)
+    else:
+        tris = TrianglesFromBytes(data)
+        if tolerance == None:
+            counts = GetSplitCounts(tris, split_length)
+        else:
+            counts, error = GetAdaptiveSplitCounts(tris, tolerance)
+            if error != None:
+                print('warning: adaptive splitting gave up after %i checks, with an unwrap error of %g, over the tolerance of %g' % (ADAPTIVE_CHECKS, error, tolerance))
+        new_tris = SplitTriangles(tris, counts, path)
+        del new_tris # unmaps the file
+    return path
+
+def SplitJob(job):
+    # returns the path of an stl file of the mesh split into smaller triangles
+    data, split_length = job
+    return SplitToFile(data, split_length)
+
+def UnwrapJob(job):
+    # returns the path of an stl file of the mesh split into smaller triangles, then unwrapped
+    # tolerance is None to split to split_length, otherwise the splitting is adaptive
+    # an UnwrapIndex is saved too, if numpy is available
+    data, split_length, unwrap_value, tolerance = job
+    split_path = SplitToFile(data, split_length, tolerance)
+    try:
+        smaller_tris_stl = StlData.StlFromFile(split_path)
+        unwrapped_stl = smaller_tris_stl.Unwrap(unwrap_value)
+        del smaller_tris_stl
+        path = NewStlPath()
+        unwrapped_stl.WriteStl(path)
+        del unwrapped_stl
+        if numpy != None:
+            SaveIndex(path, split_path)
+    finally:
+        os.remove(split_path)
+    return path
+
+def SaveIndex(unwrapped_path, source_path):
+    # saves an UnwrapIndex mapping the unwrapped triangles to the ones they came from, which geom keeps in the same order
+    import UnwrapIndex
+    f = open(unwrapped_path, 'rb')
+    unwrapped = TrianglesFromBytes(f.read())
+    f.close()
+    f = open(source_path, 'rb')
+    source = TrianglesFromBytes(f.read())
+    f.close()
+    if len(unwrapped) != len(source):
+        print('no unwrap index made, the unwrapped solid has %i triangles, from %i' % (len(unwrapped), len(source)))
+        return
+    UnwrapIndex.SaveIndexForMesh(unwrapped, source)
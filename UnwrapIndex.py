@@ -0,0 +1,186 @@
+# index for mapping points on an unwrapped solid back onto the solid it was unwrapped from
+# Unwrap Solid makes one for each solid it unwraps, from the unwrapped triangles and the split triangles they came from,
+# which are in the same order, and keeps it in a folder next to the geometry cache, found by a content hash of the unwrapped mesh
+#
+# the unwrapped triangles are put in a uniform grid in X and Y; a point is mapped by finding the top triangle above or below it,
+# then putting its barycentric coordinates in that triangle into the source triangle
+# the height of the point above the unwrapped surface is kept, going outwards from the X axis, which the solid was unwrapped about
+#
+# index, origin = UnwrapIndex.GetIndexForSolid(object) # index is None if there isn't one
+# points, triangles = index.MapPoints(points, origin) # an array of millions of points at a time is fine
+
+import os
+import hashlib
+import numpy
+
+CACHE_FOLDER = os.path.join(os.path.expanduser('~'), '.Heeks4Axis', 'unwrap')
+CACHE_LIMIT = 1024 * 1024 * 1024 # bytes
+CELLS_PER_TRIANGLE = 1.0 # about how many grid cells there are for each triangle
+QUERY_BATCH = 65536 # points mapped at a time
+INSIDE_TOLERANCE = 1e-9 # barycentric coordinates this far below 0 are still inside
+
+class UnwrapIndex:
+    def __init__(self, unwrapped, source, origin = (0.0, 0.0, 0.0)):
+        # unwrapped and source are arrays of triangles, shape ( number, 3, 3 ), source[i] being the triangle unwrapped[i] came from
+        # origin is where the unwrapped mesh's minimum corner was when the index was made, the index still works after moving the mesh
+        self.unwrapped = numpy.asarray(unwrapped, dtype = numpy.float32)
+        self.source = numpy.asarray(source, dtype = numpy.float32)
+        self.origin = numpy.array(origin, dtype = numpy.float64)
+        self.MakeGrid()
+
+    def MakeGrid(self):
+        # works out the cell size and puts the triangles in the cells their boxes touch
+        # cell_tris are triangle indices, in order of cell, and the ones for cell c are cell_tris[cell_starts[c]:cell_starts[c + 1]]
+        xy = self.unwrapped[:, :, 0:2].astype(numpy.float64)
+        mins = xy.min(axis = 1)
+        maxs = xy.max(axis = 1)
+        if len(xy) == 0:
+            self.grid_min = numpy.zeros(2)
+            self.cell_size = 1.0
+            self.grid_size = (1, 1)
+            self.cell_starts = numpy.zeros(2, dtype = numpy.int64)
+            self.cell_tris = numpy.zeros(0, dtype = numpy.int64)
+            return
+
+        self.grid_min = mins.min(axis = 0)
+        extent = numpy.maximum(maxs.max(axis = 0) - self.grid_min, 1e-9)
+        # cells about the size of the triangles, but not more than CELLS_PER_TRIANGLE per triangle
+        self.cell_size = max(float(numpy.mean(maxs - mins)), float(numpy.sqrt(extent[0] * extent[1] / (len(xy) * CELLS_PER_TRIANGLE))), 1e-9)
+        self.grid_size = (int(extent[0] / self.cell_size) + 1, int(extent[1] / self.cell_size) + 1)
+
+        first = self.GetCells(mins)
+        last = self.GetCells(maxs)
+        widths = last[:, 1] - first[:, 1] + 1
+        counts = (last[:, 0] - first[:, 0] + 1) * widths
+        tris = numpy.repeat(numpy.arange(len(xy)), counts)
+        local = numpy.arange(len(tris)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        columns = first[tris, 0] + local // widths[tris]
+        rows = first[tris, 1] + local % widths[tris]
+        cells = columns * self.grid_size[1] + rows
+        order = numpy.argsort(cells, kind = 'stable')
+        self.cell_tris = tris[order]
+        self.cell_starts = numpy.searchsorted(cells[order], numpy.arange(self.grid_size[0] * self.grid_size[1] + 1))
+
+    def GetCells(self, xy):
+        # returns the column and row of the cell each point is in, clipped to the grid
+        cells = numpy.floor((xy - self.grid_min) / self.cell_size).astype(numpy.int64)
+        cells[:, 0] = numpy.clip(cells[:, 0], 0, self.grid_size[0] - 1)
+        cells[:, 1] = numpy.clip(cells[:, 1], 0, self.grid_size[1] - 1)
+        return cells
+
+    def MapPoints(self, points, origin = None):
+        # returns ( array of mapped points, shape ( number, 3 ), array of source triangle indices )
+        # points is an array of x, y or x, y, z; without z, the points are mapped onto the surface
+        # points not above or below a triangle give nan and -1
+        # origin is where the unwrapped mesh's minimum corner is now, if it has been moved since the index was made
+        points = numpy.asarray(points, dtype = numpy.float64)
+        if origin is not None:
+            points = points.copy()
+            points[:, 0:2] -= (numpy.asarray(origin, dtype = numpy.float64) - self.origin)[0:2]
+            if points.shape[1] > 2:
+                points[:, 2] -= origin[2] - self.origin[2]
+        mapped = numpy.full((len(points), 3), numpy.nan)
+        triangles = numpy.full(len(points), -1, dtype = numpy.int64)
+        for begin in range(0, len(points), QUERY_BATCH):
+            end = min(begin + QUERY_BATCH, len(points))
+            self.MapBatch(points[begin:end], mapped[begin:end], triangles[begin:end])
+        return mapped, triangles
+
+    def MapBatch(self, points, mapped, triangles):
+        # fills in mapped and triangles for the points
+        xy = points[:, 0:2]
+        inside_grid = numpy.all((xy >= self.grid_min) & (xy <= self.grid_min + numpy.array(self.grid_size) * self.cell_size), axis = 1)
+        cells = self.GetCells(xy)
+        cells = cells[:, 0] * self.grid_size[1] + cells[:, 1]
+        counts = numpy.where(inside_grid, self.cell_starts[cells + 1] - self.cell_starts[cells], 0)
+
+        # every point with every triangle in its cell
+        pair_points = numpy.repeat(numpy.arange(len(points)), counts)
+        local = numpy.arange(len(pair_points)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        pair_tris = self.cell_tris[self.cell_starts[cells[pair_points]] + local]
+
+        corners = self.unwrapped[pair_tris].astype(numpy.float64)
+        weights = GetBarycentric(corners[:, :, 0:2], xy[pair_points])
+        inside = numpy.all(weights >= -INSIDE_TOLERANCE, axis = 1)
+        pair_points = pair_points[inside]
+        pair_tris = pair_tris[inside]
+        weights = weights[inside]
+        surface_z = (weights * corners[inside][:, :, 2]).sum(axis = 1)
+
+        # the top triangle for each point; after sorting by point, then z, the last of each point's pairs
+        order = numpy.lexsort((surface_z, pair_points))
+        last = numpy.ones(len(order), dtype = bool)
+        last[:-1] = pair_points[order][1:] != pair_points[order][:-1]
+        top = order[last]
+
+        found = pair_points[top]
+        sources = self.source[pair_tris[top]].astype(numpy.float64)
+        mapped_points = numpy.matmul(weights[top][:, numpy.newaxis, :], sources)[:, 0, :]
+        if points.shape[1] > 2:
+            # move outwards from the X axis by the height above the unwrapped surface
+            heights = points[found, 2] - surface_z[top]
+            radii = numpy.sqrt(mapped_points[:, 1] * mapped_points[:, 1] + mapped_points[:, 2] * mapped_points[:, 2])
+            scale = numpy.where(radii > 1e-12, heights / numpy.maximum(radii, 1e-12), 0.0)
+            mapped_points[:, 1:3] += mapped_points[:, 1:3] * scale[:, numpy.newaxis]
+        mapped[found] = mapped_points
+        triangles[found] = pair_tris[top]
+
+    def Save(self, path):
+        # the grid is made again when loading, it's quick compared with reading the triangles
+        f = open(path + '.tmp', 'wb')
+        numpy.savez(f, unwrapped = self.unwrapped, source = self.source, origin = self.origin)
+        f.close()
+        os.replace(path + '.tmp', path)
+
+def LoadIndex(path):
+    data = numpy.load(path)
+    return UnwrapIndex(data['unwrapped'], data['source'], data['origin'])
+
+def GetBarycentric(corners, xy):
+    # returns the barycentric coordinates of each point in its triangle, in X and Y, shape ( number, 3 )
+    # triangles with no area give nan, which isn't inside
+    a = corners[:, 0]
+    ab = corners[:, 1] - a
+    ac = corners[:, 2] - a
+    ap = xy - a
+    d = ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0]
+    with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+        v = (ap[:, 0] * ac[:, 1] - ap[:, 1] * ac[:, 0]) / d
+        w = (ab[:, 0] * ap[:, 1] - ab[:, 1] * ap[:, 0]) / d
+    return numpy.stack((1 - v - w, v, w), axis = 1)
+
+def MeshKey(tris):
+    # returns a content hash of the mesh, which doesn't change when the mesh is moved, and the mesh's minimum corner
+    tris = numpy.asarray(tris, dtype = numpy.float64)
+    if len(tris) == 0:
+        return hashlib.sha1(b'').hexdigest(), (0.0, 0.0, 0.0)
+    origin = tris.reshape(-1, 3).min(axis = 0)
+    relative = numpy.round(tris - origin, 4) + 0.0 # + 0.0 makes -0.0 into 0.0
+    return hashlib.sha1(relative.tobytes()).hexdigest(), tuple(origin.tolist())
+
+def GetCachePath(mesh_key):
+    return os.path.join(CACHE_FOLDER, mesh_key + '.npz')
+
+def SaveIndexForMesh(unwrapped, source):
+    # makes an index for the unwrapped triangles, and saves it for GetIndexForSolid to find
+    mesh_key, origin = MeshKey(unwrapped)
+    try:
+        if not os.path.isdir(CACHE_FOLDER):
+            os.makedirs(CACHE_FOLDER)
+        UnwrapIndex(unwrapped, source, origin).Save(GetCachePath(mesh_key))
+        import FourAxisCache
+        FourAxisCache.DiskCache(CACHE_FOLDER, CACHE_LIMIT, '.npz').RemoveOldest()
+    except Exception as e:
+        print('failed to write unwrap index: ' + str(e))
+
+def GetIndexForSolid(object):
+    # returns ( the index for an unwrapped solid, its origin now ), or ( None, None ) if it wasn't made by Unwrap Solid
+    import FourAxisCache
+    import Unwrap
+    tris = Unwrap.TrianglesFromBytes(FourAxisCache.tessellations.GetTris(object, Unwrap.TRIS_TOLERANCE).data)
+    mesh_key, origin = MeshKey(tris)
+    path = GetCachePath(mesh_key)
+    if not os.path.isfile(path):
+        return None, None
+    os.utime(path, None) # most recently used
+    return LoadIndex(path), origin
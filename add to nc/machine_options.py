@@ -0,0 +1,22 @@
+# reading a post's settings from its Machine element in machines.xml, shared by the posts in this folder
+# it is kept apart from the posts, as importing a post makes its nc.creator
+
+import os
+
+def read_machine_options(post):
+    # returns the attributes of the Machine element for the post, in the machines.xml next to this file
+    import xml.etree.ElementTree as ET
+    try:
+        f = open(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'machines.xml'))
+        text = f.read()
+        f.close()
+        # machines.xml is a list of Machine elements with no root element
+        if text.startswith('<?xml'):
+            text = text[text.index('?>') + 2:]
+        root = ET.fromstring('<Machines>' + text + '</Machines>')
+    except Exception:
+        return {}
+    for machine in root:
+        if machine.attrib.get('post') == post:
+            return machine.attrib
+    return {}
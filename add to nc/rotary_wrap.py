@@ -0,0 +1,234 @@
+import nc
+import iso
+import math
+from array import array
+import machine_options
+try:
+    import numpy
+except ImportError:
+    numpy = None # the feeds are worked out one block at a time instead
+
+# post for programs made on an unwrapped solid, cut on a machine with an A axis turning about X
+# Y becomes the A angle, Y / radius in radians, radius being the radius the solid was unwrapped at; X and Z are kept,
+# Z being the distance from the A axis, as it is for the unwrapped solid
+#
+# lines are written as they are, because the machine moves A in proportion along them, which is the same as the wrapped line
+# arcs can't be done in X and A, so they are made into lines, only as many as are needed to keep within the chordal tolerance
+# the feed moves are kept until a rapid, a feed rate change or the end, then their feeds are all worked out at once
+# with inverse time feed ( G93 ), each block's F is one over its time in minutes, its time being the length of the tool's real path
+# at its distance from the axis, divided by the feed rate; without it, F is scaled so the machine's mixed mm and degrees
+# length of the block takes the same time
+#
+# the settings come from this post's Machine element in machines.xml, for example
+# <Machine post="rotary_wrap" ... radius="10" chordal_tolerance="0.01" inverse_time="True"/>
+
+DEGREES_PER_RADIAN = 57.295779513082320
+MAX_KEPT_POINTS = 65536 # feed moves kept before their feeds are worked out
+
+def get_arc_points(sx, sy, sz, ex, ey, ez, cx, cy, direction, tolerance):
+    # returns a list of ( x, y, z ) along the arc, after the start, ending at the end, with the fewest lines within tolerance of the arc
+    # direction is 1 for anticlockwise, -1 for clockwise; an arc ending where it starts is a whole circle
+    r = math.hypot(sx - cx, sy - cy)
+    start_angle = math.atan2(sy - cy, sx - cx)
+    sweep = math.atan2(ey - cy, ex - cx) - start_angle
+    if direction > 0:
+        if sweep < 0.0 or (sweep == 0.0 and sx == ex and sy == ey):
+            sweep += 2 * math.pi
+    else:
+        if sweep > 0.0 or (sweep == 0.0 and sx == ex and sy == ey):
+            sweep -= 2 * math.pi
+    # the biggest angle for a line, so the middle of the arc is no further than tolerance from it
+    step = 2 * math.acos(1.0 - tolerance / r) if tolerance < r else math.pi
+    n = max(1, int(math.ceil(math.fabs(sweep) / min(step, math.pi) - 1e-9)))
+    points = []
+    for i in range(1, n):
+        angle = start_angle + sweep * i / n
+        points.append((cx + r * math.cos(angle), cy + r * math.sin(angle), sz + (ez - sz) * i / n))
+    points.append((ex, ey, ez))
+    return points
+
+def get_arc_centre(sx, sy, ex, ey, r, direction):
+    # returns the centre of an arc given by its radius; a positive radius is for an arc of up to half a circle, a negative one for more
+    mx = (sx + ex) * 0.5
+    my = (sy + ey) * 0.5
+    dx = ex - sx
+    dy = ey - sy
+    half_chord = math.hypot(dx, dy) * 0.5
+    if half_chord == 0.0:
+        return mx, my
+    h = math.sqrt(max(r * r - half_chord * half_chord, 0.0))
+    if (r < 0.0) != (direction < 0):
+        h = -h
+    # centre to the left of the chord for a small anticlockwise arc
+    return mx - dy / (2 * half_chord) * h, my + dx / (2 * half_chord) * h
+
+################################################################################
+class Creator(iso.Creator):
+
+    def __init__(self):
+        iso.Creator.__init__(self)
+        options = machine_options.read_machine_options(type(self).__module__)
+        self.radius = float(options.get('radius', 10.0)) # mm, the radius the solid was unwrapped at; Unwrap.UNWRAP_VALUE
+        self.chordal_tolerance = float(options.get('chordal_tolerance', 0.01)) # mm, on the part, from arcs to the lines written for them
+        self.inverse_time = options.get('inverse_time', 'True') == 'True' # G93, otherwise F is scaled for the mixed length of each block
+
+        self.ux = None # where the program is, in the unwrapped program's coordinates; iso.Creator has its own x, y and z
+        self.uy = None
+        self.uz = None
+        self.h_feed = None # mm per minute
+        self.v_feed = None # mm per minute, for moves only in Z
+        self.points = array('d') # x, y, z of the feed moves not written yet, starting with where they start from
+        self.written = {} # letter to text last written, so coordinates which haven't changed are left out
+        self.inverse_time_on = False
+        self.blocks = 0
+        self.arcs = 0
+
+    def get_a(self, y):
+        # returns the A angle in degrees for the Y coordinate
+        return y / self.radius * DEGREES_PER_RADIAN
+
+    def write_block(self, g, values):
+        # values is a list of ( letter, number ); letters which haven't changed since they were last written are left out, apart from F
+        text = g
+        for letter, value in values:
+            if value == None:
+                continue
+            s = '%.4f' % value
+            if letter != 'F' and self.written.get(letter) == s:
+                continue
+            self.written[letter] = s
+            text += ' ' + letter + s
+        if text != g:
+            self.write(text + '\n')
+            self.blocks += 1
+
+    def feedrate(self, f):
+        self.write_feeds()
+        self.h_feed = f
+        self.v_feed = f
+
+    def feedrate_hv(self, fh, fv):
+        self.write_feeds()
+        self.h_feed = fh
+        self.v_feed = fv
+
+    def rapid(self, x=None, y=None, z=None, a=None, b=None, c=None):
+        self.write_feeds()
+        if x != None:
+            self.ux = x
+        if y != None:
+            self.uy = y
+        if z != None:
+            self.uz = z
+        self.write_block('G00', [('X', x), ('Z', z), ('A', None if y == None else self.get_a(y))])
+
+    def feed(self, x=None, y=None, z=None, a=None, b=None, c=None):
+        self.move_to([(self.ux if x == None else x, self.uy if y == None else y, self.uz if z == None else z)])
+
+    def arc(self, direction, x=None, y=None, z=None, i=None, j=None, k=None, r=None):
+        # i and j are the centre, as given to nc.arc_cw and nc.arc_ccw
+        ex = self.ux if x == None else x
+        ey = self.uy if y == None else y
+        ez = self.uz if z == None else z
+        if self.ux == None or self.uy == None or self.uz == None:
+            self.move_to([(ex, ey, ez)])
+            return
+        if i == None or j == None:
+            i, j = get_arc_centre(self.ux, self.uy, ex, ey, r, direction)
+        # Y distances on the part are bigger than in the program by the distance from the axis over the radius
+        tolerance = self.chordal_tolerance * self.radius / max(math.fabs(self.uz), math.fabs(ez), self.radius)
+        self.arcs += 1
+        self.move_to(get_arc_points(self.ux, self.uy, self.uz, ex, ey, ez, i, j, direction, tolerance))
+
+    def arc_cw(self, x=None, y=None, z=None, i=None, j=None, k=None, r=None):
+        self.arc(-1, x, y, z, i, j, k, r)
+
+    def arc_ccw(self, x=None, y=None, z=None, i=None, j=None, k=None, r=None):
+        self.arc(1, x, y, z, i, j, k, r)
+
+    def move_to(self, points):
+        # keeps feed moves to the points, to be written by write_feeds
+        if self.ux == None or self.uy == None or self.uz == None:
+            # not known where it's starting from, so the time can't be worked out
+            x, y, z = points[-1]
+            self.write_block('G01', [('X', x), ('Z', z), ('A', None if y == None else self.get_a(y)), ('F', self.h_feed)])
+            self.ux, self.uy, self.uz = x, y, z
+            return
+        if len(self.points) == 0:
+            self.points.extend((self.ux, self.uy, self.uz))
+        for point in points:
+            self.points.extend(point)
+        self.ux, self.uy, self.uz = points[-1]
+        if len(self.points) >= 3 * MAX_KEPT_POINTS:
+            self.write_feeds()
+
+    def get_feeds(self, points):
+        # returns a list of F values for the blocks between the points, which are x, y, z one after the other, or None for blocks not moving
+        if numpy != None:
+            p = numpy.frombuffer(points, dtype = numpy.float64).reshape(-1, 3)
+            dx = numpy.diff(p[:, 0])
+            dy = numpy.diff(p[:, 1])
+            dz = numpy.diff(p[:, 2])
+            mean_z = numpy.fabs(p[1:, 2] + p[:-1, 2]) * 0.5
+            angles = dy / self.radius
+            length = numpy.sqrt(dx * dx + (mean_z * angles) * (mean_z * angles) + dz * dz)
+            # on the axis, only turning, use the length in the program
+            length = numpy.where(length > 0.0, length, numpy.sqrt(dx * dx + dy * dy + dz * dz))
+            rates = numpy.where((dx == 0.0) & (dy == 0.0), self.v_feed, self.h_feed)
+            with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+                minutes = length / rates
+                if self.inverse_time:
+                    feeds = 1.0 / minutes
+                else:
+                    degrees = angles * DEGREES_PER_RADIAN
+                    feeds = numpy.sqrt(dx * dx + degrees * degrees + dz * dz) / minutes
+            return [None if length_i == 0.0 else f for length_i, f in zip(length.tolist(), feeds.tolist())]
+
+        feeds = []
+        for i in range(3, len(points), 3):
+            dx = points[i] - points[i - 3]
+            dy = points[i + 1] - points[i - 2]
+            dz = points[i + 2] - points[i - 1]
+            mean_z = math.fabs(points[i + 2] + points[i - 1]) * 0.5
+            angle = dy / self.radius
+            length = math.sqrt(dx * dx + (mean_z * angle) * (mean_z * angle) + dz * dz)
+            if length == 0.0:
+                length = math.sqrt(dx * dx + dy * dy + dz * dz)
+                if length == 0.0:
+                    feeds.append(None)
+                    continue
+            minutes = length / (self.v_feed if dx == 0.0 and dy == 0.0 else self.h_feed)
+            if self.inverse_time:
+                feeds.append(1.0 / minutes)
+            else:
+                degrees = angle * DEGREES_PER_RADIAN
+                feeds.append(math.sqrt(dx * dx + degrees * degrees + dz * dz) / minutes)
+        return feeds
+
+    def write_feeds(self):
+        # writes the feed moves kept by move_to, with their feeds
+        if len(self.points) >= 6:
+            if self.h_feed == None or self.v_feed == None or self.h_feed <= 0.0 or self.v_feed <= 0.0:
+                raise Exception('rotary_wrap: feed move with no feed rate set')
+            if self.inverse_time and not self.inverse_time_on:
+                self.write('G93\n')
+                self.inverse_time_on = True
+            points = self.points
+            for n, f in enumerate(self.get_feeds(points)):
+                if f == None:
+                    continue
+                i = 3 * (n + 1)
+                self.write_block('G01', [('X', points[i]), ('Z', points[i + 2]), ('A', self.get_a(points[i + 1])), ('F', f)])
+        self.points = array('d')
+
+    def program_end(self):
+        self.write_feeds()
+        if self.inverse_time_on:
+            self.write('G94\n')
+            self.inverse_time_on = False
+        self.write('(rotary_wrap: %i blocks, %i arcs made into lines within %g)\n' % (self.blocks, self.arcs, self.chordal_tolerance))
+        iso.Creator.program_end(self)
+
+################################################################################
+
+nc.creator = Creator()
@@ -5,12 +5,144 @@ import datetime
 import time
 import os
 import sys
+import tempfile
+from array import array
+import machine_options
 up1 = os.path.abspath('..')
 sys.path.insert(0, up1)
 import area
 
 now = datetime.datetime.now()
 
+MOVES_PER_CHUNK = 65536 # moves kept in memory, any more are written to a temporary file
+
+class MoveStore:
+    # the feed moves, as 4 doubles each; sx, sy, ex, ey
+    # only one chunk of moves is kept in memory, full chunks are written to a temporary file, so memory use doesn't grow with the job
+    def __init__(self):
+        self.chunk = array('d')
+        self.file = None
+        self.count = 0
+        
+    def append(self, move):
+        self.chunk.extend(move)
+        self.count += 1
+        if len(self.chunk) >= 4 * MOVES_PER_CHUNK:
+            if self.file == None:
+                self.file = tempfile.TemporaryFile()
+            self.file.seek(0, 2)
+            self.chunk.tofile(self.file)
+            self.chunk = array('d')
+            
+    def __len__(self):
+        return self.count
+        
+    def chunks(self):
+        # yields arrays of up to MOVES_PER_CHUNK moves, in the order they were added
+        if self.file != None:
+            self.file.seek(0)
+            while True:
+                chunk = array('d')
+                try:
+                    chunk.fromfile(self.file, 4 * MOVES_PER_CHUNK)
+                except EOFError:
+                    # the items read before the end are still in the array
+                    if len(chunk) > 0:
+                        yield chunk
+                    break
+                yield chunk
+        if len(self.chunk) > 0:
+            yield self.chunk
+            
+    def read(self, start, count):
+        # returns an array of count moves, from the move at index start
+        moves = array('d')
+        in_file = self.count - len(self.chunk) // 4
+        if start < in_file:
+            self.file.seek(start * 4 * moves.itemsize)
+            moves.fromfile(self.file, 4 * min(count, in_file - start))
+        if start + count > in_file:
+            moves.extend(self.chunk[4 * max(start - in_file, 0):4 * (start + count - in_file)])
+        return moves
+        
+    def __iter__(self):
+        for chunk in self.chunks():
+            for i in range(0, len(chunk), 4):
+                yield chunk[i], chunk[i + 1], chunk[i + 2], chunk[i + 3]
+                
+    def close(self):
+        if self.file != None:
+            self.file.close()
+            self.file = None
+        self.chunk = array('d')
+        self.count = 0
+
+MAX_MERGED_POINTS = 256 # most points left out of one merged move, so checking them doesn't get slow
+
+def distance_to_segment(x, y, sx, sy, ex, ey):
+    dx = ex - sx
+    dy = ey - sy
+    length_squared = dx * dx + dy * dy
+    if length_squared == 0.0:
+        return math.hypot(x - sx, y - sy)
+    t = max(0.0, min(1.0, ((x - sx) * dx + (y - sy) * dy) / length_squared))
+    return math.hypot(x - (sx + t * dx), y - (sy + t * dy))
+
+def wrap_angle(angle):
+    # returns the angle in degrees, between -180 and 180
+    return (angle + 180.0) % 360.0 - 180.0
+
+class TimeEstimate:
+    # adds up the knife movements which aren't cutting, to estimate the time spent on them
+    def __init__(self):
+        self.lifts = 0
+        self.rapid_distance = 0.0
+        self.rotation = 0.0 # degrees
+        self.x = None
+        self.y = None
+        
+    def rapid_to(self, x, y):
+        if self.x != None:
+            self.rapid_distance += math.hypot(x - self.x, y - self.y)
+        self.x = x
+        self.y = y
+        
+    def seconds(self, lift_height, rapid_rate, a_rate):
+        return 60.0 * (self.lifts * 2 * lift_height + self.rapid_distance) / rapid_rate + 60.0 * self.rotation / a_rate
+
+class ChainGrid:
+    # the ends of the chains of moves, in buckets, for finding the nearest chain to start next
+    def __init__(self, xs, ys):
+        self.x0 = min(xs)
+        self.y0 = min(ys)
+        width = max(xs) - self.x0
+        height = max(ys) - self.y0
+        self.cell = max(math.sqrt(width * height / len(xs)), max(width, height) / len(xs), 1e-6)
+        self.max_ring = int(max(width, height) / self.cell) + 2
+        self.cells = {}
+        
+    def key(self, x, y):
+        return (int((x - self.x0) / self.cell), int((y - self.y0) / self.cell))
+        
+    def add(self, x, y, item):
+        k = self.key(x, y)
+        if k in self.cells:
+            self.cells[k].append(item)
+        else:
+            self.cells[k] = [item]
+            
+    def ring(self, k, r):
+        # yields the cell keys at ring r around k
+        if r == 0:
+            yield k
+            return
+        for dx in range(-r, r + 1):
+            yield (k[0] + dx, k[1] - r)
+            yield (k[0] + dx, k[1] + r)
+        for dy in range(-r + 1, r):
+            yield (k[0] - r, k[1] + dy)
+            yield (k[0] + r, k[1] + dy)
+
 ################################################################################
 class Creator(iso.Creator):
 
@@ -24,9 +156,36 @@ class Creator(iso.Creator):
         self.px = None # previous x,y coordinate
         self.py = None
         self.chamfer = None; # set to value, eg. 30, 45, 60 to output B and 45 degree moves
-        self.moves = [] # make a list of moves and output at the end once we've found all the heights
+        self.moves = MoveStore() # make a list of moves and output at the end once we've found all the heights
         # move is sx, sy, ex, ey
         
+        # the settings for joining moves come from this post's Machine element in machines.xml; they are all left out by default,
+        # so the G code is as it always was, and can be added to a machine to use them, for example
+        # <Machine post="tangent_knife" ... merge_tolerance="0.01" link_angle="10" reorder="True" rapid_rate="5000" a_rate="20000"/>
+        # link_angle changes the cut, as the knife turns in the material, which a tilted chamfer blade does in a cone
+        # reorder keeps the ends of every chain in memory, about 600 bytes each, and takes a while for hundreds of thousands of chains
+        options = machine_options.read_machine_options(type(self).__module__)
+        self.merge_tolerance = float(options['merge_tolerance']) if 'merge_tolerance' in options else None # mm; following moves are made into one, if the points between are this close to it
+        self.link_angle = float(options['link_angle']) if 'link_angle' in options else None # degrees; a move starting where the last one ended is cut without lifting, if the knife turns less than this
+        self.reorder = options.get('reorder', 'False') == 'True' # cut the joined moves in the order with least rapid travel
+        self.rapid_rate = float(options.get('rapid_rate', 5000.0)) # mm per minute, for the time estimate
+        self.a_rate = float(options.get('a_rate', 20000.0)) # degrees per minute, for the time estimate
+        
+        # the state of the knife while writing the moves
+        self.cutting = False # knife is down at the end of the last move
+        self.a = None # knife angle
+        self.cut_end = None # x, y at the end of the last move
+        self.cut_exit = None # x, y to rapid out to, with a chamfer
+        self.cuts = 0
+        self.original_time = TimeEstimate() # lifting for every move, in the order given
+        self.new_time = TimeEstimate()
+        self.original_a = None
+        
+        # the moves being merged, from merge_start, through merge_points, to merge_end
+        self.merge_start = None
+        self.merge_points = []
+        self.merge_end = None
+        
     def SPACE_STR(self): return ' '
 
     def program_begin(self, id, comment):
@@ -38,48 +197,23 @@ class Creator(iso.Creator):
         self.write('M3\n')
         
     def program_end(self):
-        for px, py, x, y in self.moves:
-            # start of a feed move
-            
-            # rapid to the top_z height
-            iso.Creator.rapid(self, z = self.top_z)
-
-            # calculate the tangent angle
-            angle = math.atan2(y - py, x - px) * 57.295779513082320 # radians to degrees
-            
-            if self.chamfer != None and math.fabs(self.chamfer) < 89.0:
-                forwards = area.Point(x-px, y - py) # vector along next line
-                forwards.normalize() # make it a unit vector
-                leftwards = ~forwards
-                entry_depth = self.bottom_rapid_z - self.bottom_feed_z
-                s = area.Point(px, py) + leftwards * (entry_depth * math.tan(self.chamfer * 0.017453292519943))
-                
-                # angle the cutter while rapiding to the start of the move
-                iso.Creator.rapid(self, s.x, s.y, None, a = angle, b = self.chamfer)
-            else:
-                # angle the cutter while rapiding to the start of the move
-                iso.Creator.rapid(self, px, py, None, a = angle)
-
-            # rapid down
-            iso.Creator.rapid(self, z = self.bottom_rapid_z)
-            
-            if self.chamfer:            
-                # feed down
-                iso.Creator.feed(self, px, py, z = self.bottom_feed_z)
-            else:
-                # feed down
-                iso.Creator.feed(self, z = self.bottom_feed_z)
-
-            # do the feed move
-            iso.Creator.feed(self, x, y)
-
-            if self.chamfer:            
-                # rapid out at an angle
-                e = area.Point(x, y) + leftwards * (entry_depth * math.tan(self.chamfer * 0.017453292519943))
-                iso.Creator.rapid(self, e.x, e.y, z = self.bottom_rapid_z)
+        self.end_merge()
+        
+        if self.reorder and self.link_angle != None and len(self.moves) > 0:
+            chunks = self.ordered_chunks()
+        else:
+            chunks = self.moves.chunks()
+        for chunk in chunks:
+            for i in range(0, len(chunk), 4):
+                self.write_move(chunk[i], chunk[i + 1], chunk[i + 2], chunk[i + 3])
+        self.end_cut()
+        self.moves.close()
         
         # rapid to the top_z height
         iso.Creator.rapid(self, z = self.top_z)
+        
+        if self.link_angle != None:
+            self.write_time_saved()
 
         self.write('M5\n')
         self.write('G00 X0.0000 Y0.0000\n')
@@ -88,6 +222,186 @@ class Creator(iso.Creator):
         
         self.file_close()        
         
+    def is_linked(self, px, py, angle):
+        return self.link_angle != None and self.cutting and px == self.cut_end[0] and py == self.cut_end[1] and math.fabs(angle - self.a) <= self.link_angle
+        
+    def write_move(self, px, py, x, y):
+        # retract, turn the knife to the direction of the move, plunge and cut
+        # or, if the move carries on from the last one, turn the knife where it is and cut
+        angle, entry, exit = self.get_move_geometry(px, py, x, y)
+        
+        if self.link_angle != None and self.a != None:
+            # turn the shortest way
+            angle = self.a + wrap_angle(angle - self.a)
+            
+        if self.is_linked(px, py, angle):
+            if angle != self.a:
+                iso.Creator.feed(self, a = angle)
+                self.new_time.rotation += math.fabs(angle - self.a)
+            iso.Creator.feed(self, x, y)
+            self.a = angle
+            self.cut_end = (x, y)
+            self.cut_exit = exit
+            self.new_time.x = x
+            self.new_time.y = y
+            return
+        
+        self.end_cut()
+        self.cuts += 1
+        self.new_time.lifts += 1
+        self.new_time.rapid_to(px, py)
+        self.new_time.x = x
+        self.new_time.y = y
+        if self.a != None:
+            self.new_time.rotation += math.fabs(angle - self.a)
+        
+        # rapid to the top_z height
+        iso.Creator.rapid(self, z = self.top_z)
+        
+        if entry != None:
+            # angle the cutter while rapiding to the start of the move
+            iso.Creator.rapid(self, entry[0], entry[1], None, a = angle, b = self.chamfer)
+        else:
+            # angle the cutter while rapiding to the start of the move
+            iso.Creator.rapid(self, px, py, None, a = angle)
+
+        # rapid down
+        iso.Creator.rapid(self, z = self.bottom_rapid_z)
+        
+        if self.chamfer:            
+            # feed down
+            iso.Creator.feed(self, px, py, z = self.bottom_feed_z)
+        else:
+            # feed down
+            iso.Creator.feed(self, z = self.bottom_feed_z)
+
+        # do the feed move
+        iso.Creator.feed(self, x, y)
+        
+        self.cutting = True
+        self.a = angle
+        self.cut_end = (x, y)
+        self.cut_exit = exit
+        
+    def has_chamfer_offset(self):
+        return self.chamfer != None and math.fabs(self.chamfer) < 89.0
+        
+    def get_move_geometry(self, px, py, x, y):
+        # returns the tangent angle in degrees, and the points to the left of the start and end, where the chamfer starts at the top of the cut, or None for them
+        angle = math.atan2(y - py, x - px) * 57.295779513082320 # radians to degrees
+        if not self.has_chamfer_offset():
+            return angle, None, None
+        forwards = area.Point(x-px, y - py) # vector along next line
+        forwards.normalize() # make it a unit vector
+        leftwards = ~forwards
+        entry_depth = self.bottom_rapid_z - self.bottom_feed_z
+        s = area.Point(px, py) + leftwards * (entry_depth * math.tan(self.chamfer * 0.017453292519943))
+        e = area.Point(x, y) + leftwards * (entry_depth * math.tan(self.chamfer * 0.017453292519943))
+        return angle, (s.x, s.y), (e.x, e.y)
+        
+    def end_cut(self):
+        if self.cutting and self.chamfer and self.cut_exit != None:
+            # rapid out at an angle
+            iso.Creator.rapid(self, self.cut_exit[0], self.cut_exit[1], z = self.bottom_rapid_z)
+        self.cutting = False
+        
+    def get_chains(self):
+        # returns arrays of the first move index, number of moves, start x, start y, end x and end y, for each run of moves which will be joined
+        firsts = array('l')
+        counts = array('l')
+        ends = [array('d'), array('d'), array('d'), array('d')]
+        index = 0
+        previous = None # ( x, y, angle ) at the end of the previous move
+        for px, py, x, y in self.moves:
+            angle = math.atan2(y - py, x - px) * 57.295779513082320
+            if previous != None and px == previous[0] and py == previous[1] and math.fabs(wrap_angle(angle - previous[2])) <= self.link_angle:
+                counts[-1] += 1
+                ends[2][-1] = x
+                ends[3][-1] = y
+            else:
+                firsts.append(index)
+                counts.append(1)
+                for values, value in zip(ends, (px, py, x, y)):
+                    values.append(value)
+            previous = (x, y, angle)
+            index += 1
+        return firsts, counts, ends
+        
+    def order_chains(self, sx, sy, ex, ey):
+        # returns a list of ( chain index, reversed ), nearest chain next, starting with the first chain
+        # chains are only reversed if there's no chamfer, because the chamfer would then be on the other side
+        n = len(sx)
+        can_reverse = not self.chamfer
+        grid = ChainGrid(list(sx) + list(ex), list(sy) + list(ey))
+        for i in range(1, n):
+            grid.add(sx[i], sy[i], (i, False))
+            if can_reverse:
+                grid.add(ex[i], ey[i], (i, True))
+        used = bytearray(n)
+        used[0] = 1
+        order = [(0, False)]
+        x = ex[0]
+        y = ey[0]
+        for k in range(1, n):
+            centre = grid.key(x, y)
+            best = None
+            for r in range(0, grid.max_ring + 1):
+                for cell_key in grid.ring(centre, r):
+                    if not cell_key in grid.cells:
+                        continue
+                    cell = grid.cells[cell_key]
+                    cell[:] = [item for item in cell if not used[item[0]]]
+                    for item in cell:
+                        i, reverse = item
+                        d = math.hypot((ex[i] if reverse else sx[i]) - x, (ey[i] if reverse else sy[i]) - y)
+                        if best == None or d < best[0]:
+                            best = (d, item)
+                if best != None and best[0] <= r * grid.cell:
+                    # anything in further rings is further away
+                    break
+            i, reverse = best[1]
+            used[i] = 1
+            order.append(best[1])
+            x = sx[i] if reverse else ex[i]
+            y = sy[i] if reverse else ey[i]
+        return order
+        
+    def ordered_chunks(self):
+        # yields arrays of moves, a chain at a time, in the order given by order_chains
+        # chains are put together into chunks of about MOVES_PER_CHUNK, so the geometry can be done many moves at a time
+        firsts, counts, (sx, sy, ex, ey) = self.get_chains()
+        chunk = array('d')
+        for i, reverse in self.order_chains(sx, sy, ex, ey):
+            moves = self.moves.read(firsts[i], counts[i])
+            if reverse:
+                for j in range(len(moves) - 4, -1, -4):
+                    chunk.extend((moves[j + 2], moves[j + 3], moves[j], moves[j + 1]))
+            else:
+                chunk.extend(moves)
+            if len(chunk) >= 4 * MOVES_PER_CHUNK:
+                yield chunk
+                chunk = array('d')
+        if len(chunk) > 0:
+            yield chunk
+                    
+    def estimate_original(self, px, py, x, y):
+        # the time of lifting and turning for every move, as done without joining
+        angle = math.atan2(y - py, x - px) * 57.295779513082320
+        self.original_time.lifts += 1
+        self.original_time.rapid_to(px, py)
+        self.original_time.x = x
+        self.original_time.y = y
+        if self.original_a != None:
+            self.original_time.rotation += math.fabs(angle - self.original_a)
+        self.original_a = angle
+        
+    def write_time_saved(self):
+        lift_height = self.top_z - self.bottom_rapid_z
+        before = self.original_time.seconds(lift_height, self.rapid_rate, self.a_rate)
+        after = self.new_time.seconds(lift_height, self.rapid_rate, self.a_rate)
+        report = 'tangent knife: %i moves joined into %i cuts, estimated time saved %0.1f seconds of %0.1f' % (self.original_time.lifts, self.cuts, before - after, before)
+        self.write('(' + report + ')\n')
+        
     def write_misc(self):
         # ignore M3
         pass
@@ -135,9 +449,40 @@ class Creator(iso.Creator):
                 y = self.py
 
             if x != self.px or y != self.py:
-                self.moves.append((self.px, self.py, x, y))
+                if self.link_angle != None:
+                    self.estimate_original(self.px, self.py, x, y)
+                if self.merge_tolerance != None:
+                    self.merge_move(self.px, self.py, x, y)
+                else:
+                    self.add_move(self.px, self.py, x, y)
             self.px = x
             self.py = y
+            
+    def add_move(self, px, py, x, y):
+        self.moves.append((px, py, x, y))
+            
+    def merge_move(self, px, py, x, y):
+        # adds the move to the moves being merged, if it carries on from them and all the points in between stay within merge_tolerance
+        if self.merge_end == (px, py) and (x, y) != self.merge_start and len(self.merge_points) < MAX_MERGED_POINTS:
+            sx, sy = self.merge_start
+            if distance_to_segment(px, py, sx, sy, x, y) <= self.merge_tolerance:
+                for mx, my in self.merge_points:
+                    if distance_to_segment(mx, my, sx, sy, x, y) > self.merge_tolerance:
+                        break
+                else:
+                    self.merge_points.append((px, py))
+                    self.merge_end = (x, y)
+                    return
+        self.end_merge()
+        self.merge_start = (px, py)
+        self.merge_end = (x, y)
+        
+    def end_merge(self):
+        if self.merge_start != None:
+            self.add_move(self.merge_start[0], self.merge_start[1], self.merge_end[0], self.merge_end[1])
+        self.merge_start = None
+        self.merge_points = []
+        self.merge_end = None
            
 ################################################################################
 
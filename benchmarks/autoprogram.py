@@ -0,0 +1,152 @@
+# benchmark of the whole AutoProgram pipeline, run headless on the generated parts in parts.py
+# wx, cad and the PyCAM operations are replaced by standins.py; geom is the real one, from ../../PyCAD
+# for each part it records the time of each stage, the number of each type of object added and the peak memory,
+# writes them to a json file, and compares them with a baseline from an earlier run
+# the exit code is 1 if anything got slower or bigger than the tolerance allows, or the operations changed
+#
+# usage: python autoprogram.py [--save-baseline] [--baseline file] [--output file] [--repeat N] [--cache] [part names]
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.realpath(this_dir + '/..'))
+for folder in ['PyCAD', 'PyCAM', 'dsim']:
+    sys.path.append(os.path.realpath(this_dir + '/../../' + folder))
+
+import standins
+standins.Install()
+
+import FourAxis
+import parts
+
+FourAxis.available_tools_path = os.path.join(this_dir, 'available.tools')
+
+DEFAULT_BASELINE = os.path.join(this_dir, 'autoprogram_baseline.json')
+DEFAULT_OUTPUT = os.path.join(this_dir, 'autoprogram_results.json')
+TIME_TOLERANCE = 0.25 # fraction slower than the baseline allowed
+MEMORY_TOLERANCE = 0.25 # fraction more memory than the baseline allowed
+MIN_TIME_CHANGE = 0.05 # seconds, smaller changes are noise
+
+def GetMaxRss():
+    # peak resident memory of the process in bytes, which includes geom's memory, or None if it can't be found
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if platform.system() == 'Darwin' else rss * 1024
+
+def RunPart(path, use_cache):
+    # returns the result dictionary for one run of AutoProgram on the part
+    document = standins.NewDocument()
+    standins.AddStlSolid(path)
+
+    auto_program = FourAxis.AutoProgram()
+    auto_program.headless = True
+    auto_program.want_time_print = False
+    auto_program.use_geometry_cache = use_cache
+    auto_program.create_gcode = False
+    auto_program.incremental = False # the same part is run more than once, each should be a full run
+
+    tracemalloc.start()
+    start = time.time()
+    auto_program.Run()
+    total = time.time() - start
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    stages = {}
+    for name, seconds in auto_program.tracer.GetStageTimes():
+        stages[name] = stages.get(name, 0.0) + seconds
+
+    return {
+        'failure':auto_program.failure,
+        'warnings':len(auto_program.warnings),
+        'total':total,
+        'stages':stages,
+        'objects':document.counts,
+        'operations':len(standins.app.program.operations.children),
+        'peak_memory':peak_memory,
+        }
+
+def RunBenchmark(names, repeat, use_cache):
+    results = {}
+    for name, path in parts.WriteCorpus(os.path.join(this_dir, 'parts'), names):
+        best = None
+        for i in range(0, repeat):
+            result = RunPart(path, use_cache)
+            if best == None or result['total'] < best['total']:
+                best = result
+        results[name] = best
+        print('%-16s %7.3f s  %4i operations  %8.1f kB peak  %s' % (name, best['total'], best['operations'], best['peak_memory'] / 1024.0, best['failure'] or ''))
+    return results
+
+def Compare(results, baseline):
+    # returns a list of regressions, as messages
+    regressions = []
+    for name in sorted(baseline):
+        if not name in results:
+            continue
+        old = baseline[name]
+        new = results[name]
+        if new['failure'] != old['failure']:
+            regressions.append('%s: failure changed from %s to %s' % (name, old['failure'], new['failure']))
+        if new['objects'] != old['objects']:
+            regressions.append('%s: objects added changed from %s to %s' % (name, old['objects'], new['objects']))
+        times = [('total', old['total'], new['total'])]
+        for stage in sorted(old['stages']):
+            if stage in new['stages']:
+                times.append((stage, old['stages'][stage], new['stages'][stage]))
+        for stage, old_time, new_time in times:
+            if new_time > old_time * (1.0 + TIME_TOLERANCE) and new_time - old_time > MIN_TIME_CHANGE:
+                regressions.append('%s: %s took %0.3f s, was %0.3f s' % (name, stage, new_time, old_time))
+        if new['peak_memory'] > old['peak_memory'] * (1.0 + MEMORY_TOLERANCE):
+            regressions.append('%s: peak memory %i bytes, was %i bytes' % (name, new['peak_memory'], old['peak_memory']))
+    return regressions
+
+def WriteJson(path, value):
+    f = open(path, 'w')
+    json.dump(value, f, indent = 1, sort_keys = True)
+    f.close()
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark AutoProgram on generated parts')
+    parser.add_argument('names', nargs = '*', help = 'parts to run, default all of them')
+    parser.add_argument('--baseline', default = DEFAULT_BASELINE, help = 'results to compare with')
+    parser.add_argument('--save-baseline', action = 'store_true', help = 'write the results as the new baseline, instead of comparing')
+    parser.add_argument('--output', default = DEFAULT_OUTPUT, help = 'json file to write the results to')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'number of runs of each part, the fastest is kept')
+    parser.add_argument('--cache', action = 'store_true', help = 'use the geometry cache, to time runs after the first')
+    args = parser.parse_args()
+
+    results = RunBenchmark(args.names if len(args.names) > 0 else None, max(1, args.repeat), args.cache)
+    WriteJson(args.output, {'parts':results, 'max_rss':GetMaxRss(), 'python':platform.python_version()})
+
+    if args.save_baseline:
+        WriteJson(args.baseline, results)
+        print('baseline written to ' + args.baseline)
+        return 0
+
+    if not os.path.isfile(args.baseline):
+        print('no baseline to compare with, make one with --save-baseline')
+        return 0
+
+    f = open(args.baseline, 'r')
+    baseline = json.load(f)
+    f.close()
+    regressions = Compare(results, baseline)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    if len(regressions) > 0:
+        return 1
+    print('no regressions compared with ' + args.baseline)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+# check that cancelling Auto Program leaves the document as it was before the run
+# the run is cancelled at the start of each stage in turn, as the progress dialog's cancel button does, and the document is
+# compared with what it was before; an undo step made before the run must still be there afterwards, so a run cancelled
+# before it changed anything doesn't undo the step before it
+# wx, cad and the PyCAM operations are replaced by standins.py, whose undo keeps each outermost history as one step;
+# geom is the real one, from ../../PyCAD
+#
+# usage: python cancel.py [part names]
+
+import os
+import sys
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.realpath(this_dir + '/..'))
+for folder in ['PyCAD', 'PyCAM', 'dsim']:
+    sys.path.append(os.path.realpath(this_dir + '/../../' + folder))
+
+import standins
+standins.Install()
+
+import cad
+import FourAxis
+import parts
+
+FourAxis.available_tools_path = os.path.join(this_dir, 'available.tools')
+
+class CancellingAutoProgram(FourAxis.AutoProgram):
+    # cancels at the start of stage number cancel_at, counting from 0
+    def __init__(self, cancel_at):
+        FourAxis.AutoProgram.__init__(self)
+        self.cancel_at = cancel_at
+        self.stages_started = 0
+        self.cancelled_stage = None
+
+    def progress_update(self, txt):
+        if self.stages_started == self.cancel_at:
+            self.cancelled_stage = txt.rstrip('.')
+            self.cancel.Cancel()
+        self.stages_started += 1
+        FourAxis.AutoProgram.progress_update(self, txt)
+
+def RunPart(path, cancel_at):
+    # returns the AutoProgram, and whether the document and undo steps are as they were before the run
+    document = standins.NewDocument()
+    standins.AddStlSolid(path)
+    cad.StartHistory('Before Auto Program')
+    cad.AddUndoably(cad.NewPoint(None))
+    cad.EndHistory()
+    before = standins.GetDocumentState()
+    undo_steps = len(document.undo_steps)
+
+    auto_program = CancellingAutoProgram(cancel_at)
+    auto_program.headless = True
+    auto_program.want_time_print = False
+    auto_program.use_geometry_cache = False
+    auto_program.create_gcode = False
+    auto_program.incremental = False
+    auto_program.Run()
+    return auto_program, standins.GetDocumentState() == before and len(document.undo_steps) == undo_steps
+
+def main():
+    names = sys.argv[1:] if len(sys.argv) > 1 else None
+    failures = 0
+    for name, path in parts.WriteCorpus(os.path.join(this_dir, 'parts'), names):
+        cancel_at = 0
+        while True:
+            auto_program, unchanged = RunPart(path, cancel_at)
+            if auto_program.cancelled_stage == None:
+                break # the run had fewer stages, so it finished
+            ok = unchanged and auto_program.failure == 'Auto Program cancelled'
+            print('%-12s cancelled at %-30s %s' % (name, auto_program.cancelled_stage, 'ok' if ok else 'the document was changed'))
+            if not ok:
+                failures += 1
+            cancel_at += 1
+    print('%i failures' % failures)
+    return 1 if failures > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+# check that DrillPath.OptimizeOrder keeps to its time budget on the usual drilling patterns
+# a row of holes with float noise in the centres used to give the grid tiny cells, so finding the nearest hole searched
+# millions of empty cells and took far longer than the budget
+# the exit code is 1 if any pattern took longer than the budget plus the allowance
+#
+# usage: python drill_order.py
+
+import os
+import sys
+import time
+import random
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.realpath(this_dir + '/..'))
+
+import DrillPath
+
+TIME_BUDGET = 0.2
+TIME_ALLOWANCE = 0.3 # seconds over the budget allowed, for the steps the budget doesn't cover
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+def Row(number, noise, rnd):
+    # holes 10mm apart along X, with the Y of their centres off by up to noise
+    return [Point(i * 10.0, rnd.uniform(-noise, noise)) for i in range(0, number)]
+
+def Column(number, noise, rnd):
+    return [Point(rnd.uniform(-noise, noise), i * 10.0) for i in range(0, number)]
+
+def Diagonal(number, noise, rnd):
+    return [Point(i * 7.0 + rnd.uniform(-noise, noise), i * 7.0) for i in range(0, number)]
+
+def Grid(number, noise, rnd):
+    columns = int(number ** 0.5) + 1
+    return [Point((i % columns) * 5.0 + rnd.uniform(-noise, noise), (i // columns) * 5.0) for i in range(0, number)]
+
+PATTERNS = [('row', Row), ('column', Column), ('diagonal', Diagonal), ('grid', Grid)]
+
+def main():
+    rnd = random.Random(1)
+    failures = 0
+    for name, pattern in PATTERNS:
+        for number in [50, 1000]:
+            for noise in [0.0, 1e-9, 1e-5]:
+                pts = pattern(number, noise, rnd)
+                start = time.time()
+                new_pts, before, after = DrillPath.OptimizeOrder(pts, time_budget = TIME_BUDGET)
+                seconds = time.time() - start
+                ok = seconds <= TIME_BUDGET + TIME_ALLOWANCE and len(new_pts) == len(pts) and after <= before
+                print('%-10s %5i holes noise %-6g %7.3f s %s' % (name, number, noise, seconds, 'ok' if ok else 'FAILED'))
+                if not ok:
+                    failures += 1
+    print('%i failures' % failures)
+    return 1 if failures > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
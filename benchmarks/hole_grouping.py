@@ -0,0 +1,81 @@
+# benchmark of grouping holes in CutShadowInners
+# compares HoleIndex with the original way of calling Hole.AddHole on every existing group
+#
+# usage: python hole_grouping.py [number of holes]
+
+import os
+import sys
+import time
+import random
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.realpath(this_dir + '/..'))
+for folder in ['PyCAD', 'PyCAM', 'dsim']:
+    sys.path.append(os.path.realpath(this_dir + '/../../' + folder))
+
+import FourAxis
+
+PRECISION = 0.1
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+class Circle:
+    def __init__(self, c, radius):
+        self.c = c
+        self.radius = radius
+
+def MakePlate(num_holes, num_diameters, seed = 1):
+    # a perforated plate; holes on a grid, with a few nominal diameters, each hole a bit off its nominal size
+    rnd = random.Random(seed)
+    diameters = [2.0 + i * 0.5 for i in range(0, num_diameters)]
+    columns = int(num_holes ** 0.5) + 1
+    circles = []
+    for i in range(0, num_holes):
+        d = rnd.choice(diameters) + rnd.uniform(-PRECISION * 0.3, PRECISION * 0.3)
+        circles.append(Circle(Point((i % columns) * 5.0, (i // columns) * 5.0), d * 0.5))
+    return circles
+
+def GroupQuadratic(circles, thickness):
+    holes_to_drill = []
+    for circle in circles:
+        hole = FourAxis.Hole(circle, 0.0, -thickness)
+        for h in holes_to_drill:
+            if h.AddHole(hole, PRECISION):
+                hole = None
+                break
+        if hole != None:
+            holes_to_drill.append(hole)
+    return holes_to_drill
+
+def GroupIndexed(circles, thickness):
+    hole_index = FourAxis.HoleIndex(PRECISION)
+    for circle in circles:
+        hole_index.Add(FourAxis.Hole(circle, 0.0, -thickness))
+    return hole_index.holes
+
+def Signature(holes):
+    return [(hole.diameter, [(p.x, p.y) for p in hole.pts]) for hole in holes]
+
+def Run(num_holes):
+    print('%i holes' % num_holes)
+    for num_diameters in [1, 10, 1000]:
+        circles = MakePlate(num_holes, num_diameters)
+
+        start = time.time()
+        quadratic = GroupQuadratic(circles, 10.0)
+        quadratic_time = time.time() - start
+
+        start = time.time()
+        indexed = GroupIndexed(circles, 10.0)
+        indexed_time = time.time() - start
+
+        if Signature(quadratic) != Signature(indexed):
+            raise RuntimeError('HoleIndex gave different groups, with %i diameters' % num_diameters)
+
+        print('%3i diameters, %4i groups: AddHole loop %0.3f s, HoleIndex %0.3f s' % (num_diameters, len(indexed), quadratic_time, indexed_time))
+
+if __name__ == '__main__':
+    Run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
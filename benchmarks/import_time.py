@@ -0,0 +1,77 @@
+# checks that importing FourAxis is quick, and doesn't import the dialog and operations modules, which it should only load
+# when Auto Program uses them; it's imported in a new python, with wx, cad and step from standins.py and the real geom
+# the exit code is 1 if it takes longer than the budget, or any of the operations modules get imported
+#
+# usage: python import_time.py [--budget seconds] [--repeat N]
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+
+DEFAULT_BUDGET = 1.0 # seconds
+
+# run in the new python; the operations modules aren't installed as stand-ins, and trying to import them is recorded
+CHILD_SCRIPT = '''
+import os, sys, json, time
+this_dir = %r
+sys.path.append(os.path.realpath(this_dir + '/..'))
+for folder in ['PyCAD', 'PyCAM', 'dsim']:
+    sys.path.append(os.path.realpath(this_dir + '/../../' + folder))
+sys.path.append(this_dir)
+import standins
+standins.Install(operations = False)
+
+class RecordImports:
+    # finds no modules, but remembers which operations modules were looked for
+    def __init__(self):
+        self.names = []
+    def find_spec(self, name, path, target = None):
+        if name in standins.OPERATION_MODULES:
+            self.names.append(name)
+        return None
+    def find_module(self, name, path = None):
+        return None
+
+recorder = RecordImports()
+sys.meta_path.insert(0, recorder)
+geom_start = time.time()
+import geom # not counted, it's needed by everything
+start = time.time()
+import FourAxis
+seconds = time.time() - start
+print(json.dumps({'seconds':seconds, 'geom_seconds':start - geom_start, 'imported':recorder.names}))
+'''
+
+def TimeImport():
+    # returns the result of importing FourAxis in a new python
+    output = subprocess.check_output([sys.executable, '-c', CHILD_SCRIPT % this_dir])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Check the time to import FourAxis, and that it loads its operations modules lazily')
+    parser.add_argument('--budget', type = float, default = DEFAULT_BUDGET, help = 'most seconds allowed for importing FourAxis')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'number of imports, the fastest is kept')
+    args = parser.parse_args()
+
+    best = None
+    for i in range(0, max(1, args.repeat)):
+        result = TimeImport()
+        if best == None or result['seconds'] < best['seconds']:
+            best = result
+
+    failures = []
+    print('importing FourAxis took %0.3f s, budget %0.3f s, geom took %0.3f s before it' % (best['seconds'], args.budget, best['geom_seconds']))
+    if best['seconds'] > args.budget:
+        failures.append('import took %0.3f s, more than the budget of %0.3f s' % (best['seconds'], args.budget))
+    if len(best['imported']) > 0:
+        failures.append('operations modules imported: ' + ', '.join(sorted(set(best['imported']))))
+    for failure in failures:
+        print('FAIL ' + failure)
+    return 1 if len(failures) > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+# generated test parts for the AutoProgram benchmark, written as binary stl files
+# most parts are made from a grid of square cells, each with a height; 0 is no material, and a cell can have a hole through it
+# the triangles are wound anticlockwise seen from outside, and neighbouring cells share their corner vertices, so the meshes are closed
+#
+# usage: python parts.py [folder]
+
+import os
+import sys
+import math
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.realpath(this_dir + '/..'))
+
+import StlData
+
+HOLE_SIDES = 16 # number of sides on the polygon for a round hole, a multiple of 4
+
+class Mesh:
+    def __init__(self):
+        self.coords = []
+
+    def Triangle(self, a, b, c):
+        self.coords += a
+        self.coords += b
+        self.coords += c
+
+    def Quad(self, a, b, c, d):
+        # a, b, c, d anticlockwise seen from outside
+        self.Triangle(a, b, c)
+        self.Triangle(a, c, d)
+
+    def NumTriangles(self):
+        return len(self.coords) // 9
+
+class Grid:
+    def __init__(self, columns, rows, cell, thickness):
+        self.columns = columns
+        self.rows = rows
+        self.cell = cell
+        self.thickness = thickness
+        self.heights = [[thickness] * rows for i in range(0, columns)]
+        self.holes = {} # ( i, j ) to hole diameter
+
+    def GetHeight(self, i, j):
+        if i < 0 or j < 0 or i >= self.columns or j >= self.rows:
+            return 0.0
+        return self.heights[i][j]
+
+    def MakeMesh(self):
+        mesh = Mesh()
+        for i in range(0, self.columns):
+            for j in range(0, self.rows):
+                h = self.heights[i][j]
+                if h <= 0.0:
+                    continue
+                x0 = i * self.cell
+                y0 = j * self.cell
+                x1 = x0 + self.cell
+                y1 = y0 + self.cell
+                if (i, j) in self.holes:
+                    self.AddHoleCell(mesh, x0, y0, h, self.holes[(i, j)])
+                else:
+                    mesh.Quad([x0, y0, h], [x1, y0, h], [x1, y1, h], [x0, y1, h])
+                    mesh.Quad([x0, y0, 0.0], [x0, y1, 0.0], [x1, y1, 0.0], [x1, y0, 0.0])
+                # walls down to any lower neighbour, going anticlockwise round the cell
+                edges = [((x0, y0), (x1, y0), (i, j - 1)), ((x1, y0), (x1, y1), (i + 1, j)), ((x1, y1), (x0, y1), (i, j + 1)), ((x0, y1), (x0, y0), (i - 1, j))]
+                for p, q, neighbour in edges:
+                    h2 = self.GetHeight(*neighbour)
+                    if h2 < h:
+                        mesh.Quad([p[0], p[1], h2], [q[0], q[1], h2], [q[0], q[1], h], [p[0], p[1], h])
+        return mesh
+
+    def AddHoleCell(self, mesh, x0, y0, h, diameter):
+        # top and bottom faces of the cell with a polygon hole in the middle, and the wall of the hole
+        half = self.cell * 0.5
+        cx = x0 + half
+        cy = y0 + half
+        r = diameter * 0.5
+        circle = [(cx + r * math.cos(2 * math.pi * k / HOLE_SIDES), cy + r * math.sin(2 * math.pi * k / HOLE_SIDES)) for k in range(0, HOLE_SIDES)]
+        corners = [(cx + half, cy + half), (cx - half, cy + half), (cx - half, cy - half), (cx + half, cy - half)] # at 45, 135, 225 and 315 degrees
+        per_corner = HOLE_SIDES // 4
+        for k in range(0, HOLE_SIDES):
+            c0 = circle[k]
+            c1 = circle[(k + 1) % HOLE_SIDES]
+            corner = corners[k // per_corner]
+            mesh.Triangle([c0[0], c0[1], h], [corner[0], corner[1], h], [c1[0], c1[1], h])
+            mesh.Triangle([c0[0], c0[1], 0.0], [c1[0], c1[1], 0.0], [corner[0], corner[1], 0.0])
+            if (k + 1) % per_corner == 0:
+                # fill between this corner and the next one
+                next_corner = corners[((k + 1) // per_corner) % 4]
+                mesh.Triangle([c1[0], c1[1], h], [corner[0], corner[1], h], [next_corner[0], next_corner[1], h])
+                mesh.Triangle([c1[0], c1[1], 0.0], [next_corner[0], next_corner[1], 0.0], [corner[0], corner[1], 0.0])
+            mesh.Quad([c0[0], c0[1], 0.0], [c0[0], c0[1], h], [c1[0], c1[1], h], [c1[0], c1[1], 0.0])
+
+def HolePlate(num_holes, thickness = 6.0):
+    # a square plate with through holes of a few drill sizes and a few sizes with no drill, which get profiled
+    columns = int(math.ceil(math.sqrt(num_holes))) + 2
+    grid = Grid(columns, columns, 8.0, thickness)
+    diameters = [3.0, 4.0, 5.0, 4.4]
+    for k in range(0, num_holes):
+        grid.holes[(1 + k % (columns - 2), 1 + k // (columns - 2))] = diameters[k % len(diameters)]
+    return grid.MakeMesh()
+
+def PocketLevels(num_levels, thickness = 20.0):
+    # a block with steps going down towards the middle, one pocket level per step
+    size = 4 * num_levels + 6
+    grid = Grid(size, size // 2 + 4, 4.0, thickness)
+    step = thickness * 0.8 / num_levels
+    for i in range(0, grid.columns):
+        for j in range(0, grid.rows):
+            ring = min(i, j, grid.columns - 1 - i, grid.rows - 1 - j)
+            level = min(max(ring - 1, 0), num_levels)
+            grid.heights[i][j] = thickness - level * step
+    return grid.MakeMesh()
+
+def ThinWalls(columns = 30, rows = 20, thickness = 10.0):
+    # a frame with ribs one cell wide, so the shadow has lots of small rectangular inners
+    grid = Grid(columns, rows, 1.5, thickness)
+    for i in range(0, columns):
+        for j in range(0, rows):
+            if i % 5 != 0 and j % 5 != 0 and i != columns - 1 and j != rows - 1:
+                grid.heights[i][j] = 0.0
+    return grid.MakeMesh()
+
+def CurvedOutline(num_points = 2000, thickness = 6.0, radius = 40.0):
+    # a flower shape with lots of points on its outline, extruded upwards
+    mesh = Mesh()
+    pts = []
+    for k in range(0, num_points):
+        a = 2 * math.pi * k / num_points
+        r = radius + 6.0 * math.sin(a * 12)
+        pts.append((r * math.cos(a), r * math.sin(a)))
+    for k in range(0, num_points):
+        p = pts[k]
+        q = pts[(k + 1) % num_points]
+        mesh.Triangle([0.0, 0.0, thickness], [p[0], p[1], thickness], [q[0], q[1], thickness])
+        mesh.Triangle([0.0, 0.0, 0.0], [q[0], q[1], 0.0], [p[0], p[1], 0.0])
+        mesh.Quad([p[0], p[1], 0.0], [q[0], q[1], 0.0], [q[0], q[1], thickness], [p[0], p[1], thickness])
+    return mesh
+
+def Shaft(steps, length = 200.0, sides = 96):
+    # a turned part along the X axis, made of cylinders of the given radii, for the unwrap benchmark
+    mesh = Mesh()
+    ring = [(math.cos(2 * math.pi * k / sides), math.sin(2 * math.pi * k / sides)) for k in range(0, sides)]
+    step_length = length / len(steps)
+    radii = [0.0] + steps + [0.0]
+    for s in range(0, len(steps)):
+        x0 = s * step_length
+        x1 = x0 + step_length
+        r = steps[s]
+        for k in range(0, sides):
+            c0 = ring[k]
+            c1 = ring[(k + 1) % sides]
+            mesh.Quad([x0, r * c0[0], r * c0[1]], [x1, r * c0[0], r * c0[1]], [x1, r * c1[0], r * c1[1]], [x0, r * c1[0], r * c1[1]])
+    for s in range(0, len(steps) + 1):
+        # the ring between this step and the one before it, at x, facing -X if this step is bigger
+        x = s * step_length
+        r0 = radii[s]
+        r1 = radii[s + 1]
+        if r0 == r1:
+            continue
+        for k in range(0, sides):
+            c0 = ring[k]
+            c1 = ring[(k + 1) % sides]
+            if r1 > r0:
+                mesh.Quad([x, r0 * c0[0], r0 * c0[1]], [x, r0 * c1[0], r0 * c1[1]], [x, r1 * c1[0], r1 * c1[1]], [x, r1 * c0[0], r1 * c0[1]])
+            else:
+                mesh.Quad([x, r1 * c0[0], r1 * c0[1]], [x, r0 * c0[0], r0 * c0[1]], [x, r0 * c1[0], r0 * c1[1]], [x, r1 * c1[0], r1 * c1[1]])
+    return mesh
+
+# name to function making the mesh
+CORPUS = [
+    ('holes_16', lambda: HolePlate(16)),
+    ('holes_400', lambda: HolePlate(400)),
+    ('pockets_3', lambda: PocketLevels(3)),
+    ('pockets_8', lambda: PocketLevels(8)),
+    ('thin_walls', lambda: ThinWalls()),
+    ('curved_outline', lambda: CurvedOutline()),
+    ]
+
+# parts for the unwrap benchmark, which are unwrapped about the X axis, so they are moved to be around it
+UNWRAP_CORPUS = [
+    ('shaft', lambda: Shaft([20.0, 30.0, 25.0, 10.0])),
+    ('thin_shaft', lambda: Shaft([4.0, 6.0], 100.0, 32)),
+    ('pockets_3', lambda: Centred(PocketLevels(3))),
+    ]
+
+def Centred(mesh):
+    # returns the mesh moved so the middle of it in Y and Z is on the X axis
+    coords = mesh.coords
+    mid_y = (min(coords[1::3]) + max(coords[1::3])) * 0.5
+    mid_z = (min(coords[2::3]) + max(coords[2::3])) * 0.5
+    for i in range(0, len(coords), 3):
+        coords[i + 1] -= mid_y
+        coords[i + 2] -= mid_z
+    return mesh
+
+def WriteCorpus(folder, names = None, corpus = CORPUS):
+    # returns a list of ( name, stl path ), only writing the files which aren't there already
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    parts = []
+    for name, make_mesh in corpus:
+        if names != None and not name in names:
+            continue
+        path = os.path.join(folder, name + '.stl')
+        if not os.path.isfile(path):
+            StlData.WriteBinaryStl(path, make_mesh().coords)
+        parts.append((name, path))
+    return parts
+
+if __name__ == '__main__':
+    for name, path in WriteCorpus(sys.argv[1] if len(sys.argv) > 1 else os.path.join(this_dir, 'parts')):
+        print(path)
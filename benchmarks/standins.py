@@ -0,0 +1,346 @@
+# stand-ins for wx, cad, step and the PyCAM operation modules, so AutoProgram can run without a GUI or a cad document
+# only geom is real; every object added to the document is counted by type, which gives the operation counts
+# the changes made in each outermost history are kept as one undo step, and empty histories make no step,
+# so App.OnUndo undoes the last of them, for checking that a cancelled run is undone
+#
+# import standins
+# standins.Install() # before importing FourAxis
+# part = standins.AddStlSolid('part.stl')
+
+import sys
+import types
+import os
+import tempfile
+from array import array
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.realpath(this_dir + '/..'))
+
+import StlData
+
+OBJECT_TYPE_STL_SOLID = 1
+OBJECT_TYPE_SKETCH = 2
+OBJECT_TYPE_POINT = 3
+OBJECT_TYPE_OTHER = 4
+
+class Object:
+    next_id = 1
+
+    def __init__(self, type = OBJECT_TYPE_OTHER):
+        self.id = Object.next_id
+        Object.next_id += 1
+        self.type = type
+        self.visible = True
+        self.title = None
+        self.children = []
+
+    def GetID(self): return self.id
+    def GetIDGroupType(self): return self.type
+    def GetVisible(self): return self.visible
+    def SetVisible(self, visible): self.visible = visible
+    def SetTitle(self, title): self.title = title
+    def GetChildren(self): return list(self.children)
+    def GetNumChildren(self): return len(self.children)
+    def Add(self, child): self.children.append(child)
+    def Transform(self, mat): pass
+
+class Box:
+    def __init__(self, coords):
+        xs = coords[0::3]
+        ys = coords[1::3]
+        zs = coords[2::3]
+        self.box = (min(xs), min(ys), min(zs), max(xs), max(ys), max(zs))
+
+    def MinX(self): return self.box[0]
+    def MinY(self): return self.box[1]
+    def MinZ(self): return self.box[2]
+    def MaxX(self): return self.box[3]
+    def MaxY(self): return self.box[4]
+    def MaxZ(self): return self.box[5]
+    def Width(self): return self.box[3] - self.box[0]
+    def Height(self): return self.box[4] - self.box[1]
+    def Depth(self): return self.box[5] - self.box[2]
+
+class StlSolid(Object):
+    # keeps the triangles as coordinates, so it can be moved without cad
+    def __init__(self, path):
+        Object.__init__(self, OBJECT_TYPE_STL_SOLID)
+        f = open(path, 'rb')
+        self.coords = StlData.ReadTriangleCoords(f.read())
+        f.close()
+
+    def GetBox(self):
+        return Box(self.coords)
+
+    def Transform(self, mat):
+        # only translations are needed by AutoProgram.MovePart
+        import geom
+        shift = geom.Point3D(0, 0, 0).Transformed(mat)
+        offset = (shift.x, shift.y, shift.z)
+        for i in range(0, len(self.coords)):
+            self.coords[i] += offset[i % 3]
+
+    def GetTris(self, precision):
+        handle, path = tempfile.mkstemp(suffix = '.stl')
+        os.close(handle)
+        try:
+            StlData.WriteBinaryStl(path, self.coords)
+            return StlData.StlFromFile(path)
+        finally:
+            os.remove(path)
+
+class Document:
+    def __init__(self):
+        self.objects = []
+        self.counts = {} # type name to number of objects added
+        self.history_depth = 0
+        self.history = [] # functions undoing the changes of the outermost history, so far
+        self.undo_steps = [] # lists of those functions, for each finished history, last one last
+
+    def Count(self, object):
+        name = type(object).__name__
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def Changed(self, undo):
+        # keeps the function undoing a change
+        self.history.append(undo)
+        if self.history_depth == 0:
+            self.EndStep()
+
+    def EndStep(self):
+        if len(self.history) > 0:
+            self.undo_steps.append(self.history)
+        self.history = []
+
+    def Undo(self):
+        if len(self.undo_steps) > 0:
+            for undo in reversed(self.undo_steps.pop()):
+                undo()
+
+    def GetOwnerList(self, object):
+        # returns the list the object is in, or None
+        lists = [self.objects] + [owner.children for owner in self.objects] + [owner.children for owner in app.program.GetContainers()]
+        for objects in lists:
+            if object in objects:
+                return objects
+        return None
+
+document = Document()
+
+def MakeCadModule():
+    cad = types.ModuleType('cad')
+    cad.OBJECT_TYPE_STL_SOLID = OBJECT_TYPE_STL_SOLID
+    cad.Object = Object
+
+    class Color:
+        def __init__(self, *args):
+            self.args = args
+    cad.Color = Color
+
+    class Sketch(Object):
+        def __init__(self, geometry):
+            Object.__init__(self, OBJECT_TYPE_SKETCH)
+            self.geometry = geometry
+
+    class Point(Object):
+        def __init__(self, p):
+            Object.__init__(self, OBJECT_TYPE_POINT)
+            self.p = p
+    cad.Sketch = Sketch
+    cad.Point = Point
+
+    def AddUndoably(object, owner = None):
+        objects = document.objects if owner == None else owner.children
+        objects.append(object)
+        document.Count(object)
+        document.Changed(lambda: objects.remove(object))
+
+    def DeleteUndoably(object):
+        objects = document.GetOwnerList(object)
+        if objects != None:
+            index = objects.index(object)
+            objects.remove(object)
+            document.Changed(lambda: objects.insert(index, object))
+
+    def StartHistory(title = None):
+        document.history_depth += 1
+
+    def EndHistory():
+        document.history_depth -= 1
+        if document.history_depth == 0:
+            document.EndStep()
+
+    def TransformUndoably(object, mat):
+        if isinstance(object, StlSolid):
+            coords = array('d', object.coords)
+            def Undo():
+                object.coords = coords
+            document.Changed(Undo)
+        object.Transform(mat)
+
+    cad.AddUndoably = AddUndoably
+    cad.DeleteUndoably = DeleteUndoably
+    cad.StartHistory = StartHistory
+    cad.EndHistory = EndHistory
+    cad.TransformUndoably = TransformUndoably
+    cad.GetObjects = lambda: list(document.objects)
+    cad.PyIncref = lambda object: None
+    cad.NewSketchFromArea = lambda area: Sketch(area)
+    cad.NewSketchFromCurve = lambda curve: Sketch(curve)
+    cad.NewPoint = lambda p: Point(p)
+    return cad
+
+def MakeOperationModule(name, class_names, constants = {}):
+    # a module of classes which just hold the attributes AutoProgram sets on them
+    module = types.ModuleType(name)
+    for class_name in class_names:
+        setattr(module, class_name, type(class_name, (Object,), {}))
+    for constant in constants:
+        setattr(module, constant, constants[constant])
+    return module
+
+class Profile(Object):
+    def __init__(self, sketch = 0):
+        Object.__init__(self)
+        self.sketch = sketch
+        self.tags = None
+
+class Pocket(Object):
+    def __init__(self, sketch = 0):
+        Object.__init__(self)
+        self.sketch = sketch
+
+class Drilling(Object):
+    def __init__(self):
+        Object.__init__(self)
+        self.points = []
+
+class Stock(Object):
+    def __init__(self):
+        Object.__init__(self)
+        self.solids = []
+
+class Tool(Object):
+    def __init__(self, diameter = 3.0, title = None, tool_number = 0, type = 0):
+        Object.__init__(self)
+        self.diameter = diameter
+        self.title = title
+        self.tool_number = tool_number
+        self.type = type
+
+class Cuboid(Object):
+    def __init__(self):
+        Object.__init__(self)
+        self.width = 0.0
+        self.height = 0.0
+        self.depth = 0.0
+
+class Program(Object):
+    def __init__(self):
+        Object.__init__(self)
+        self.tools = Object()
+        self.patterns = Object()
+        self.surfaces = Object()
+        self.stocks = Object()
+        self.operations = Object()
+        self.nccode = Object()
+
+    def GetContainers(self):
+        return [self.tools, self.patterns, self.surfaces, self.stocks, self.operations]
+
+    def MakeGCode(self):
+        pass
+
+    def BackPlot(self):
+        pass
+
+class App:
+    def __init__(self):
+        self.program = Program()
+
+    def CopyUndoably(self, object, copy_object):
+        pass
+
+    def OnUndo(self, e):
+        document.Undo()
+
+class Config:
+    # every setting has its default value
+    def __init__(self, *args): pass
+    def Read(self, name, default = ''): return default
+    def ReadBool(self, name, default = False): return default
+    def ReadFloat(self, name, default = 0.0): return default
+    def ReadInt(self, name, default = 0): return default
+    def Write(self, name, value): pass
+    def WriteBool(self, name, value): pass
+    def WriteFloat(self, name, value): pass
+    def WriteInt(self, name, value): pass
+
+app = App()
+
+def MakeWxModule():
+    wx = types.ModuleType('wx')
+    wx.GetApp = lambda: app
+    wx.MessageBox = lambda message, caption = '', style = 0: print(caption + ' ' + message)
+    wx.YES = 2
+    wx.NO = 8
+    wx.YES_NO = wx.YES | wx.NO
+    wx.PD_APP_MODAL = 1
+    wx.PD_AUTO_HIDE = 2
+    wx.PD_CAN_ABORT = 4
+    return wx
+
+# the modules FourAxis only imports when Auto Program uses them
+OPERATION_MODULES = ['AutoProgramDlg', 'Program', 'NcCode', 'Stock', 'Profile', 'Pocket', 'Drilling', 'ScriptOp', 'Tag', 'Tags', 'Tool']
+
+def Install(operations = True):
+    # puts the stand-in modules in sys.modules, so they are found instead of the real ones
+    # without operations, the modules in OPERATION_MODULES are left out
+    step = MakeOperationModule('step', [])
+    step.NewCuboid = Cuboid
+    auto_program_dlg = MakeOperationModule('AutoProgramDlg', [])
+    auto_program_dlg.Do = lambda auto_program: True
+    modules = [
+        MakeWxModule(),
+        MakeCadModule(),
+        step,
+        MakeOperationModule('ScriptOp', []),
+        MakeOperationModule('Tag', ['Tag']),
+        MakeOperationModule('Tags', ['Tags']),
+        MakeOperationModule('NcCode', ['NcCode']),
+        auto_program_dlg,
+        MakeOperationModule('Profile', [], {
+            'PROFILE_RIGHT_OR_INSIDE':-1, 'PROFILE_ON':0, 'PROFILE_LEFT_OR_OUTSIDE':1,
+            'PROFILE_CONVENTIONAL':0, 'PROFILE_CLIMB':1, 'Profile':Profile}),
+        MakeOperationModule('Pocket', [], {'Pocket':Pocket}),
+        MakeOperationModule('Drilling', [], {'Drilling':Drilling}),
+        MakeOperationModule('Stock', [], {'Stock':Stock}),
+        MakeOperationModule('Tool', [], {'Tool':Tool}),
+        MakeOperationModule('Program', [], {'Program':Program}),
+        MakeOperationModule('HeeksConfig', [], {'HeeksConfig':Config}),
+        MakeOperationModule('consts', [], {
+            'TOOL_TYPE_UNDEFINED':-1, 'TOOL_TYPE_DRILL':0, 'TOOL_TYPE_CENTREDRILL':1, 'TOOL_TYPE_SLOTCUTTER':2,
+            'TOOL_TYPE_ENDMILL':3, 'TOOL_TYPE_BALLENDMILL':4, 'TOOL_TYPE_CHAMFER':5}),
+        ]
+    for module in modules:
+        if operations or not module.__name__ in OPERATION_MODULES:
+            sys.modules[module.__name__] = module
+
+def NewDocument():
+    # clears the document and program, ready for the next part
+    global document
+    document = Document()
+    app.program = Program()
+    return document
+
+def GetDocumentState():
+    # returns the objects in the document and the program, and the part's triangles, for comparing before and after a run
+    def GetIds(objects):
+        return [(object.GetID(), GetIds(object.children)) for object in objects]
+    solids = [object.coords.tobytes() for object in document.objects if isinstance(object, StlSolid)]
+    return GetIds(document.objects), [GetIds(objects.children) for objects in app.program.GetContainers()], solids
+
+def AddStlSolid(path):
+    solid = StlSolid(path)
+    document.objects.append(solid)
+    return solid
@@ -0,0 +1,94 @@
+# benchmark of the splitting done before Unwrap Solid, comparing the uniform split with the adaptive one
+# for each part it splits uniformly to Unwrap.SPLIT_LENGTH, finds the worst unwrap error of the result, then splits adaptively
+# with that as the tolerance, so both have the same accuracy, and again with Unwrap.UNWRAP_TOLERANCE
+# the error is the distance of points on the split triangles from where the unwrapping puts them, see Unwrap.GetUnwrapErrors
+# the triangle counts and split times are printed, and the unwrap times too if geom can be imported, from ../../PyCAD
+#
+# usage: python unwrap.py [--no-unwrap] [--output file] [part names]
+
+import os
+import sys
+import json
+import time
+import argparse
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.realpath(this_dir + '/..'))
+sys.path.append(os.path.realpath(this_dir + '/../../PyCAD'))
+
+import Unwrap
+import parts
+
+DEFAULT_OUTPUT = os.path.join(this_dir, 'unwrap_results.json')
+ERROR_SAMPLES = 8 # more points than the splitting measures the error at
+
+def TimeUnwrap(path):
+    # returns the seconds taken by geom to unwrap the stl file, or None if geom isn't available
+    try:
+        import geom
+    except ImportError:
+        return None
+    stl = geom.Stl(path)
+    start = time.time()
+    stl.Unwrap(Unwrap.UNWRAP_VALUE)
+    return time.time() - start
+
+def RunSplit(tris, get_counts, want_unwrap):
+    # returns a result dictionary for splitting tris, with the counts which get_counts returns for them
+    path = Unwrap.NewStlPath()
+    try:
+        start = time.time()
+        counts = get_counts(tris)
+        new_tris = Unwrap.SplitTriangles(tris, counts, path)
+        split_time = time.time() - start
+        error = float(Unwrap.GetUnwrapErrors(new_tris, ERROR_SAMPLES).max()) if len(new_tris) > 0 else 0.0
+        del new_tris
+        return {
+            'triangles':int((counts * counts).sum()),
+            'split_time':split_time,
+            'max_error':error,
+            'unwrap_time':TimeUnwrap(path) if want_unwrap else None,
+            }
+    finally:
+        os.remove(path)
+
+def RunPart(path, want_unwrap):
+    f = open(path, 'rb')
+    tris = Unwrap.TrianglesFromBytes(f.read())
+    f.close()
+    uniform = RunSplit(tris, lambda tris: Unwrap.GetSplitCounts(tris, Unwrap.SPLIT_LENGTH), want_unwrap)
+    same_accuracy = RunSplit(tris, lambda tris: Unwrap.GetAdaptiveSplitCounts(tris, uniform['max_error'])[0], want_unwrap)
+    default_tolerance = RunSplit(tris, lambda tris: Unwrap.GetAdaptiveSplitCounts(tris, Unwrap.UNWRAP_TOLERANCE)[0], want_unwrap)
+    return {'triangles':len(tris), 'uniform':uniform, 'adaptive_same_accuracy':same_accuracy, 'adaptive_default_tolerance':default_tolerance}
+
+def FormatSeconds(seconds):
+    return '      -' if seconds == None else '%7.3f' % seconds
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Compare uniform and adaptive splitting for Unwrap Solid')
+    parser.add_argument('names', nargs = '*', help = 'parts to run, default all of them')
+    parser.add_argument('--no-unwrap', action = 'store_true', help = "don't time the unwrapping, even if geom is available")
+    parser.add_argument('--output', default = DEFAULT_OUTPUT, help = 'json file to write the results to')
+    args = parser.parse_args()
+
+    if Unwrap.numpy == None:
+        print('numpy is needed for the splitting')
+        return 1
+
+    results = {}
+    print('%-12s %-28s %10s %9s %10s %8s' % ('part', 'split', 'triangles', 'split s', 'max error', 'unwrap s'))
+    for name, path in parts.WriteCorpus(os.path.join(this_dir, 'parts', 'unwrap'), args.names if len(args.names) > 0 else None, parts.UNWRAP_CORPUS):
+        result = RunPart(path, not args.no_unwrap)
+        results[name] = result
+        for split in ['uniform', 'adaptive_same_accuracy', 'adaptive_default_tolerance']:
+            r = result[split]
+            print('%-12s %-28s %10i %s %10.6f  %s' % (name, split, r['triangles'], FormatSeconds(r['split_time']), r['max_error'], FormatSeconds(r['unwrap_time'])))
+        print('%-12s %i times fewer triangles for the same accuracy' % (name, result['uniform']['triangles'] // max(result['adaptive_same_accuracy']['triangles'], 1)))
+
+    f = open(args.output, 'w')
+    json.dump(results, f, indent = 1, sort_keys = True)
+    f.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())